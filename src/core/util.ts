@@ -8,3 +8,33 @@ export function checkForLatLngMistakes (value: NullOrUndefinedOr<number>): numbe
 
 	return value as number;
 }
+
+// Decode a route in Google's encoded polyline format into latitude/longitude pairs.
+// https://developers.google.com/maps/documentation/utilities/polylinealgorithm
+export function decodePolyline (encoded: string, precision: number = 5): Array<[number, number]> {
+	const factor = Math.pow(10, precision);
+	const coords: Array<[number, number]> = [];
+	const values: [number, number] = [0, 0];
+
+	let index = 0;
+	while (index < encoded.length) {
+		for (let i = 0; i < 2; i++) {
+			let shift = 0;
+			let result = 0;
+			let byte: number;
+
+			do {
+				byte = encoded.charCodeAt(index++) - 63;
+				// Multiply rather than shift, as values can exceed 32 bits.
+				result += (byte & 0x1f) * Math.pow(2, shift);
+				shift += 5;
+			} while (byte >= 0x20);
+
+			values[i] += (result % 2 === 1) ? -(result + 1) / 2 : result / 2;
+		}
+
+		coords.push([values[0] / factor, values[1] / factor]);
+	}
+
+	return coords;
+}
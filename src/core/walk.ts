@@ -2,7 +2,7 @@ import * as L from 'leaflet';
 import { LeafletEvent } from 'leaflet';
 import { NullOrUndefinedOr } from './types';
 import { WalkForm } from './walk_form';
-import { checkForLatLngMistakes } from './util';
+import { checkForLatLngMistakes, decodePolyline } from './util';
 
 declare let map_canal_towpath_walking: L.Map; // eslint-disable-line camelcase
 declare let geo_json_watercourses: L.GeoJSON; // eslint-disable-line camelcase
@@ -10,6 +10,12 @@ declare let feature_group_current_walk: L.FeatureGroup; // eslint-disable-line c
 declare let feature_group_walk_markers: L.FeatureGroup; // eslint-disable-line camelcase
 declare let feature_group_walks: L.FeatureGroup; // eslint-disable-line camelcase
 
+interface RouteError {
+	message: string;
+	// Indices of the start and end points of each leg which cannot be routed.
+	legs: Array<[number, number]>;
+}
+
 // eslint-disable-next-line @typescript-eslint/no-unused-vars
 export class LeafletWalkPreview {
 	placedMarkerCount: number;
@@ -52,10 +58,17 @@ export class LeafletWalkPreview {
 			fetch('/get-route/', {
 				signal: this.abortController.signal,
 				method: 'POST',
-				headers: { 'Content-Type': 'application/json' },
+				headers: { 'Content-Type': 'application/json', Accept: 'application/vnd.google.polyline' },
 				body: JSON.stringify(placedMarkerLatLng)
 			})
-				.then(res => res.json())
+				.then(async res => {
+					if (!res.ok) {
+						// e.g. 422 when points are on parts of the network which aren't connected
+						const error: RouteError = await res.json();
+						throw new Error(error.message);
+					}
+					return decodePolyline(await res.text()).map(([lat, lng]) => L.latLng(lat, lng));
+				})
 				.then((coords: Array<L.LatLng>) => {
 					currentWalkLayer.clearLayers();
 					this.polyLineWalk = drawWalk(coords, currentWalkLayer, '#ff0000', false);
@@ -118,6 +131,10 @@ export class LeafletWalkPreview {
 		// @ts-expect-error  // Doesn't think `feature` exists, but it does for layers of GeoJSON
 		// See https://github.com/DefinitelyTyped/DefinitelyTyped/issues/44293
 		const coordinatesArray = watercourses.getLayers().map(l => l.feature.geometry.coordinates);
+		if (coordinatesArray.length === 0) {
+			// The watercourses are drawn from vector tiles; the server snaps the point when routing instead.
+			return L.latLng(lat, lng);
+		}
 		const closestLatLng = L.GeometryUtil.closest(map_canal_towpath_walking, coordinatesArray, [lng, lat])!;
 		return L.latLng(closestLatLng.lng, closestLatLng.lat);
 	}
@@ -23,8 +23,103 @@ export function watercoursesZoomOnClick (feature: null, layer: L.Layer) {
 	});
 }
 
-export function addWatercoursesGeoJson (data: geojson.GeoJsonObject) {
+// A quantized TopoJSON topology, as served by /watercourses.topojson
+// https://github.com/topojson/topojson-specification
+export interface Topology {
+	type: 'Topology';
+	transform: { scale: [number, number], translate: [number, number] };
+	objects: { [name: string]: TopologyGeometry };
+	arcs: Array<Array<[number, number]>>;
+}
+
+interface TopologyGeometry {
+	type: geojson.GeoJsonGeometryTypes | null;
+	id?: number | string;
+	properties?: geojson.GeoJsonProperties;
+	arcs?: any; // eslint-disable-line @typescript-eslint/no-explicit-any
+	coordinates?: any; // eslint-disable-line @typescript-eslint/no-explicit-any
+	geometries?: TopologyGeometry[];
+}
+
+// Convert a quantized TopoJSON topology into a GeoJSON FeatureCollection of the geometries in each of its objects.
+export function topologyToGeoJSON (topology: Topology): geojson.FeatureCollection {
+	const [scaleX, scaleY] = topology.transform.scale;
+	const [translateX, translateY] = topology.transform.translate;
+
+	const transformPosition = (position: [number, number]): geojson.Position => [
+		position[0] * scaleX + translateX,
+		position[1] * scaleY + translateY
+	];
+
+	// Undo the delta encoding of each arc, then the quantization.
+	const arcs: geojson.Position[][] = topology.arcs.map((arc) => {
+		let x = 0;
+		let y = 0;
+		return arc.map((delta) => {
+			x += delta[0];
+			y += delta[1];
+			return transformPosition([x, y]);
+		});
+	});
+
+	// Join arcs into a line, dropping the position each arc shares with the previous one.
+	// Negative indices (the one's complement) refer to an arc in reverse.
+	const stitch = (indices: number[]): geojson.Position[] => {
+		const line: geojson.Position[] = [];
+		indices.forEach((index, i) => {
+			const arc = index < 0 ? arcs[~index].slice().reverse() : arcs[index];
+			line.push(...(i === 0 ? arc : arc.slice(1)));
+		});
+		return line;
+	};
+
+	const toGeometry = (geometry: TopologyGeometry): geojson.Geometry | null => {
+		switch (geometry.type) {
+		case 'Point':
+			return { type: 'Point', coordinates: transformPosition(geometry.coordinates) };
+		case 'MultiPoint':
+			return { type: 'MultiPoint', coordinates: geometry.coordinates.map(transformPosition) };
+		case 'LineString':
+			return { type: 'LineString', coordinates: stitch(geometry.arcs) };
+		case 'MultiLineString':
+			return { type: 'MultiLineString', coordinates: geometry.arcs.map(stitch) };
+		case 'Polygon':
+			return { type: 'Polygon', coordinates: geometry.arcs.map(stitch) };
+		case 'MultiPolygon':
+			return { type: 'MultiPolygon', coordinates: geometry.arcs.map((polygon: number[][]) => polygon.map(stitch)) };
+		default:
+			return null;
+		}
+	};
+
+	const features: geojson.Feature[] = [];
+	const addFeatures = (geometry: TopologyGeometry) => {
+		if (geometry.type === 'GeometryCollection') {
+			(geometry.geometries ?? []).forEach(addFeatures);
+			return;
+		}
+
+		const feature: geojson.Feature = {
+			type: 'Feature',
+			geometry: toGeometry(geometry) as geojson.Geometry,
+			properties: geometry.properties ?? {}
+		};
+		if (geometry.id !== undefined) {
+			feature.id = geometry.id;
+		}
+		features.push(feature);
+	};
+	Object.values(topology.objects).forEach(addFeatures);
+
+	return { type: 'FeatureCollection', features };
+}
+
+export function addWatercoursesGeoJson (data: geojson.GeoJsonObject | Topology) {
+	if (data.type === 'Topology') {
+		data = topologyToGeoJSON(data as Topology);
+	}
+
 	map_canal_towpath_walking.removeLayer(geo_json_watercourses); // eslint-disable-line camelcase
-	geo_json_watercourses.addData(data); // eslint-disable-line camelcase
+	geo_json_watercourses.addData(data as geojson.GeoJsonObject); // eslint-disable-line camelcase
 	map_canal_towpath_walking.addLayer(geo_json_watercourses); // eslint-disable-line camelcase
 }
@@ -0,0 +1,48 @@
+# 3rd party
+import networkx
+import numpy
+import pytest
+
+# this package
+from towpath_walk_tracker.hierarchy import build_hierarchy
+from towpath_walk_tracker.network import RoutingGraph, contract_chains
+
+
+def _grid_network(size: int, seed: int) -> RoutingGraph:
+	# A jittered grid with some of its edges removed, giving junctions, chains, dead ends and separate components.
+
+	rng = numpy.random.default_rng(seed)
+
+	node_ids = numpy.arange(1, size * size + 1)
+	rows, columns = divmod(node_ids - 1, size)
+	coordinates = numpy.column_stack([52 + rows * 0.001, -1 + columns * 0.0015])
+	coordinates += rng.normal(0, 0.0002, coordinates.shape)
+
+	edges = numpy.array(
+			[(node, node + 1) for node in node_ids if node % size]
+			+ [(node, node + size) for node in node_ids if node <= size * (size - 1)]
+			)
+	return RoutingGraph.from_edges(node_ids, coordinates, edges[rng.random(len(edges)) < 0.7])
+
+
+@pytest.mark.parametrize("max_settled", [1, 500])
+@pytest.mark.parametrize("seed", [1, 2, 3])
+def test_hierarchy_matches_dijkstra(seed: int, max_settled: int):
+	graph = _grid_network(15, seed)
+	hierarchy = build_hierarchy(contract_chains(graph), max_settled=max_settled)
+	reference = graph.to_networkx()
+
+	rng = numpy.random.default_rng(seed)
+	for source, target in graph.node_ids[rng.integers(len(graph), size=(100, 2))].tolist():
+		if not networkx.has_path(reference, source, target):
+			with pytest.raises(ValueError, match="No path between"):
+				hierarchy.shortest_path(source, target)
+			continue
+
+		path = hierarchy.shortest_path(source, target)
+		assert path[0] == source
+		assert path[-1] == target
+		assert networkx.is_path(reference, path)
+		assert networkx.path_weight(reference, path, "weight") == pytest.approx(
+				networkx.dijkstra_path_length(reference, source, target, weight="weight"),
+				)
@@ -0,0 +1,181 @@
+# stdlib
+from collections.abc import Iterator
+from typing import Union
+
+# 3rd party
+import numpy
+import pytest
+
+# this package
+from towpath_walk_tracker import route as route_module
+from towpath_walk_tracker.hierarchy import ContractionHierarchy, build_hierarchy
+from towpath_walk_tracker.network import ContractedGraph, EdgePoint, RoutingGraph, contract_chains
+from towpath_walk_tracker.route import DisconnectedPointsError, Route, RoutingIndex, leg_cache
+from towpath_walk_tracker.snapping import SegmentIndex
+
+# Two junctions (1 and 4) joined directly by a two-node way, each with two branches leading to dead ends:
+#
+#   7 - 2 \          / 5 - 9
+#          1 ------ 4
+#   8 - 3 /          \ 6 - 10
+NODES = {
+		1: (52.000, -1.000),
+		2: (52.001, -1.002),
+		3: (51.999, -1.002),
+		4: (52.000, -0.990),
+		5: (52.001, -0.988),
+		6: (51.999, -0.988),
+		7: (52.002, -1.004),
+		8: (51.998, -1.004),
+		9: (52.002, -0.986),
+		10: (51.998, -0.986),
+		}
+EDGES = [(1, 2), (1, 3), (1, 4), (4, 5), (4, 6), (2, 7), (3, 8), (5, 9), (6, 10)]
+
+# A separate stretch of canal to the north, not connected to the rest.
+ISLAND_NODES = {11: (52.010, -0.995), 12: (52.011, -0.993), 13: (52.012, -0.991)}
+ISLAND_EDGES = [(11, 12), (12, 13)]
+
+
+def _build_network(nodes: dict[int, tuple[float, float]], edges: list[tuple[int, int]]) -> ContractedGraph:
+	graph = RoutingGraph.from_edges(
+			numpy.array(list(nodes)),
+			numpy.array(list(nodes.values())),
+			numpy.array(edges),
+			)
+	return contract_chains(graph)
+
+
+@pytest.fixture()
+def network() -> ContractedGraph:
+	return _build_network(NODES, EDGES)
+
+
+@pytest.fixture(params=["contracted", "hierarchy"])
+def routing_index(request: pytest.FixtureRequest, monkeypatch: pytest.MonkeyPatch) -> Iterator[RoutingIndex]:
+	# Routing index over the network and the island, used by Route.from_points in place of the real data.
+
+	network = _build_network({**NODES, **ISLAND_NODES}, EDGES + ISLAND_EDGES)
+	graph = network.graph
+	router: Union[ContractedGraph, ContractionHierarchy] = network
+	if request.param == "hierarchy":
+		router = build_hierarchy(network)
+
+	index = RoutingIndex(
+			router=router,
+			node_ids=graph.node_ids,
+			coordinates=graph.coordinates,
+			components=graph.components,
+			segments=SegmentIndex.from_network(network),
+			version=f"test-{request.param}",
+			)
+	monkeypatch.setattr(route_module, "get_routing_index", lambda: index)
+
+	yield index
+	leg_cache.clear()
+
+
+def _snap_between_junctions(network: ContractedGraph, fraction: float) -> EdgePoint:
+	# Snap a point a little to the north of the way between the two junctions.
+	lat = 52.0001
+	lng = -1.000 + 0.010 * fraction
+	(point, ) = SegmentIndex.from_network(network).snap(numpy.array([[lat, lng]]))
+	assert isinstance(point, EdgePoint)
+	assert {point.start, point.end} == {network.graph.index_of(1), network.graph.index_of(4)}
+	return point
+
+
+@pytest.mark.parametrize("engine", ["contracted", "hierarchy"])
+def test_route_through_edge_between_core_nodes(network: ContractedGraph, engine: str):
+	graph = network.graph
+	router = network if engine == "contracted" else build_hierarchy(network)
+	point = _snap_between_junctions(network, 0.25)
+
+	def route(source, target) -> list[int]:
+		return graph.node_ids[router.shortest_path_indices(source, target)].tolist()
+
+	assert route(point, graph.index_of(9)) == [4, 5, 9]
+	assert route(graph.index_of(7), point) == [7, 2, 1]
+	assert route(graph.index_of(8), graph.index_of(10)) == [8, 3, 1, 4, 6, 10]
+
+	# Points along the same edge need no nodes between them.
+	assert route(point, _snap_between_junctions(network, 0.75)) == []
+
+	# Routing via the point gives the same path as routing between the junctions it lies between.
+	assert route(graph.index_of(7), point) + route(point, graph.index_of(9)) == route(
+			graph.index_of(7),
+			graph.index_of(9),
+			)
+
+
+@pytest.mark.parametrize("engine", ["contracted", "hierarchy"])
+def test_snap_onto_chain(network: ContractedGraph, engine: str):
+	graph = network.graph
+	router = network if engine == "contracted" else build_hierarchy(network)
+	segments = SegmentIndex.from_network(network)
+
+	# Node 2 lies within the chain 1 - 2 - 7, so is not a node of the contracted graph.
+	(point, ) = segments.snap(numpy.array([[52.0016, -1.0029]]))
+	assert isinstance(point, EdgePoint)
+	assert {point.start, point.end} == {graph.index_of(2), graph.index_of(7)}
+	assert 0 < point.fraction < 1
+
+	def route(source, target) -> list[int]:
+		return graph.node_ids[router.shortest_path_indices(source, target)].tolist()
+
+	assert route(point, graph.index_of(9)) == [2, 1, 4, 5, 9]
+	assert route(graph.index_of(9), point) == [9, 5, 4, 1, 2]
+	assert route(graph.index_of(7), point) == [7]
+	assert route(point, graph.index_of(8)) == [2, 1, 3, 8]
+
+	# Points on nodes snap to the node itself.
+	assert segments.snap(numpy.array([[52.001, -1.002]])) == [graph.index_of(2)]
+
+
+def test_disconnected_points(routing_index: RoutingIndex):
+	points = [(52.0001, -0.995), (52.011, -0.993)]
+
+	with pytest.raises(DisconnectedPointsError, match="No route between points 0 and 1") as exc_info:
+		routing_index.snap(points)
+	assert exc_info.value.legs == [(0, 1)]
+
+	# The 422 response from /get-route/ is raised by Route.from_points.
+	with pytest.raises(DisconnectedPointsError):
+		Route.from_points(points)
+
+	# The router rejects legs between components too.
+	graph = routing_index.router.graph
+	with pytest.raises(ValueError, match="No path between"):
+		routing_index.router.shortest_path_indices(graph.index_of(1), graph.index_of(13))
+
+	# Snapping within the first point's component instead.
+	snapped = routing_index.snap(points, snap_to_component=True)
+	nodes = [point.start if isinstance(point, EdgePoint) else point for point in snapped]
+	assert routing_index.components[nodes].tolist() == [0, 0]
+	assert Route.from_points(points, snap_to_component=True).nodes == [1, 4, 5, 9]
+
+	# Points on the island route as normal.
+	assert Route.from_points([(52.010, -0.995), (52.012, -0.991)]).nodes == [11, 12, 13]
+
+
+def test_single_point_walk(routing_index: RoutingIndex):
+	route = Route.from_points([(52.0016, -1.0029)])
+	assert len(route) == 0
+	assert route.nodes == []
+	assert route.length == 0
+
+	# The same point twice gives the segment it lies along.
+	assert Route.from_points([(52.0016, -1.0029)] * 2).nodes == [2, 7]
+
+
+def test_route_between_points_along_segments(routing_index: RoutingIndex):
+	# The route extends to the nodes beyond the first and last points.
+	assert Route.from_points([(52.0016, -1.0029), (52.0019, -0.9870)]).nodes == [7, 2, 1, 4, 5, 9]
+	assert Route.from_points([(52.0019, -0.9870), (52.0016, -1.0029)]).nodes == [9, 5, 4, 1, 2, 7]
+
+	# Through an intermediate point part way along the edge between the junctions.
+	points = [(52.0016, -1.0029), (52.0001, -0.995), (51.9981, -0.9865)]
+	assert Route.from_points(points).nodes == [7, 2, 1, 4, 6, 10]
+
+	# Starting from a node, the route starts there.
+	assert Route.from_points([(52.002, -1.004), (52.0019, -0.9870)]).nodes == [7, 2, 1, 4, 5, 9]
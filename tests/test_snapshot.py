@@ -0,0 +1,111 @@
+# stdlib
+from pathlib import Path
+from typing import Any
+
+# 3rd party
+import numpy
+import pytest
+
+# this package
+from towpath_walk_tracker import network as network_module
+from towpath_walk_tracker.network import (
+		ContractedGraph,
+		RoutingGraph,
+		build_network,
+		contract_chains,
+		load_network,
+		load_snapshot,
+		save_snapshot
+		)
+from towpath_walk_tracker.util import _get_source_hash
+from towpath_walk_tracker.watercourses import write_feature_collection
+
+# Two ways meeting at node 2, with a branch from node 3 to node 5.
+WAYS = {
+		101: [(1, (-1.000, 52.000)), (2, (-0.998, 52.001)), (3, (-0.996, 52.001))],
+		102: [(3, (-0.996, 52.001)), (4, (-0.994, 52.002))],
+		103: [(3, (-0.996, 52.001)), (5, (-0.995, 51.999)), (6, (-0.993, 51.998))],
+		}
+
+
+def _feature(way_id: int, points: list[tuple[int, tuple[float, float]]]) -> dict[str, Any]:
+	return {
+			"type": "Feature",
+			"geometry": {"type": "LineString", "coordinates": [list(coord) for _, coord in points]},
+			"properties": {"id": way_id, "nodes": [node for node, _ in points], "tags": {}},
+			}
+
+
+def _assert_networks_equal(loaded: ContractedGraph, network: ContractedGraph) -> None:
+	for name in RoutingGraph._arrays:
+		numpy.testing.assert_array_equal(getattr(loaded.graph, name), getattr(network.graph, name))
+	for name in ContractedGraph._arrays:
+		numpy.testing.assert_array_equal(getattr(loaded, name), getattr(network, name))
+
+
+@pytest.fixture()
+def data_dir(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> Path:
+	# The snapshot is built from data.filtered.geojson in the current directory.
+	features = [_feature(way_id, points) for way_id, points in WAYS.items()]
+	write_feature_collection(features, tmp_path / "data.filtered.geojson")
+	monkeypatch.chdir(tmp_path)
+	return tmp_path
+
+
+def test_load_snapshot(tmp_path: Path):
+	network = contract_chains(build_network(_feature(way_id, points) for way_id, points in WAYS.items()))
+	save_snapshot(network, tmp_path / "snapshot", "abc123")
+
+	loaded = load_snapshot(tmp_path / "snapshot", "abc123")
+	assert loaded is not None
+	_assert_networks_equal(loaded, network)
+
+	# The arrays are memory-mapped rather than read into memory.
+	assert isinstance(loaded.graph.coordinates.base, numpy.memmap)
+
+	# Without a hash the snapshot is loaded regardless of the data it was built from.
+	assert load_snapshot(tmp_path / "snapshot") is not None
+
+	# Stale, missing, and outdated snapshots aren't loaded.
+	assert load_snapshot(tmp_path / "snapshot", "def456") is None
+	assert load_snapshot(tmp_path / "missing", "abc123") is None
+
+	meta = tmp_path / "snapshot" / "meta.json"
+	meta.write_text('{"version": -1, "source_hash": "abc123"}')
+	assert load_snapshot(tmp_path / "snapshot", "abc123") is None
+
+
+def test_rebuild_stale_snapshot(data_dir: Path, monkeypatch: pytest.MonkeyPatch):
+	builds = []
+	build = network_module.build_network
+
+	def build_network_counted(watercourses: Any) -> RoutingGraph:
+		builds.append(1)
+		return build(watercourses)
+
+	monkeypatch.setattr(network_module, "build_network", build_network_counted)
+
+	network = load_network("snapshot")
+	assert len(builds) == 1
+	assert sorted(network.graph.node_ids.tolist()) == [1, 2, 3, 4, 5, 6]
+
+	# Up to date, so loaded from the snapshot.
+	_assert_networks_equal(load_network("snapshot"), network)
+	assert len(builds) == 1
+
+	# Adding a way changes the hash of the source data, so the snapshot is rebuilt.
+	old_hash = _get_source_hash()
+	ways = {**WAYS, 104: [(4, (-0.994, 52.002)), (7, (-0.990, 52.003))]}
+	features = [_feature(way_id, points) for way_id, points in ways.items()]
+	write_feature_collection(features, data_dir / "data.filtered.geojson")
+	assert _get_source_hash() != old_hash
+	assert load_snapshot("snapshot", _get_source_hash()) is None
+
+	network = load_network("snapshot")
+	assert len(builds) == 2
+	assert sorted(network.graph.node_ids.tolist()) == [1, 2, 3, 4, 5, 6, 7]
+
+	rebuilt = load_snapshot("snapshot", _get_source_hash())
+	assert rebuilt is not None
+	_assert_networks_equal(rebuilt, network)
+	assert not list(data_dir.glob("snapshot.*"))
@@ -0,0 +1,82 @@
+# stdlib
+import logging
+import time
+from pathlib import Path
+
+# 3rd party
+import pytest
+
+# this package
+from towpath_walk_tracker.route import Route
+from towpath_walk_tracker.thumbnail import ThumbnailQueue, ThumbnailStore
+
+
+def test_store_overwrite_size(tmp_path: Path):
+	store = ThumbnailStore(tmp_path, max_size=250)
+	store.put("aa01", b'\x00' * 100)
+
+	for _ in range(3):
+		store.put("aa01", b'\x01' * 100)
+
+	assert store._size == 100
+	assert store._size == store._scan()[1]
+
+	# Replacing with a different size.
+	store.put("aa01", b'\x02' * 40)
+	assert store._size == 40
+
+	# Overwriting doesn't use up the budget, so nothing is evicted early.
+	store.put("bb02", b'\x03' * 100)
+	assert store.get("aa01") == b'\x02' * 40
+	assert store.get("bb02") == b'\x03' * 100
+	assert store._size == 140
+
+
+def test_queue_failed_render_not_requeued(tmp_path: Path, caplog: pytest.LogCaptureFixture):
+	queue = ThumbnailQueue(ThumbnailStore(tmp_path), max_workers=1)
+	empty_route = Route([], [], [])
+
+	try:
+		with caplog.at_level(logging.ERROR):
+			key = queue.submit(empty_route, "#ff0000")
+
+			# The queue is updated by the future's callback, shortly after it finishes.
+			deadline = time.monotonic() + 30
+			while queue.is_pending(key) and time.monotonic() < deadline:
+				time.sleep(0.01)
+
+		assert "Failed to render thumbnail" in caplog.text
+		assert not queue.is_pending(key)
+
+		# Submitting again doesn't queue another render.
+		assert queue.submit(empty_route, "#ff0000") == key
+		assert not queue.is_pending(key)
+		assert queue.submit_batch({key: (empty_route, "#ff0000")}) == {key: None}
+		assert not queue.is_pending(key)
+	finally:
+		queue.shutdown()
+
+
+def test_queue_submit_batch(tmp_path: Path):
+	store = ThumbnailStore(tmp_path)
+	queue = ThumbnailQueue(store, max_workers=1)
+	empty_route = Route([], [], [])
+	store.put("aa01", b"rendered")
+
+	try:
+		# Thumbnails in the store are returned, and the rest are queued without waiting for them.
+		images = queue.submit_batch({"aa01": (empty_route, "#ff0000"), "bb02": (empty_route, "#00ff00")})
+		assert images == {"aa01": b"rendered", "bb02": None}
+
+		deadline = time.monotonic() + 30
+		while queue.is_pending("bb02") and time.monotonic() < deadline:
+			time.sleep(0.01)
+
+		assert not queue.is_pending("bb02")
+		assert "bb02" not in store
+
+		# The empty route failed to render, so isn't queued again.
+		assert queue.submit_batch({"bb02": (empty_route, "#00ff00")}) == {"bb02": None}
+		assert not queue.is_pending("bb02")
+	finally:
+		queue.shutdown()
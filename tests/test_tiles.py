@@ -0,0 +1,41 @@
+# stdlib
+import time
+from pathlib import Path
+from typing import Optional
+
+# 3rd party
+import pytest
+import requests
+
+# this package
+from towpath_walk_tracker import tiles
+from towpath_walk_tracker.tiles import TileStore, prefetch_tiles, tiles_in_bounds
+
+BOUNDS = (-2.5, 52.5, -1.5, 53.5)
+
+
+def test_prefetch_tiles(tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+	requested = []
+
+	def fetch_tile(z: int, x: int, y: int, session: Optional[requests.Session] = None, url: str = '') -> bytes:
+		requested.append((time.monotonic(), url.format(z=z, x=x, y=y)))
+		return b"tile"
+
+	monkeypatch.setattr(tiles, "fetch_tile", fetch_tile)
+
+	store = TileStore(tmp_path / "tiles.mbtiles", download=False)
+	expected = [tile for zoom in (5, 6, 7) for tile in tiles_in_bounds(*BOUNDS, zoom)]
+
+	# Too many tiles; nothing is downloaded.
+	with pytest.raises(ValueError, match="more than the limit of 2"):
+		list(prefetch_tiles(store, BOUNDS, [5, 6, 7], max_tiles=2))
+	assert not requested
+
+	downloaded = list(prefetch_tiles(store, BOUNDS, [5, 6, 7], url="http://localhost/{z}/{x}/{y}.png", interval=0.05))
+	assert downloaded == expected
+	assert [url for _, url in requested] == [f"http://localhost/{z}/{x}/{y}.png" for z, x, y in expected]
+	assert all(later - earlier >= 0.045 for (earlier, _), (later, _) in zip(requested, requested[1:]))
+	assert store.get(*expected[0]) == b"tile"
+
+	# Tiles already in the store aren't downloaded again.
+	assert list(prefetch_tiles(store, BOUNDS, [5, 6, 7], max_tiles=0)) == []
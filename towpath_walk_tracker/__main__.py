@@ -26,11 +26,25 @@ Command-line entry point.
 #  OR OTHER DEALINGS IN THE SOFTWARE.
 #
 
+# stdlib
+from typing import Optional
+
 # 3rd party
 from consolekit import CONTEXT_SETTINGS, SuggestionGroup, click_group
-from consolekit.options import flag_option
-
-__all__ = ["create_db", "get_data", "main", "run"]
+from consolekit.options import auto_default_option, flag_option
+from consolekit.utils import abort
+
+__all__ = [
+		"build_hierarchy",
+		"build_network",
+		"build_pyramid",
+		"create_db",
+		"get_data",
+		"main",
+		"prefetch_tiles",
+		"run",
+		"update_db",
+		]
 
 
 @click_group(cls=SuggestionGroup, invoke_without_command=False, context_settings=CONTEXT_SETTINGS)
@@ -56,8 +70,13 @@ def run() -> None:
 	from flask_debugtoolbar import DebugToolbarExtension  # noqa: F401
 
 	# this package
+	from towpath_walk_tracker import pyramid
 	from towpath_walk_tracker.flask import app
 
+	if not pyramid._pyramid_is_current():
+		print("Building the pyramid of simplified watercourses")
+		pyramid.build_pyramid()
+
 	contextily.set_cache_dir(PathPlus("cache").abspath())
 	matplotlib.rcParams["backend"] = "agg"
 
@@ -82,6 +101,35 @@ def create_db() -> None:
 		Model.metadata.create_all(db.engine)
 
 
+@main.command()
+def update_db() -> None:
+	"""
+	Add any new columns to an existing towpath-walk-tracker database, and fill in the walk statistics.
+	"""
+
+	# 3rd party
+	import sqlalchemy
+
+	# this package
+	from towpath_walk_tracker.flask import app, db
+	from towpath_walk_tracker.models import Walk
+
+	with app.app_context():
+		existing_columns = {column["name"] for column in sqlalchemy.inspect(db.engine).get_columns(Walk.__tablename__)}
+
+		with db.engine.begin() as connection:
+			for column in Walk.__table__.columns:
+				if column.name not in existing_columns:
+					column_type = column.type.compile(db.engine.dialect)
+					connection.execute(sqlalchemy.text(f"ALTER TABLE {Walk.__tablename__} ADD COLUMN {column.name} {column_type}"))
+
+		walk: Walk
+		for walk in db.session.query(Walk).all():
+			walk._set_route_statistics(walk.get_route())
+
+		db.session.commit()
+
+
 @flag_option("-d/-D", "--download/--no-download", default=True)
 @main.command()
 def get_data(download: bool = True) -> None:
@@ -92,13 +140,16 @@ def get_data(download: bool = True) -> None:
 	# stdlib
 	import json
 
-	# 3rd party
-	from networkx import connected_components
-
 	# this package
-	from towpath_walk_tracker.network import build_network
+	from towpath_walk_tracker.network import build_network, build_snapshot
+	from towpath_walk_tracker.pyramid import build_pyramid
 	from towpath_walk_tracker.util import overpass_query
-	from towpath_walk_tracker.watercourses import FeatureCollection, filter_watercourses, query_overpass
+	from towpath_walk_tracker.watercourses import (
+			iter_features,
+			iter_filtered_watercourses,
+			query_overpass,
+			write_feature_collection
+			)
 
 	if download:
 		data = query_overpass(overpass_query)
@@ -106,35 +157,124 @@ def get_data(download: bool = True) -> None:
 		with open("data.geojson", 'w', encoding="UTF-8") as fp:
 			json.dump(data, fp, indent=2)
 
-	else:
-		with open("data.geojson", encoding="UTF-8") as fp:
-			data = json.load(fp)
+		del data
+
+	# The data is streamed from disk for each pass, rather than held in memory.
+	network = build_network(iter_filtered_watercourses(iter_features("data.geojson")))
+
+	nodes_to_exclude = set(network.node_ids[network.component_sizes() < 22].tolist())
+
+	filtered_features = (
+			feature for feature in iter_features("data.geojson")
+			if feature["geometry"]["type"] == "Point" or "nodes" not in feature["properties"]
+			or not nodes_to_exclude.intersection(feature["properties"]["nodes"])
+			)
+	write_feature_collection(filtered_features, "data.filtered.geojson")
 
-	watercourses = filter_watercourses(data)
-	network = build_network(watercourses)
+	build_snapshot()
+	build_pyramid()
 
-	nodes_to_exclude = set()
-	for nodes in connected_components(network):
-		if len(nodes) < 22:
-			nodes_to_exclude.update(nodes)
 
-	filtered_data: FeatureCollection = {"type": "FeatureCollection", "features": []}
+@main.command()
+def build_network() -> None:
+	"""
+	Precompile the routing network snapshot from the filtered watercourses data.
+	"""
+
+	# this package
+	from towpath_walk_tracker.network import build_snapshot
+
+	network = build_snapshot()
+	print(f"Wrote snapshot of {network!r}")
 
-	for feature in data["features"]:
-		if feature["geometry"]["type"] == "Point":
-			filtered_data["features"].append(feature)
-			continue
 
-		if "nodes" not in feature["properties"]:
-			filtered_data["features"].append(feature)
-			continue
+@main.command()
+def build_hierarchy() -> None:
+	"""
+	Build the (optional) contraction hierarchy used to speed up route finding.
+	"""
+
+	# this package
+	from towpath_walk_tracker import hierarchy
+	from towpath_walk_tracker.network import load_network
+	from towpath_walk_tracker.util import _get_source_hash
+
+	ch = hierarchy.build_hierarchy(load_network())
+	hierarchy.save_hierarchy(ch, "data.filtered.ch", _get_source_hash())
+	print(f"Wrote {ch!r}")
 
-		if not nodes_to_exclude.intersection(feature["properties"]["nodes"]):
-			filtered_data["features"].append(feature)
-			continue
 
-	with open("data.filtered.geojson", 'w', encoding="UTF-8") as fp:
-		json.dump(filtered_data, fp, indent=2)
+@main.command()
+def build_pyramid() -> None:
+	"""
+	Precompute the simplified watercourse geometries for lower zoom levels, and the precompressed files served for each.
+	"""
+
+	# this package
+	from towpath_walk_tracker import pyramid
+
+	pyramid.build_pyramid()
+	print(f"Wrote {len(pyramid.ZOOM_BANDS)} levels with fingerprint {pyramid.get_pyramid_fingerprint()}")
+
+
+@auto_default_option(
+		"--max-tiles",
+		type=int,
+		help="Refuse to download more than this many tiles. Only raise it when using your own tile server.",
+		)
+@auto_default_option("--interval", type=float, help="The minimum time between downloads, in seconds.")
+@auto_default_option(
+		"--url",
+		type=str,
+		help="URL template for the tile server, with {z}, {x} and {y} placeholders. "
+		"Defaults to the Humanitarian OpenStreetMap tiles.",
+		)
+@auto_default_option("--max-zoom", type=int, help="The highest zoom level to download.")
+@auto_default_option("--min-zoom", type=int, help="The lowest zoom level to download.")
+@main.command()
+def prefetch_tiles(
+		min_zoom: int = 5,
+		max_zoom: int = 8,
+		url: Optional[str] = None,
+		interval: float = 1.0,
+		max_tiles: int = 500,
+		) -> None:
+	"""
+	Download base map tiles covering the watercourse network into the local tile store.
+
+	Tiles are downloaded one at a time, at most one per --interval seconds,
+	and nothing is downloaded if more than --max-tiles tiles are missing.
+	The public OpenStreetMap tile servers forbid bulk downloading, so keep to low zoom levels,
+	or use --url to download from your own tile server.
+	Higher zoom levels are downloaded on demand as thumbnails are rendered.
+	"""
+
+	# this package
+	from towpath_walk_tracker import tiles
+	from towpath_walk_tracker.network import load_network
+
+	coordinates = load_network().graph.coordinates
+	(south, west), (north, east) = coordinates.min(axis=0).tolist(), coordinates.max(axis=0).tolist()
+
+	store = tiles.get_tile_store()
+	downloads = tiles.prefetch_tiles(
+			store,
+			(west, south, east, north),
+			range(min_zoom, max_zoom + 1),
+			url=url or tiles.TILE_URL,
+			interval=interval,
+			max_tiles=max_tiles,
+			)
+
+	count = 0
+	try:
+		for count, (z, x, y) in enumerate(downloads, 1):
+			if count % 100 == 0:
+				print(f"Downloaded {count} tiles (currently at {z}/{x}/{y})")
+	except ValueError as e:
+		raise abort(str(e))
+
+	print(f"Downloaded {count} tiles; {len(store)} tiles in {store!r}")
 
 
 if __name__ == "__main__":
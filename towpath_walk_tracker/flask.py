@@ -28,9 +28,7 @@ Flask routes and helper functions.
 
 # stdlib
 import datetime
-import json
-from io import BytesIO
-from typing import Any, Union, cast
+from typing import Any, Optional, Union, cast
 
 # 3rd party
 import flask
@@ -46,11 +44,38 @@ from werkzeug.http import http_date  # nodep
 # this package
 from towpath_walk_tracker.forms import WalkForm
 from towpath_walk_tracker.map import create_basic_map, create_map
-from towpath_walk_tracker.models import Walk
-from towpath_walk_tracker.route import Route
-from towpath_walk_tracker.util import Coordinate, _get_filtered_watercourses
+from towpath_walk_tracker.models import THUMBNAIL_SIZE, Walk
+from towpath_walk_tracker.pyramid import (
+		PRECOMPRESSED_ENCODINGS,
+		PYRAMID_MAX_ZOOM,
+		PyramidFile,
+		StalePyramidError,
+		get_pyramid_file,
+		get_pyramid_fingerprint
+		)
+from towpath_walk_tracker.route import DisconnectedPointsError, Route, get_leg_pool
+from towpath_walk_tracker.thumbnail import (
+		ThumbnailQueue,
+		ThumbnailStore,
+		placeholder_thumbnail,
+		sprite_key,
+		sprite_offsets,
+		sprite_sheet
+		)
+from towpath_walk_tracker.tiles import MAX_ZOOM, get_tile_store
+from towpath_walk_tracker.util import Coordinate, _get_feature_index
+from towpath_walk_tracker.vector_tiles import MVT_MIMETYPE, get_watercourse_tile_index, get_watercourse_tile_store
+
+__all__ = ["add_walk", "leaflet_map", "watercourses_geojson", "watercourses_topojson"]
+
+#: Media type for routes in Google's encoded polyline format.
+POLYLINE_MIMETYPE = "application/vnd.google.polyline"
 
-__all__ = ["add_walk", "leaflet_map", "watercourses_geojson"]
+#: The number of thumbnails in each row of a sprite sheet.
+SPRITE_COLUMNS = 10
+
+#: The maximum number of thumbnails in a single sprite sheet.
+SPRITE_MAX_WALKS = 500
 
 app = Flask(__name__)
 
@@ -73,6 +98,8 @@ app.config["COMPRESS_MIMETYPES"] = [
 		"font/otf",
 		"font/opentype",
 		"application/geo+json",
+		POLYLINE_MIMETYPE,
+		MVT_MIMETYPE,
 		]
 app.config["CACHE_TYPE"] = "SimpleCache"
 app.config["CACHE_DEFAULT_TIMEOUT"] = 300
@@ -86,35 +113,155 @@ app.jinja_env.globals["github_url"] = "https://github.com/domdfcoding/towpath-wa
 
 Compress(app)
 cache = Cache(app)
+thumbnails = ThumbnailQueue(ThumbnailStore())
 csrf = CSRFProtect(app)
 db = SQLAlchemy(app)  # type: ignore[arg-type]
 api = Api(app, prefix="/api", doc="/api/")
 
 
+def _send_pyramid_file(pyramid_file: PyramidFile, mimetype: str) -> Response:
+	# Send the file precompressed with the client's preferred encoding, without compressing it again.
+	# The ETag is derived from the file's content hash, so unchanged files are revalidated with a 304.
+
+	for encoding in PRECOMPRESSED_ENCODINGS:
+		if request.accept_encodings[encoding]:
+			path = pyramid_file.compressed(encoding)
+			etag = f"{pyramid_file.content_hash}-{encoding}"
+			break
+	else:
+		encoding = None
+		path = pyramid_file.path
+		etag = pyramid_file.content_hash
+
+	response = flask.send_file(path.abspath(), mimetype=mimetype, conditional=False)
+
+	if encoding is not None:
+		response.headers["Content-Encoding"] = encoding
+	response.headers["Vary"] = "Accept-Encoding"
+
+	if request.args.get('v') == get_pyramid_fingerprint():
+		response.headers["Cache-Control"] = "public, max-age=31536000, immutable"
+	else:
+		response.headers["Cache-Control"] = "no-cache"
+
+	response.set_etag(etag)
+	return response.make_conditional(request)
+
+
 @app.route("/watercourses.geojson")
-@cache.cached()
 def watercourses_geojson() -> Response:
 	"""
 	Flask route for the watercourses GeoJSON data.
+
+	With ``?zoom=N`` the geometry is simplified for display at that zoom level,
+	and node IDs are only included at the highest zoom levels.
+
+	With ``?slim=1`` only the geometry and ID of each watercourse are included,
+	and the other properties can be fetched from ``/api/feature/<id>/`` when needed.
+
+	The files are produced when the pyramid is built, and are served precompressed.
+	They may be cached indefinitely if the ``v`` parameter matches the pyramid's fingerprint.
+	"""
+
+	zoom = request.args.get("zoom", default=PYRAMID_MAX_ZOOM, type=int)
+	extension = ".slim.geojson" if request.args.get("slim") else ".geojson"
+	return _send_pyramid_file(get_pyramid_file(zoom, extension), "application/geo+json")
+
+
+@app.route("/watercourses.topojson")
+def watercourses_topojson() -> Response:
+	"""
+	Flask route for the watercourses data as quantized TopoJSON, with only the ID of each watercourse.
+
+	With ``?zoom=N`` the geometry is simplified for display at that zoom level.
+
+	The files are produced when the pyramid is built, and are served precompressed.
+	They may be cached indefinitely if the ``v`` parameter matches the pyramid's fingerprint.
 	"""
 
-	data = _get_filtered_watercourses()
-	# TODO: client-side cache headers
-	resp = Response(json.dumps(data), 200, headers={"Content-Type": "application/geo+json"})
-	return resp
+	zoom = request.args.get("zoom", default=PYRAMID_MAX_ZOOM, type=int)
+	return _send_pyramid_file(get_pyramid_file(zoom, ".topojson"), "application/json")
+
+
+def _queue_thumbnail(walk: Walk) -> None:
+	# Queue the walk's thumbnail to be rendered in the background.
+
+	thumbnails.submit(
+			Route.from_db(walk.route),
+			colour=cast(str, '#' + walk.colour),
+			size=THUMBNAIL_SIZE,
+			key=cast(Optional[str], walk.thumbnail_key),
+			)
+
+
+def _thumbnail_url(walk_data: dict[str, Any]) -> str:
+	# Returns the URL of the walk's thumbnail, which embeds its key if known so it can be cached indefinitely.
+
+	if walk_data["thumbnail_key"] is None:
+		return url_for("api_walk_thumbnail", walk_id=walk_data["id"])
+
+	return url_for("api_thumbnail", key=walk_data["thumbnail_key"])
+
+
+def _sprite_layout(walk_ids: list[int], keys: list[Optional[str]]) -> dict[str, Any]:
+	# Returns the URL of the sprite sheet for the walks, and the offset of each walk's thumbnail within it.
 
+	url_kwargs: dict[str, Any] = {"walks": ','.join(map(str, walk_ids))}
+	if None not in keys:
+		# Embed the sheet's key so it can be cached indefinitely.
+		url_kwargs['v'] = sprite_key(cast(list[str], keys), THUMBNAIL_SIZE, SPRITE_COLUMNS)
 
-def _get_all_walks() -> list[dict[str, Any]]:
+	offsets = sprite_offsets(len(walk_ids), THUMBNAIL_SIZE, SPRITE_COLUMNS)
+	columns = max(min(SPRITE_COLUMNS, len(walk_ids)), 1)
+
+	return {
+			"url": url_for("api_sprite_sheet", **url_kwargs),
+			"size": THUMBNAIL_SIZE,
+			"columns": columns,
+			"rows": max(-(-len(walk_ids) // columns), 1),
+			"offsets": {walk_id: {'x': x, 'y': y} for walk_id, (x, y) in zip(walk_ids, offsets)},
+			}
+
+
+def _get_sprite_walks() -> list[Walk]:
+	# Returns the walks given in the ``walks`` query parameter, in order, ensuring they all have thumbnail keys.
+	# Must be called within the app context.
+
+	try:
+		walk_ids = [int(walk_id) for walk_id in request.args.get("walks", '').split(',') if walk_id]
+	except ValueError:
+		flask.abort(400, "Walk IDs must be integers")
+
+	if not walk_ids:
+		flask.abort(400, "No walks given")
+	if len(walk_ids) > SPRITE_MAX_WALKS:
+		flask.abort(400, f"At most {SPRITE_MAX_WALKS} walks may be given")
+
+	walks = {walk.id: walk for walk in db.session.query(Walk).filter(Walk.id.in_(walk_ids))}
+	if len(walks) != len(set(walk_ids)):
+		flask.abort(404, "Not Found")
+
+	missing_keys = [walk for walk in walks.values() if walk.thumbnail_key is None]
+	for walk in missing_keys:
+		walk._set_thumbnail_key(walk.get_route())
+	if missing_keys:
+		db.session.commit()
+
+	return [walks[walk_id] for walk_id in walk_ids]
+
+
+def _get_all_walks(include_route: bool = True) -> list[dict[str, Any]]:
 	data = []
 	with app.app_context():
 		walk: Walk
 		for walk in db.session.query(Walk).all():
-			walk_data = walk.to_json()
+			walk_data = walk.to_json(include_route=include_route)
 			# TODO: absolute urls
-			walk_data["thumbnail_url"] = url_for("api_walk_thumbnail", walk_id=walk_data["id"])
+			walk_data["thumbnail_url"] = _thumbnail_url(walk_data)
 			walk_data["walk_url"] = url_for("show_walk", walk_id=walk_data["id"])
 			formatted_duration = f"{ walk_data['duration'] // 60 }h { format(walk_data['duration'] % 60, '02d') }mins"
 			walk_data["formatted_duration"] = formatted_duration
+			walk_data["formatted_length"] = f"{ walk_data['length'] / 1000:.1f}km"
 			data.append(walk_data)
 
 	return data
@@ -153,11 +300,34 @@ walk_model = api.model(
 				"colour":
 						fields.String(example="#FF0000", description="Display colour for the walk"),
 				"thumbnail_url":
-						fields.Url(example="/api/walk/1234/thumbnail/"),
+						fields.Url(example="/api/thumbnail/8a3f….png"),
 				"walk_url":
 						fields.Url(example="/walk/1234/"),
 				"formatted_duration":
 						fields.String(example="1h 25mins"),
+				"length":
+						fields.Float(example=6543.2, description="Route length in metres"),
+				"node_count":
+						fields.Integer(example=321, description="Number of nodes along the route"),
+				"bounds":
+						fields.List(
+								fields.Float,
+								example=[-0.1425, 51.5010, -0.1204, 51.5123],
+								description="Route bounding box, as min longitude, min latitude, max longitude, max latitude",
+								),
+				"pace":
+						fields.Float(example=13.0, description="Average pace in minutes per kilometre"),
+				"formatted_length":
+						fields.String(example="6.5km"),
+				},
+		)
+
+feature_model = api.model(
+		"Feature",
+		{
+				"id": fields.Integer(example=4675033, description="OpenStreetMap ID"),
+				"type": fields.String(example="way", description="OpenStreetMap element type"),
+				"tags": fields.String(example="name = Regent's Canal<br>waterway = canal", description="Tooltip HTML"),
 				},
 		)
 
@@ -184,7 +354,12 @@ def walk_list() -> Response:
 	Flask route for the walks page.
 	"""
 
-	return make_response(render_template("walk_list.jinja2", walks=_get_all_walks()))
+	walks = _get_all_walks(include_route=False)
+	sprite = None
+	if walks:
+		sprite = _sprite_layout([walk["id"] for walk in walks], [walk["thumbnail_key"] for walk in walks])
+
+	return make_response(render_template("walk_list.jinja2", walks=walks, sprite=sprite))
 
 
 @app.route('/', methods=["GET", "POST"])
@@ -197,7 +372,8 @@ def main_page() -> Union[str, Response]:
 	# lat = float(request.args.get("lat", 55))
 	# lng = float(request.args.get("lng", -2))
 	# print(zoom_level, lat, lng)
-	m = create_map("http://localhost:5000/watercourses.geojson")  # , (lat, lng), zoom_level)
+	watercourses_url = f"http://localhost:5000/watercourses.topojson?v={get_pyramid_fingerprint()}"
+	m = create_map(watercourses_url)  # , (lat, lng), zoom_level)
 
 	root: Figure = m.get_root()  # type: ignore[assignment]
 
@@ -215,6 +391,7 @@ def main_page() -> Union[str, Response]:
 	if form.validate_on_submit():
 		with app.app_context():
 			walk = Walk.from_form(db, form)
+			_queue_thumbnail(walk)
 			return redirect(f"/walk/{walk.id}")  # type: ignore[return-value]
 
 	return render_template(
@@ -227,13 +404,38 @@ def main_page() -> Union[str, Response]:
 			)
 
 
+@app.errorhandler(DisconnectedPointsError)
+def disconnected_points(error: DisconnectedPointsError) -> tuple[Response, int]:
+	"""
+	Error handler for routes through points on parts of the network which are not connected.
+
+	:param error:
+
+	:returns: A JSON description of the error, including the indices of the points of each leg that cannot be routed.
+	"""
+
+	return flask.jsonify({"message": str(error), "legs": error.legs}), 422
+
+
+@app.errorhandler(StalePyramidError)
+def stale_pyramid(error: StalePyramidError) -> tuple[Response, int]:
+	"""
+	Error handler for requests for watercourses data while the pyramid is missing or out of date.
+
+	:param error:
+	"""
+
+	return flask.jsonify({"message": str(error)}), 503
+
+
 @app.route("/get-route/", methods=["POST"])
 @csrf.exempt
-def get_route() -> list[Coordinate]:
+def get_route() -> Union[list[Coordinate], Response]:
 	"""
 	Flask route to calculate a route along watercourses through points on a map.
 
-	:returns: A list of coordinates of nodes along the path.
+	:returns: A list of coordinates of nodes along the path,
+		or the path as an encoded polyline if the request's ``Accept`` header prefers :data:`~.POLYLINE_MIMETYPE`.
 	"""
 
 	points: list[tuple[float, float]] = []
@@ -245,7 +447,12 @@ def get_route() -> list[Coordinate]:
 
 	print(f"Create walk with points {points}")
 
-	return Route.from_points(points).coordinates
+	route = Route.from_points(points, executor=get_leg_pool())
+
+	if request.accept_mimetypes.best_match(["application/json", POLYLINE_MIMETYPE]) == POLYLINE_MIMETYPE:
+		return Response(route.to_polyline(), 200, mimetype=POLYLINE_MIMETYPE)
+
+	return route.coordinates
 
 
 # @app.route("/walk", methods=["GET", "POST"])
@@ -274,7 +481,7 @@ class APIWalk(Resource):
 				flask.abort(404, "Not Found")
 
 			data = cast(Walk, result).to_json()
-			data["thumbnail_url"] = url_for("api_walk_thumbnail", walk_id=walk_id)
+			data["thumbnail_url"] = _thumbnail_url(data)
 			data["walk_url"] = url_for("show_walk", walk_id=data["id"])
 			formatted_duration = f"{ data['duration'] // 60 }h { format(data['duration'] % 60, '02d') }mins"
 			data["formatted_duration"] = formatted_duration
@@ -285,34 +492,204 @@ class APIWalk(Resource):
 @api.doc(params={"walk_id": "The numerical identifier of the walk."})
 class APIWalkThumbnail(Resource):
 
-	@api.produces(["image/png"])
+	@api.response(302, "Redirect to the walk's current thumbnail.")
 	@api.response(404, "No walk found with that ID or not authorised to view it.")
-	@cache.memoize()
 	def get(self, walk_id: int) -> Response:  # noqa: PRM002
 		"""
-		Returns a 150x150px thumbnail PNG for the walk.
+		Redirects to the current 150x150px thumbnail PNG for the walk.
 		"""
 
-		# TODO: gate cache on user login
 		with app.app_context():
 			result = db.session.query(Walk).get(walk_id)
 			if result is None:
 				flask.abort(404, "Not Found")
 
 			walk = cast(Walk, result)
-			route = Route.from_db(walk.route)
-			fig, ax = route.plot_thumbnail(
-				figsize=(1.5, 1.5),
-				colour=cast(str, '#' + walk.colour),
+			if walk.thumbnail_key is None:
+				walk._set_thumbnail_key(walk.get_route())
+				db.session.commit()
+
+			return redirect(url_for("api_thumbnail", key=walk.thumbnail_key))  # type: ignore[return-value]
+
+
+@api.route("/thumbnail/<string:key>.png")
+@api.doc(params={"key": "Hash of the route, colour and size of the thumbnail."})
+class APIThumbnail(Resource):
+
+	@api.produces(["image/png"])
+	@api.response(404, "No walk has a thumbnail with that key.")
+	def get(self, key: str) -> Response:  # noqa: PRM002
+		"""
+		Returns the thumbnail PNG with the given key.
+
+		Thumbnails never change once rendered, and may be cached indefinitely.
+		A placeholder is returned until the thumbnail has been rendered in the background.
+		"""
+
+		# TODO: gate cache on user login
+		image_png = thumbnails.store.get(key)
+		if image_png is not None:
+			return Response(
+					image_png,
+					content_type="image/png",
+					headers={"Cache-Control": "public, max-age=31536000, immutable"},
+					)
+
+		if not thumbnails.is_pending(key):
+			with app.app_context():
+				walk = db.session.query(Walk).filter_by(thumbnail_key=key).first()
+				if walk is None:
+					flask.abort(404, "Not Found")
+
+				_queue_thumbnail(walk)
+
+		return Response(
+				placeholder_thumbnail(THUMBNAIL_SIZE),
+				content_type="image/png",
+				headers={"Cache-Control": "no-store"},
 				)
 
-			buffer = BytesIO()
-			fig.savefig(buffer, format="png")
-			buffer.seek(0)
-			image_png = buffer.getvalue()
-			buffer.close()
 
-			return Response(image_png, content_type="image/png")
+@api.route("/thumbnails/sprite.png")
+@api.doc(params={"walks": "Comma-separated walk IDs.", 'v': "The sheet's key, from the sprite layout."})
+class APISpriteSheet(Resource):
+
+	@api.produces(["image/png"])
+	@api.response(400, "Invalid or too many walk IDs.")
+	@api.response(404, "No walk found with one of the IDs or not authorised to view it.")
+	def get(self) -> Response:
+		"""
+		Returns a sprite sheet PNG of the thumbnails for the given walks, in rows of 10.
+
+		Any thumbnails which haven't been rendered yet are queued to be rendered together in the background,
+		and placeholders are shown in their place until they are.
+		The sheet may be cached indefinitely if the ``v`` parameter matches the key from ``sprite.json``.
+		"""
+
+		with app.app_context():
+			walks = _get_sprite_walks()
+			keys = [cast(str, walk.thumbnail_key) for walk in walks]
+			sheet_key = sprite_key(keys, THUMBNAIL_SIZE, SPRITE_COLUMNS)
+
+			sheet_png = thumbnails.store.get(sheet_key)
+			if sheet_png is None:
+				images = thumbnails.submit_batch(
+						{
+								cast(str, walk.thumbnail_key): (Route.from_db(walk.route), '#' + cast(str, walk.colour))
+								for walk in walks
+								},
+						size=THUMBNAIL_SIZE,
+						)
+				sheet_png = sprite_sheet([images[key] for key in keys], THUMBNAIL_SIZE, SPRITE_COLUMNS)
+
+				if None in images.values():
+					# Some thumbnails are still being rendered, or walks have no route; don't store the placeholders.
+					return Response(sheet_png, content_type="image/png", headers={"Cache-Control": "no-store"})
+
+				thumbnails.store.put(sheet_key, sheet_png)
+
+		if request.args.get('v') == sheet_key:
+			cache_control = "public, max-age=31536000, immutable"
+		else:
+			cache_control = "no-cache"
+
+		response = Response(sheet_png, content_type="image/png", headers={"Cache-Control": cache_control})
+		response.set_etag(sheet_key)
+		return response.make_conditional(request)
+
+
+@api.route("/thumbnails/sprite.json")
+@api.doc(params={"walks": "Comma-separated walk IDs."})
+class APISpriteLayout(Resource):
+
+	@api.response(400, "Invalid or too many walk IDs.")
+	@api.response(404, "No walk found with one of the IDs or not authorised to view it.")
+	def get(self) -> Response:
+		"""
+		Returns the URL of the sprite sheet for the given walks, and the pixel offset of each walk's thumbnail within it.
+		"""
+
+		with app.app_context():
+			walks = _get_sprite_walks()
+			layout = _sprite_layout(
+					[cast(int, walk.id) for walk in walks],
+					[cast(Optional[str], walk.thumbnail_key) for walk in walks],
+					)
+
+		return flask.jsonify(layout)
+
+
+@api.route("/feature/<int:feature_id>/")
+@api.doc(params={"feature_id": "The OpenStreetMap ID of the watercourse."})
+class APIFeature(Resource):
+
+	@api.response(200, "Success", feature_model)
+	@api.response(404, "No watercourse found with that ID.")
+	def get(self, feature_id: int) -> Response:  # noqa: PRM002
+		"""
+		Returns the properties of the watercourse with the given ID, for display in its tooltip.
+		"""
+
+		properties = _get_feature_index().get(feature_id)
+		if properties is None:
+			flask.abort(404, "Not Found")
+
+		response = flask.jsonify(properties)
+		response.headers["Cache-Control"] = "public, max-age=3600"
+		return response
+
+
+@app.route("/tiles/<int:z>/<int:x>/<int:y>.png")
+def tile(z: int, x: int, y: int) -> Response:
+	"""
+	Flask route for base map tiles from the local tile store.
+
+	Only tiles already in the store are served; missing tiles are not downloaded from the tile provider.
+
+	:param z: Zoom level.
+	:param x: Tile column.
+	:param y: Tile row.
+	"""
+
+	if not (0 <= z <= MAX_ZOOM and 0 <= x < 2**z and 0 <= y < 2**z):
+		flask.abort(404, "Not Found")
+
+	data = get_tile_store(download=False).get(z, x, y)
+	if data is None:
+		flask.abort(404, "Not Found")
+
+	return Response(data, content_type="image/png", headers={"Cache-Control": "public, max-age=604800"})
+
+
+@app.route("/watercourses/<int:z>/<int:x>/<int:y>.mvt")
+def watercourses_tile(z: int, x: int, y: int) -> Response:
+	"""
+	Flask route for vector tiles of the watercourses.
+
+	Tiles are rendered from the watercourses data the first time they are requested, and cached on disk.
+	Tiles beyond :data:`~.MAX_TILE_ZOOM` or outside the bounds of the data are empty, and are neither rendered nor stored.
+
+	:param z: Zoom level.
+	:param x: Tile column.
+	:param y: Tile row.
+	"""
+
+	headers = {"Cache-Control": "public, max-age=3600"}
+
+	index = get_watercourse_tile_index()
+	if not index.covers(z, x, y):
+		return Response(status=204, headers=headers)
+
+	store = get_watercourse_tile_store()
+	data = store.get(z, x, y)
+	if data is None:
+		data = index.render(z, x, y)
+		store.put(z, x, y, data)
+
+	if not data:
+		return Response(status=204, headers=headers)
+
+	return Response(data, content_type=MVT_MIMETYPE, headers=headers)
 
 
 @app.route("/walk/<int:walk_id>/", methods=["GET", "POST"])
@@ -332,7 +709,7 @@ def show_walk(walk_id: int) -> Response:
 			print("Edit walk with following data:")
 			print(form)
 			walk.update_from_form(db, form)
-			cache.delete_memoized(APIWalkThumbnail.get, walk_id)
+			_queue_thumbnail(walk)
 
 		m = create_basic_map()
 
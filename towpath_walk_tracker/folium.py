@@ -27,17 +27,18 @@ Extensions/changes to folium.
 #
 
 # stdlib
-from typing import Any, Optional, Union
+from typing import Any, Optional, Sequence, Union
 
 # 3rd party
 import folium
 from domdf_python_tools.compat import importlib_resources
 from folium import Figure
+from folium.elements import JSCSSMixin
 from folium.map import Layer
 from folium.template import Template
 from folium.utilities import remove_empty
 
-__all__ = ["Map", "Sidebar", "WalkStartEnd", "ZoomStateJS"]
+__all__ = ["Map", "Sidebar", "WalkStartEnd", "WatercoursesVectorTiles", "ZoomStateJS"]
 
 
 def _load_template(name: str) -> Template:
@@ -109,11 +110,20 @@ class ZoomStateJS(folium.MacroElement):
 
 
 class WatercoursesGeoJson(folium.GeoJson):
+	"""
+	Watercourses layer, loaded from the GeoJSON at the given URL.
+
+	:param data: The URL of the GeoJSON data.
+	:param zoom_levels: The lowest zoom level of each level of simplified geometry.
+		If given, ``zoom=N`` is added to the URL, and the data reloaded when the map is zoomed into another level.
+	"""
+
 	_template = _load_template("watercourses_geojson.jinja2")
 
 	def __init__(
 			self,
 			data: Any,
+			zoom_levels: Optional[Sequence[int]] = None,
 			popup_keep_highlighted: bool = False,
 			overlay: bool = True,
 			control: bool = True,
@@ -130,6 +140,7 @@ class WatercoursesGeoJson(folium.GeoJson):
 		self._name = "GeoJson"
 		self.embed = False
 		self.embed_link: Optional[str] = data
+		self.zoom_levels = list(zoom_levels) if zoom_levels is not None else None
 		self.json = None
 		self.parent_map = None
 		self.smooth_factor = smooth_factor
@@ -159,7 +170,73 @@ class WatercoursesGeoJson(folium.GeoJson):
 		self._id = "watercourses"
 
 
+class WatercoursesVectorTiles(JSCSSMixin, Layer):
+	"""
+	Watercourses drawn from vector tiles with ``Leaflet.VectorGrid``, as an alternative to :class:`~.WatercoursesGeoJson`.
+
+	:param url: URL template for the tiles, with ``{z}``, ``{x}`` and ``{y}`` placeholders.
+	:param layer_name: The name of the layer within the tiles to draw.
+	:param tooltip_url: URL to fetch each watercourse's properties from for its tooltip,
+		with ``{id}`` in place of the watercourse's ID. If :py:obj:`None` no tooltips are shown.
+	:param tooltip_style: CSS for the tooltips.
+	:param style: Leaflet path options for the watercourses.
+	:param kwargs: Passed to ``L.vectorGrid.protobuf`` as options.
+	"""
+
+	_template = _load_template("watercourses_vector_tiles.jinja2")
+
+	default_js = [(
+			"vectorGrid",
+			"https://unpkg.com/leaflet.vectorgrid@1.3.0/dist/Leaflet.VectorGrid.bundled.min.js",
+			)]
+
+	def __init__(
+			self,
+			url: str,
+			layer_name: str = "watercourses",
+			tooltip_url: Optional[str] = None,
+			tooltip_style: Optional[str] = None,
+			style: Optional[dict[str, Any]] = None,
+			**kwargs: Any,
+			):
+		super().__init__(name="Watercourses", overlay=True, control=True, show=True)
+		self._name = "VectorGrid"
+		self._id = "watercourses"
+		self.url = url
+		self.layer_name = layer_name
+		self.tooltip_url = tooltip_url
+		self.class_name = "foliumtooltip"
+		self.options = remove_empty(**kwargs)
+		self.style = style or {"color": "#3388ff", "weight": 3, "opacity": 1, "fill": True, "fillOpacity": 0.2}
+		self.tooltip_style = tooltip_style
+
+	def render(self, **kwargs) -> None:  # type: ignore[override]
+		if self.tooltip_url is not None:
+			root: Figure = self.get_root()  # type: ignore[assignment]
+			css = _load_template("geojson_tooltip_css.jinja2").render(
+					this={"class_name": self.class_name, "style": self.tooltip_style or ''},
+					)
+			root.header.add_child(folium.Element(css), name=self.get_name() + "tablestyle")
+
+		super().render(**kwargs)
+
+
 class GeoJsonTooltip(folium.GeoJsonTooltip):
+	"""
+	Tooltip for GeoJSON features, which can fetch the features' properties on demand.
+
+	:param fields: The properties to display.
+	:param url: URL to fetch each feature's properties from, with ``{id}`` in place of the feature's ID.
+		If :py:obj:`None` the properties must be included in the GeoJSON data.
+	:param kwargs: Passed to :class:`folium.GeoJsonTooltip`.
+	"""
+
+	def __init__(self, fields: Sequence[str], url: Optional[str] = None, **kwargs: Any):
+		super().__init__(fields, **kwargs)
+		self.url = url
+
+		if url is not None:
+			self._template = _load_template("geojson_tooltip.jinja2")
 
 	def render(self, **kwargs) -> None:  # type: ignore[override]
 		if not isinstance(self._parent, (folium.GeoJson, folium.TopoJson)):
@@ -0,0 +1,408 @@
+#!/usr/bin/env python3
+#
+#  hierarchy.py
+"""
+Contraction hierarchy over the routing network, for fast shortest path queries.
+"""
+#
+#  Copyright © 2025 Dominic Davis-Foster <dominic@davis-foster.co.uk>
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to deal
+#  in the Software without restriction, including without limitation the rights
+#  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#  copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in all
+#  copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+#  EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+#  MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+#  IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM,
+#  DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR
+#  OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE
+#  OR OTHER DEALINGS IN THE SOFTWARE.
+#
+
+# stdlib
+import math
+from heapq import heapify, heappop, heappush
+from typing import Optional, Union
+
+# 3rd party
+import numpy
+from domdf_python_tools.typing import PathLike
+
+# this package
+from towpath_walk_tracker.network import ContractedGraph, EdgePoint, RoutingGraph, _read_arrays, _write_arrays
+from towpath_walk_tracker.util import _get_source_hash
+
+__all__ = ["ContractionHierarchy", "build_hierarchy", "load_hierarchy", "save_hierarchy"]
+
+
+class ContractionHierarchy:
+	"""
+	A contraction hierarchy over the core nodes of a :class:`~.ContractedGraph`.
+
+	Each core node is given a rank, and the graph is augmented with shortcut edges
+	so that every shortest path can be found by searching only "upwards" (towards higher ranks)
+	from both the source and the target.
+
+	Only the upward edges are stored, in CSR form indexed by core node number.
+	Shortcuts record the node they bypass (``middles``), so paths can be unpacked;
+	original edges record the chain they follow (``chains``).
+
+	:param network: The contracted network the hierarchy was built from.
+	:param rank: The contraction order of each core node.
+	:param indptr: CSR row pointers for the upward graph.
+	:param indices: CSR column indices (core node numbers).
+	:param weights: Length of each edge in metres, aligned with ``indices``.
+	:param middles: The core node bypassed by each shortcut, or ``-1`` for original edges.
+	:param chains: The chain followed by each original edge, or ``-1`` for shortcuts.
+	"""
+
+	__slots__ = ("rank", "indptr", "indices", "weights", "middles", "chains", "network")
+
+	# Names of the arrays written to snapshots.
+	_arrays = __slots__[:-1]
+
+	network: ContractedGraph
+	rank: numpy.ndarray
+	indptr: numpy.ndarray
+	indices: numpy.ndarray
+	weights: numpy.ndarray
+	middles: numpy.ndarray
+	chains: numpy.ndarray
+
+	def __init__(
+			self,
+			network: ContractedGraph,
+			rank: numpy.ndarray,
+			indptr: numpy.ndarray,
+			indices: numpy.ndarray,
+			weights: numpy.ndarray,
+			middles: numpy.ndarray,
+			chains: numpy.ndarray,
+			):
+		self.network = network
+		self.rank = rank
+		self.indptr = indptr
+		self.indices = indices
+		self.weights = weights
+		self.middles = middles
+		self.chains = chains
+
+	def __repr__(self) -> str:
+		num_shortcuts = int(numpy.count_nonzero(self.middles != -1))
+		return f"<{type(self).__name__}({len(self.indices)} upward edges, {num_shortcuts} shortcuts)>"
+
+	@property
+	def graph(self) -> RoutingGraph:
+		"""
+		The full routing graph.
+		"""
+
+		return self.network.graph
+
+	def _upward_search(
+			self,
+			seeds: dict[int, tuple[float, list[int]]],
+			) -> tuple[dict[int, float], dict[int, int], list[tuple[float, int]]]:
+		distances = {core_number: distance for core_number, (distance, _) in seeds.items()}
+		queue = [(distance, core_number) for core_number, distance in distances.items()]
+		heapify(queue)
+		return distances, {}, queue
+
+	def _unpack(self, from_core: int, to_core: int) -> list[int]:
+		# Returns the nodes (in the full graph) along the edge between two core nodes, starting after ``from_core``.
+
+		path: list[int] = []
+		stack = [(from_core, to_core)]
+
+		while stack:
+			a, b = stack.pop()
+
+			# Edges are stored in the row of the lower-ranked node.
+			low, high = (a, b) if self.rank[a] < self.rank[b] else (b, a)
+			start = int(self.indptr[low])
+			position = start + int(numpy.flatnonzero(self.indices[start:self.indptr[low + 1]] == high)[0])
+
+			middle = int(self.middles[position])
+			if middle == -1:
+				path.extend(self.network._expand_edge(int(self.chains[position]), a))
+			else:
+				stack.append((middle, b))
+				stack.append((a, middle))
+
+		return path
+
+	def shortest_path_indices(self, source: Union[int, EdgePoint], target: Union[int, EdgePoint]) -> list[int]:
+		"""
+		Find the shortest path between the given nodes or points along edges.
+
+		Uses a bidirectional upward search through the hierarchy.
+
+		:param source: The index of a node in the full graph, or a point along an edge.
+		:param target: The index of a node in the full graph, or a point along an edge.
+
+		:returns: The indices of every node along the path.
+			For nodes this includes ``source`` and ``target``; points along edges are not themselves included.
+
+		:raises ValueError: If there is no path between the two points.
+		"""
+
+		if source == target:
+			return [] if isinstance(source, EdgePoint) else [source]
+
+		network = self.network
+		indptr, indices, weights = self.indptr, self.indices, self.weights
+
+		sources = network._attachments(source)
+		targets = network._attachments(target)
+
+		best_distance = math.inf
+		meeting = -1
+		best_path: list[int] = []
+
+		direct = network._same_chain_path(source, target)
+		if direct is not None:
+			best_distance, best_path = direct
+
+		forward_distances, forward_previous, forward_queue = self._upward_search(sources)
+		backward_distances, backward_previous, backward_queue = self._upward_search(targets)
+		searches = (
+				(forward_distances, forward_previous, forward_queue, backward_distances),
+				(backward_distances, backward_previous, backward_queue, forward_distances),
+				)
+
+		while forward_queue or backward_queue:
+			for distances, previous, queue, other_distances in searches:
+				if not queue:
+					continue
+
+				distance, node = heappop(queue)
+				if distance > distances[node]:
+					continue  # Already settled via a shorter route
+				if distance >= best_distance:
+					queue.clear()
+					continue
+
+				if node in other_distances and distance + other_distances[node] < best_distance:
+					best_distance = distance + other_distances[node]
+					meeting = node
+
+				start, end = int(indptr[node]), int(indptr[node + 1])
+				for neighbour, weight in zip(indices[start:end].tolist(), weights[start:end].tolist()):
+					new_distance = distance + weight
+					if new_distance < distances.get(neighbour, math.inf):
+						distances[neighbour] = new_distance
+						previous[neighbour] = node
+						heappush(queue, (new_distance, neighbour))
+
+		if best_distance == math.inf:
+			raise ValueError(f"No path between {network._describe(source)} and {network._describe(target)}")
+
+		if meeting == -1:
+			return best_path
+
+		forward_cores = [meeting]
+		while forward_cores[-1] in forward_previous:
+			forward_cores.append(forward_previous[forward_cores[-1]])
+		forward_cores.reverse()
+
+		backward_cores = [meeting]
+		while backward_cores[-1] in backward_previous:
+			backward_cores.append(backward_previous[backward_cores[-1]])
+
+		path = list(sources[forward_cores[0]][1])
+		for a, b in zip(forward_cores[:-1], forward_cores[1:]):
+			path.extend(self._unpack(a, b))
+		for a, b in zip(backward_cores[:-1], backward_cores[1:]):
+			path.extend(self._unpack(a, b))
+		path.extend(targets[backward_cores[-1]][1][-2::-1])
+
+		return path
+
+	def shortest_path(self, source: int, target: int) -> list[int]:
+		"""
+		Find the shortest path between the nodes with the given OpenStreetMap IDs.
+
+		:param source:
+		:param target:
+
+		:returns: The OpenStreetMap IDs of every node along the path, including ``source`` and ``target``.
+
+		:raises ValueError: If there is no path between the two nodes.
+		"""
+
+		graph = self.graph
+		path = self.shortest_path_indices(graph.index_of(source), graph.index_of(target))
+		return graph.node_ids[path].tolist()
+
+
+def _witness_distances(
+		adjacency: list[dict[int, tuple[float, int, int]]],
+		source: int,
+		excluded: int,
+		max_distance: float,
+		max_settled: int,
+		) -> dict[int, float]:
+	# Bounded Dijkstra search from ``source``, ignoring the node being contracted.
+
+	distances = {source: 0.0}
+	queue = [(0.0, source)]
+	settled = 0
+
+	while queue and settled < max_settled:
+		distance, node = heappop(queue)
+		if distance > distances[node]:
+			continue
+		if distance > max_distance:
+			break
+		settled += 1
+
+		for neighbour, (weight, _, _) in adjacency[node].items():
+			if neighbour == excluded:
+				continue
+			new_distance = distance + weight
+			if new_distance < distances.get(neighbour, math.inf):
+				distances[neighbour] = new_distance
+				heappush(queue, (new_distance, neighbour))
+
+	return distances
+
+
+def build_hierarchy(network: ContractedGraph, *, max_settled: int = 500) -> ContractionHierarchy:
+	"""
+	Build a contraction hierarchy for the given network.
+
+	Nodes are contracted in order of their edge difference (shortcuts added minus edges removed),
+	with priorities updated lazily.
+
+	:param network:
+	:param max_settled: The maximum number of nodes to settle when searching for witness paths.
+		Lower values build faster but may add unnecessary shortcuts.
+	"""
+
+	num_nodes = len(network)
+
+	# neighbour -> (weight, bypassed core node or -1, chain or -1)
+	adjacency: list[dict[int, tuple[float, int, int]]] = [{} for _ in range(num_nodes)]
+
+	indptr: list[int] = network.indptr.tolist()
+	for node, (start, end) in enumerate(zip(indptr[:-1], indptr[1:])):
+		for neighbour, weight, chain in zip(
+			network.indices[start:end].tolist(),
+			network.weights[start:end].tolist(),
+			network.edge_chains[start:end].tolist(),
+			):
+			if neighbour not in adjacency[node] or weight < adjacency[node][neighbour][0]:
+				adjacency[node][neighbour] = (weight, -1, chain)
+
+	def find_shortcuts(node: int) -> list[tuple[int, int, float]]:
+		shortcuts = []
+		neighbours = list(adjacency[node].items())
+
+		for idx, (a, (weight_a, _, _)) in enumerate(neighbours[:-1]):
+			others = neighbours[idx + 1:]
+			max_distance = weight_a + max(weight_b for _, (weight_b, _, _) in others)
+			witnesses = _witness_distances(adjacency, a, node, max_distance, max_settled)
+
+			for b, (weight_b, _, _) in others:
+				if witnesses.get(b, math.inf) > weight_a + weight_b:
+					shortcuts.append((a, b, weight_a + weight_b))
+
+		return shortcuts
+
+	deleted_neighbours = [0] * num_nodes
+
+	def priority(node: int, shortcuts: list[tuple[int, int, float]]) -> int:
+		return len(shortcuts) - len(adjacency[node]) + deleted_neighbours[node]
+
+	queue = [(priority(node, find_shortcuts(node)), node) for node in range(num_nodes)]
+	heapify(queue)
+
+	rank = numpy.zeros(num_nodes, dtype=numpy.int32)
+	upward: list[dict[int, tuple[float, int, int]]] = [{} for _ in range(num_nodes)]
+	order = 0
+
+	while queue:
+		_, node = heappop(queue)
+		shortcuts = find_shortcuts(node)
+
+		new_priority = priority(node, shortcuts)
+		if queue and new_priority > queue[0][0]:
+			heappush(queue, (new_priority, node))
+			continue
+
+		rank[node] = order
+		order += 1
+
+		# All remaining neighbours will be contracted later, so have a higher rank.
+		upward[node] = adjacency[node]
+		for neighbour in adjacency[node]:
+			del adjacency[neighbour][node]
+			deleted_neighbours[neighbour] += 1
+
+		for a, b, weight in shortcuts:
+			if b not in adjacency[a] or weight < adjacency[a][b][0]:
+				adjacency[a][b] = adjacency[b][a] = (weight, node, -1)
+
+		adjacency[node] = {}
+
+	up_indptr = numpy.zeros(num_nodes + 1, dtype=numpy.int64)
+	numpy.cumsum([len(edges) for edges in upward], out=up_indptr[1:])
+
+	edges = [(neighbour, *data) for node_edges in upward for neighbour, data in sorted(node_edges.items())]
+	up_indices, up_weights, up_middles, up_chains = zip(*edges) if edges else ((), (), (), ())
+
+	return ContractionHierarchy(
+			network,
+			rank=rank,
+			indptr=up_indptr,
+			indices=numpy.array(up_indices, dtype=numpy.int32),
+			weights=numpy.array(up_weights, dtype=numpy.float64),
+			middles=numpy.array(up_middles, dtype=numpy.int32),
+			chains=numpy.array(up_chains, dtype=numpy.int32),
+			)
+
+
+def save_hierarchy(hierarchy: ContractionHierarchy, directory: PathLike, source_hash: str) -> None:
+	"""
+	Write the contraction hierarchy to the given directory.
+
+	:param hierarchy:
+	:param directory:
+	:param source_hash: Hash of the data the network was built from, used to detect stale hierarchies.
+	"""
+
+	_write_arrays(directory, {name: getattr(hierarchy, name) for name in ContractionHierarchy._arrays}, source_hash)
+
+
+def load_hierarchy(
+		network: ContractedGraph,
+		directory: PathLike = "data.filtered.ch",
+		source_hash: Optional[str] = None,
+		) -> Optional[ContractionHierarchy]:
+	"""
+	Load a contraction hierarchy written by :func:`~.save_hierarchy`, if present.
+
+	The hierarchy is optional, and is not rebuilt automatically as it can take some time to build.
+
+	:param network: The network the hierarchy was built from.
+	:param directory:
+	:param source_hash: Hash of the data the network was built from. Defaults to that of the filtered watercourses data.
+
+	:returns: The contraction hierarchy, or :py:obj:`None` if it is missing, stale, or from a different version.
+	"""
+
+	if source_hash is None:
+		source_hash = _get_source_hash()
+
+	arrays = _read_arrays(directory, ContractionHierarchy._arrays, source_hash)
+	if arrays is None:
+		return None
+
+	return ContractionHierarchy(network, **arrays)
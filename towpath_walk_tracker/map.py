@@ -26,6 +26,9 @@ The map of watercourses and those which have been walked along.
 #  OR OTHER DEALINGS IN THE SOFTWARE.
 #
 
+# stdlib
+from typing import Union
+
 # 3rd party
 import folium
 from xyzservices.lib import TileProvider  # type: ignore[import-untyped]
@@ -37,11 +40,28 @@ from towpath_walk_tracker.folium import (
 		Sidebar,
 		WalkStartEnd,
 		WatercoursesGeoJson,
+		WatercoursesVectorTiles,
 		ZoomStateJS
 		)
+from towpath_walk_tracker.pyramid import ZOOM_BANDS
+from towpath_walk_tracker.tiles import MAX_ZOOM, TILE_ATTRIBUTION
+from towpath_walk_tracker.vector_tiles import MAX_TILE_ZOOM
 
 __all__ = ["create_map"]
 
+
+def _add_local_tile_layer(m: Map) -> None:
+	# Base map layer served from the local tile store, which also works offline for prefetched areas.
+
+	folium.TileLayer(
+			"/tiles/{z}/{x}/{y}.png",
+			name="Humanitarian (local)",
+			attr=TILE_ATTRIBUTION,
+			max_zoom=MAX_ZOOM,
+			show=False,
+			).add_to(m)
+
+
 tooltip_style: str = """
 background-color: #F0EFEF;
 border: 2px solid black;
@@ -55,6 +75,7 @@ def create_map(
 		watercourses_geojson_file: str,
 		map_centre: tuple[float, float] = (55, -2),
 		zoom_level: int = 6,
+		vector_tiles: bool = False,
 		) -> Map:
 	"""
 	Create a folium/leaflet map showing the given watersources.
@@ -62,26 +83,47 @@ def create_map(
 	:param watercourses_geojson_file:
 	:param map_centre: The default map centre position.
 	:param zoom_level: The default map zoom level.
+	:param vector_tiles: Draw the watercourses from the ``/watercourses/{z}/{x}/{y}.mvt`` vector tiles
+		rather than downloading ``watercourses_geojson_file`` up front.
 	"""
 
 	m = Map(map_centre, zoom_start=zoom_level, control_scale=True)
 	m._id = "canal_towpath_walking"
 	folium.TileLayer(TileProvider.from_qms("OpenTopoMap"), show=False).add_to(m)
+	_add_local_tile_layer(m)
 
 	ZoomStateJS().add_to(m)
 	Sidebar().add_to(m)
 
-	tooltip = GeoJsonTooltip(
-			fields=["id", "tags"],
-			aliases=["ID", ''],
-			localize=True,
-			sticky=True,
-			labels=True,
-			style=tooltip_style,
-			max_width=800,
-			)
-
-	g = WatercoursesGeoJson(watercourses_geojson_file, tooltip=tooltip).add_to(m)
+	g: Union[WatercoursesGeoJson, WatercoursesVectorTiles]
+	if vector_tiles:
+		g = WatercoursesVectorTiles(
+				"/watercourses/{z}/{x}/{y}.mvt",
+				tooltip_url="/api/feature/{id}/",
+				tooltip_style=tooltip_style,
+				max_zoom=MAX_ZOOM,
+				max_native_zoom=MAX_TILE_ZOOM,
+				)
+
+	else:
+		tooltip = GeoJsonTooltip(
+				fields=["id", "tags"],
+				url="/api/feature/{id}/",
+				aliases=["ID", ''],
+				localize=True,
+				sticky=True,
+				labels=True,
+				style=tooltip_style,
+				max_width=800,
+				)
+
+		g = WatercoursesGeoJson(
+				watercourses_geojson_file,
+				zoom_levels=[band.min_zoom for band in ZOOM_BANDS],
+				tooltip=tooltip,
+				)
+
+	g.add_to(m)
 
 	FeatureGroupWalkMarkers().add_to(m)
 	feature_group_walks = FeatureGroupWalks().add_to(m)
@@ -128,6 +170,7 @@ def create_basic_map() -> Map:
 	m = Map(control_scale=True)
 	m._id = "canal_towpath_walking"
 	folium.TileLayer(TileProvider.from_qms("OpenTopoMap"), show=False).add_to(m)
+	_add_local_tile_layer(m)
 
 	FeatureGroupWalkMarkers().add_to(m)
 	FeatureGroupCurrentWalk().add_to(m)
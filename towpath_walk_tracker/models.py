@@ -28,7 +28,7 @@ Database models.
 
 # stdlib
 import datetime
-from typing import Any, cast
+from typing import Any, Optional, cast
 
 # 3rd party
 from flask_sqlalchemy_lite import SQLAlchemy
@@ -37,9 +37,13 @@ from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, relationship
 
 # this package
 from towpath_walk_tracker.forms import PointForm, WalkForm
-from towpath_walk_tracker.route import Route
+from towpath_walk_tracker.route import Route, get_leg_pool
+from towpath_walk_tracker.thumbnail import thumbnail_key
 
-__all__ = ["Model", "Node", "Point", "Walk"]
+__all__ = ["THUMBNAIL_SIZE", "Model", "Node", "Point", "Walk"]
+
+#: The width and height of walk thumbnails, in pixels.
+THUMBNAIL_SIZE = 150
 
 
 class Model(DeclarativeBase):
@@ -70,6 +74,14 @@ class Walk(Model):
 	duration = Column(Integer, nullable=False, default=0)
 	notes = Column(Text, nullable=False)
 	colour = Column(String(6), nullable=False)  # hex colour
+	length = Column(Float, nullable=False, default=0)  # metres
+	node_count = Column(Integer, nullable=False, default=0)
+	min_latitude: Mapped[Optional[float]] = mapped_column(Float, nullable=True)
+	min_longitude: Mapped[Optional[float]] = mapped_column(Float, nullable=True)
+	max_latitude: Mapped[Optional[float]] = mapped_column(Float, nullable=True)
+	max_longitude: Mapped[Optional[float]] = mapped_column(Float, nullable=True)
+	pace: Mapped[Optional[float]] = mapped_column(Float, nullable=True)  # minutes per kilometre
+	thumbnail_key = Column(String(64), nullable=True)  # see towpath_walk_tracker.thumbnail.thumbnail_key
 	points: Mapped[list["Point"]] = relationship(back_populates="walk")
 	route: Mapped[list["Node"]] = relationship(secondary=association_table)
 
@@ -129,9 +141,10 @@ class Walk(Model):
 				point = Point(latitude=latitude, longitude=longitude, walk=walk)
 				points.append(point)
 
-		nodes, new_nodes = cls._calculate_route(db, points)
+		route, nodes, new_nodes = cls._calculate_route(db, points)
 
 		walk.route = nodes
+		walk._set_route_statistics(route)
 
 		db.session.add(walk)
 		db.session.add_all(points)
@@ -142,31 +155,83 @@ class Walk(Model):
 		return walk
 
 	@staticmethod
-	def _calculate_route(db: SQLAlchemy, points: list["Point"]) -> tuple[list["Node"], list["Node"]]:
+	def _calculate_route(db: SQLAlchemy, points: list["Point"]) -> tuple[Route, list["Node"], list["Node"]]:
 		# Recalculate route
 		coords = [(cast(float, point.latitude), cast(float, point.longitude)) for point in points]
-		route = Route.from_points(coords)
+		route = Route.from_points(coords, executor=get_leg_pool())
 
-		existing_nodes = {node.id: node for node in db.session.query(Node).where(Node.id.in_(route.nodes))}
+		node_ids = route.nodes
+		existing_nodes = {node.id: node for node in db.session.query(Node).where(Node.id.in_(node_ids))}
 
 		nodes = []  # Nodes in the walk, in order
 		new_nodes = []  # Nodes in the walk we have to create
 
-		for node_id in route.nodes:
+		for node_id, node_lat, node_lng in zip(node_ids, route.latitudes.tolist(), route.longitudes.tolist()):
 			if node_id in existing_nodes:
 				node = existing_nodes[node_id]
 			else:
-				node_lat, node_lng = route.node_coordinates[node_id]
 				node = Node(id=node_id, latitude=node_lat, longitude=node_lng)
+				existing_nodes[node_id] = node  # The route may pass through the same node more than once
 				new_nodes.append(node)
 
 			nodes.append(node)
 
-		return nodes, new_nodes
+		return route, nodes, new_nodes
 
-	def to_json(self) -> dict[str, Any]:
+	def _set_route_statistics(self, route: Route) -> None:
+		# Store the length, node count and bounding box of the route, and the pace of the walk.
+
+		self.length = cast(Column[float], route.length)
+		self.node_count = cast(Column[int], len(route))
+
+		if len(route):
+			min_lng, min_lat, max_lng, max_lat = route.bounds
+			self.min_latitude = min_lat
+			self.min_longitude = min_lng
+			self.max_latitude = max_lat
+			self.max_longitude = max_lng
+		else:
+			self.min_latitude = self.min_longitude = self.max_latitude = self.max_longitude = None
+
+		self._set_pace()
+		self._set_thumbnail_key(route)
+
+	def _set_thumbnail_key(self, route: Route) -> None:
+		# Identify the thumbnail for the route and the walk's colour.
+
+		self.thumbnail_key = cast(Column[str], thumbnail_key(route, '#' + cast(str, self.colour), THUMBNAIL_SIZE))
+
+	def _set_pace(self) -> None:
+		# Calculate the average pace, in minutes per kilometre, from the duration and length.
+
+		if self.length and self.duration:
+			self.pace = float(self.duration / (self.length / 1000))
+		else:
+			self.pace = None
+
+	def get_bounds(self) -> Optional[tuple[float, float, float, float]]:
+		"""
+		Returns the bounding box of the route, as ``(min_longitude, min_latitude, max_longitude, max_latitude)``.
+
+		Returns :py:obj:`None` if the walk has no route.
+		"""
+
+		if self.min_latitude is None:
+			return None
+
+		return (
+				cast(float, self.min_longitude),
+				cast(float, self.min_latitude),
+				cast(float, self.max_longitude),
+				cast(float, self.max_latitude),
+				)
+
+	def to_json(self, include_route: bool = True) -> dict[str, Any]:
 		"""
 		Return a JSON representation of the walk.
+
+		:param include_route: Whether to include the nodes of the route.
+			Excluding them avoids loading the route from the database.
 		"""
 
 		points = []
@@ -177,25 +242,34 @@ class Walk(Model):
 					"id": point.id,
 					})
 
-		route = []
-		for node in self.route:
-			route.append({
-					"latitude": node.latitude,
-					"longitude": node.longitude,
-					"id": node.id,
-					})
-
-		return {
+		data = {
 				"title": self.title,
 				"start": self.start,
 				"duration": self.duration,
 				"notes": self.notes,
 				"id": self.id,
 				"points": points,
-				"route": route,
 				"colour": '#' + self.colour,
+				"length": self.length,
+				"node_count": self.node_count,
+				"bounds": self.get_bounds(),
+				"pace": self.pace,
+				"thumbnail_key": self.thumbnail_key,
 				}
 
+		if include_route:
+			route = []
+			for node in self.route:
+				route.append({
+						"latitude": node.latitude,
+						"longitude": node.longitude,
+						"id": node.id,
+						})
+
+			data["route"] = route
+
+		return data
+
 	def update_from_form(self, db: SQLAlchemy, form: WalkForm) -> None:
 		"""
 		Update the walk model from a walk form.
@@ -211,6 +285,7 @@ class Walk(Model):
 		duration_mins = int(cast(str, form.duration_mins.data))
 		self.duration = cast(Column[int], duration_hours * 60 + duration_mins)
 		self.notes = cast(Column[str], form.notes.data)
+		colour_has_changed = self.colour != cast(str, form.colour.data)[1:]
 		self.colour = cast(Column[str], cast(str, form.colour.data)[1:])
 
 		new_points = []
@@ -251,9 +326,16 @@ class Walk(Model):
 
 		if points_have_changed:
 			# Recalculate route
-			nodes, new_nodes = self._calculate_route(db, points)
+			route, nodes, new_nodes = self._calculate_route(db, points)
 			self.route = nodes
+			self._set_route_statistics(route)
 			db.session.add_all(new_nodes)
+		else:
+			# The duration may have changed
+			self._set_pace()
+
+			if colour_has_changed:
+				self._set_thumbnail_key(self.get_route())
 
 		db.session.commit()
 
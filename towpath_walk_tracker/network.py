@@ -26,89 +26,985 @@ Model of the network of rivers and canals.
 #  OR OTHER DEALINGS IN THE SOFTWARE.
 #
 
+# stdlib
+import array
+import itertools
+import json
+import math
+import os
+import shutil
+from collections.abc import Iterable, Mapping
+from heapq import heappop, heappush
+from typing import TYPE_CHECKING, Any, Callable, NamedTuple, Optional, Union
+
 # 3rd party
-import networkx
+import numpy
+from domdf_python_tools.paths import PathPlus
+from domdf_python_tools.typing import PathLike
+from scipy.sparse import csr_array
+from scipy.sparse.csgraph import connected_components
 from scipy.spatial import KDTree
 
 # this package
-from towpath_walk_tracker.util import Coordinate
+from towpath_walk_tracker.util import (
+		EARTH_RADIUS,
+		Coordinate,
+		_get_source_hash,
+		_iter_filtered_watercourses,
+		haversine
+		)
 from towpath_walk_tracker.watercourses import FeatureCollection
 
-__all__ = ["build_kdtree", "build_network", "get_node_coordinates"]
+if TYPE_CHECKING:
+	# 3rd party
+	import networkx
+
+__all__ = [
+		"SNAPSHOT_VERSION",
+		"ContractedGraph",
+		"EdgePoint",
+		"RoutingGraph",
+		"build_kdtree",
+		"build_network",
+		"build_snapshot",
+		"contract_chains",
+		"get_node_coordinates",
+		"load_network",
+		"load_snapshot",
+		"save_snapshot",
+		]
+
+#: Version of the network snapshot format. Snapshots with a different version are rebuilt.
+SNAPSHOT_VERSION: int = 4
+
+
+class EdgePoint(NamedTuple):
+	"""
+	A point part way along the edge between two adjacent nodes in a :class:`~.RoutingGraph`.
+
+	Used as a virtual node when routing to or from points which don't coincide with a node.
+	"""
+
+	#: Index of the node at one end of the edge.
+	start: int
+
+	#: Index of the node at the other end of the edge.
+	end: int
+
+	#: How far along the edge from ``start`` to ``end`` the point is, between 0 and 1.
+	fraction: float
+
+
+def _distance_to(target_lat: float, target_lng: float) -> Callable[[float, float], float]:
+	# Returns a function giving the great-circle distance from a point to the target.
+	# Uses scalar maths rather than :func:`~.haversine` as it is evaluated for every node reached by a search.
+
+	target_lat, target_lng = math.radians(target_lat), math.radians(target_lng)
+	cos_target_lat = math.cos(target_lat)
+
+	def distance(lat: float, lng: float) -> float:
+		lat, lng = math.radians(lat), math.radians(lng)
+		a = math.sin((target_lat - lat) / 2)**2 + math.cos(lat) * cos_target_lat * math.sin((target_lng - lng) / 2)**2
+		return 2 * EARTH_RADIUS * math.asin(math.sqrt(min(a, 1.0)))
+
+	return distance
+
+
+class RoutingGraph:
+	"""
+	Compact, array-backed graph of paths through watercourses.
+
+	Nodes are stored in contiguous NumPy arrays, sorted by OpenStreetMap node ID,
+	and the adjacency is stored in compressed sparse row (CSR) form.
+	Nodes are addressed internally by their position in these arrays ("index");
+	use :meth:`~.RoutingGraph.index_of` to convert an OpenStreetMap node ID to an index.
+
+	:param node_ids: Sorted OpenStreetMap IDs of the nodes.
+	:param coordinates: ``(N, 2)`` array of latitude/longitude pairs, aligned with ``node_ids``.
+	:param indptr: CSR row pointers. The neighbours of node ``i`` are ``indices[indptr[i]:indptr[i + 1]]``.
+	:param indices: CSR column indices.
+	:param weights: Edge lengths in metres, aligned with ``indices``.
+	:param components: The connected component each node belongs to, aligned with ``node_ids``.
+	"""
+
+	__slots__ = ("node_ids", "coordinates", "indptr", "indices", "weights", "components")
+
+	# Names of the arrays written to network snapshots.
+	_arrays = __slots__
+
+	node_ids: numpy.ndarray
+	coordinates: numpy.ndarray
+	indptr: numpy.ndarray
+	indices: numpy.ndarray
+	weights: numpy.ndarray
+	components: numpy.ndarray
+
+	def __init__(
+			self,
+			node_ids: numpy.ndarray,
+			coordinates: numpy.ndarray,
+			indptr: numpy.ndarray,
+			indices: numpy.ndarray,
+			weights: numpy.ndarray,
+			components: numpy.ndarray,
+			):
+		self.node_ids = node_ids
+		self.coordinates = coordinates
+		self.indptr = indptr
+		self.indices = indices
+		self.weights = weights
+		self.components = components
+
+	def __len__(self) -> int:
+		return len(self.node_ids)
+
+	def __repr__(self) -> str:
+		return f"<{type(self).__name__}({len(self)} nodes, {self.num_edges} edges)>"
+
+	@property
+	def num_edges(self) -> int:
+		"""
+		The number of (undirected) edges in the graph.
+		"""
+
+		return len(self.indices) // 2
+
+	@classmethod
+	def from_edges(
+			cls,
+			node_ids: numpy.ndarray,
+			coordinates: numpy.ndarray,
+			edges: numpy.ndarray,
+			) -> "RoutingGraph":
+		"""
+		Construct a :class:`~.RoutingGraph` from arrays of nodes and edges.
+
+		Self-loops and duplicate edges are discarded.
+		Each edge is weighted by its great-circle length, and each node labelled with its connected component.
+
+		:param node_ids: OpenStreetMap IDs of the nodes. Need not be sorted, but must be unique.
+		:param coordinates: ``(N, 2)`` array of latitude/longitude pairs, aligned with ``node_ids``.
+		:param edges: ``(E, 2)`` array of pairs of OpenStreetMap node IDs.
+		"""
+
+		node_ids = numpy.asarray(node_ids, dtype=numpy.int64)
+		coordinates = numpy.asarray(coordinates, dtype=numpy.float64).reshape(-1, 2)
+		edges = numpy.asarray(edges, dtype=numpy.int64).reshape(-1, 2)
+
+		order = numpy.argsort(node_ids, kind="stable")
+		node_ids = numpy.ascontiguousarray(node_ids[order])
+		coordinates = numpy.ascontiguousarray(coordinates[order])
+
+		# Convert node IDs to indices, then normalise each edge to (low, high) so duplicates can be removed.
+		edge_idx = numpy.searchsorted(node_ids, edges)
+		edge_idx = edge_idx[edge_idx[:, 0] != edge_idx[:, 1]]
+		edge_idx.sort(axis=1)
+		edge_keys = numpy.unique(edge_idx[:, 0] * len(node_ids) + edge_idx[:, 1])
+		edge_idx = numpy.column_stack(numpy.divmod(edge_keys, len(node_ids)))
+
+		start, end = coordinates[edge_idx[:, 0]], coordinates[edge_idx[:, 1]]
+		lengths = haversine(start[:, 0], start[:, 1], end[:, 0], end[:, 1])
+
+		# Undirected, so store each edge in both directions.
+		sources = numpy.concatenate([edge_idx[:, 0], edge_idx[:, 1]])
+		targets = numpy.concatenate([edge_idx[:, 1], edge_idx[:, 0]])
+		order = numpy.lexsort((targets, sources))
+		sources = sources[order]
+		indices = numpy.ascontiguousarray(targets[order], dtype=numpy.int32)
+		weights = numpy.ascontiguousarray(numpy.concatenate([lengths, lengths])[order])
+
+		indptr = numpy.zeros(len(node_ids) + 1, dtype=numpy.int64)
+		numpy.cumsum(numpy.bincount(sources, minlength=len(node_ids)), out=indptr[1:])
+
+		adjacency = csr_array((weights, indices, indptr), shape=(len(node_ids), len(node_ids)))
+		_, components = connected_components(adjacency, directed=False)
+
+		return cls(node_ids, coordinates, indptr, indices, weights, components.astype(numpy.int32))
+
+	def index_of(self, node_id: int) -> int:
+		"""
+		Returns the index of the node with the given OpenStreetMap ID.
+
+		:param node_id:
+
+		:raises KeyError: If the node is not in the graph.
+		"""
+
+		idx = int(numpy.searchsorted(self.node_ids, node_id))
+		if idx >= len(self.node_ids) or self.node_ids[idx] != node_id:
+			raise KeyError(node_id)
+
+		return idx
+
+	def component_sizes(self) -> numpy.ndarray:
+		"""
+		Returns the number of nodes in the connected component of each node.
+		"""
+
+		return numpy.bincount(self.components)[self.components]
+
+	def degree(self) -> numpy.ndarray:
+		"""
+		Returns the number of neighbours of each node.
+		"""
+
+		return numpy.diff(self.indptr)
+
+	def neighbours(self, idx: int) -> numpy.ndarray:
+		"""
+		Returns the indices of the neighbours of the node at the given index.
+
+		:param idx:
+		"""
+
+		return self.indices[self.indptr[idx]:self.indptr[idx + 1]]
+
+	def shortest_path_indices(self, source: int, target: int) -> list[int]:
+		"""
+		Find the shortest path between the nodes with the given indices.
+
+		Uses A* search, with the great-circle distance to the target as the heuristic.
+
+		:param source:
+		:param target:
+
+		:returns: The indices of every node along the path, including ``source`` and ``target``.
+
+		:raises ValueError: If there is no path between the two nodes.
+		"""
+
+		indptr, indices, weights, coordinates = self.indptr, self.indices, self.weights, self.coordinates
+		heuristic = _distance_to(*coordinates[target].tolist())
+
+		distances: dict[int, float] = {source: 0.0}
+		previous: dict[int, int] = {}
+		visited: set[int] = set()
+		queue: list[tuple[float, int]] = [(heuristic(*coordinates[source].tolist()), source)]
+
+		while queue:
+			_, node = heappop(queue)
+			if node == target:
+				break
+			if node in visited:
+				continue
+			visited.add(node)
+			distance = distances[node]
+
+			start, end = int(indptr[node]), int(indptr[node + 1])
+			neighbours = indices[start:end]
+			for neighbour, weight, (lat, lng) in zip(
+				neighbours.tolist(),
+				weights[start:end].tolist(),
+				coordinates[neighbours].tolist(),
+				):
+				new_distance = distance + weight
+				if new_distance < distances.get(neighbour, math.inf):
+					distances[neighbour] = new_distance
+					previous[neighbour] = node
+					heappush(queue, (new_distance + heuristic(lat, lng), neighbour))
+		else:
+			raise ValueError(f"No path between nodes {self.node_ids[source]} and {self.node_ids[target]}")
+
+		path = [target]
+		while path[-1] != source:
+			path.append(previous[path[-1]])
+
+		path.reverse()
+		return path
+
+	def shortest_path(self, source: int, target: int) -> list[int]:
+		"""
+		Find the shortest path between the nodes with the given OpenStreetMap IDs.
+
+		:param source:
+		:param target:
+
+		:returns: The OpenStreetMap IDs of every node along the path, including ``source`` and ``target``.
+
+		:raises ValueError: If there is no path between the two nodes.
+		"""
+
+		path = self.shortest_path_indices(self.index_of(source), self.index_of(target))
+		return self.node_ids[path].tolist()
+
+	def to_csr_array(self) -> csr_array:
+		"""
+		Returns the weighted adjacency matrix as a :class:`scipy.sparse.csr_array`.
+
+		The array shares memory with the graph, and can be used with :mod:`scipy.sparse.csgraph`.
+		"""
+
+		return csr_array((self.weights, self.indices, self.indptr), shape=(len(self), len(self)))
+
+	def to_networkx(self) -> "networkx.Graph[int]":
+		"""
+		Export the graph as a :class:`networkx.Graph`.
+
+		Nodes are keyed by OpenStreetMap ID and have ``lat``, ``lng`` and ``id`` attributes.
+		Requires `networkx <https://networkx.org/>`_ to be installed.
+		"""
+
+		# 3rd party
+		import networkx
+
+		graph: "networkx.Graph[int]" = networkx.Graph()
+
+		node_ids = self.node_ids.tolist()
+		for node_id, (lat, lng) in zip(node_ids, self.coordinates.tolist()):
+			graph.add_node(node_id, lat=lat, lng=lng, id=node_id)
+
+		sources = numpy.repeat(self.node_ids, self.degree()).tolist()
+		targets = self.node_ids[self.indices].tolist()
+		for source, target, weight in zip(sources, targets, self.weights.tolist()):
+			graph.add_edge(source, target, weight=weight)
+
+		return graph
+
+
+class ContractedGraph:
+	"""
+	The routing graph with chains of degree-2 nodes collapsed into weighted super-edges.
+
+	Most nodes in the network are shape points along a single watercourse, with exactly two neighbours.
+	The remaining "core" nodes (junctions, dead ends, etc.) are joined by chains of these nodes,
+	which become single edges in a much smaller graph of core nodes.
+	Each chain keeps the list of nodes along it, so full paths can be reconstructed exactly.
+
+	Nodes are identified by their index in the full ``graph``;
+	core nodes are additionally numbered by their position in ``core``.
+
+	:param graph: The full routing graph.
+	:param core: Indices of the core nodes.
+	:param indptr: CSR row pointers for the graph of core nodes.
+	:param indices: CSR column indices (core node numbers).
+	:param weights: Length of each super-edge in metres, aligned with ``indices``.
+	:param edge_chains: The chain followed by each super-edge, aligned with ``indices``.
+	:param chain_indptr: The nodes along chain ``c`` are ``chain_nodes[chain_indptr[c]:chain_indptr[c + 1]]``.
+	:param chain_nodes: Indices of the nodes along each chain, including the core nodes at either end.
+	:param chain_offsets: Distance in metres of each node in ``chain_nodes`` from the start of its chain.
+	:param node_core: The core node number of each node in the full graph, or ``-1`` if it lies within a chain.
+	:param node_chain_positions: The position in ``chain_nodes`` of each node within a chain, or ``-1`` for core nodes.
+	"""
+
+	__slots__ = (
+			"core",
+			"indptr",
+			"indices",
+			"weights",
+			"edge_chains",
+			"chain_indptr",
+			"chain_nodes",
+			"chain_offsets",
+			"node_core",
+			"node_chain_positions",
+			"graph",
+			"_core_coordinates",
+			)
+
+	# Names of the arrays written to network snapshots.
+	_arrays = __slots__[:-2]
+
+	graph: RoutingGraph
+	core: numpy.ndarray
+	indptr: numpy.ndarray
+	indices: numpy.ndarray
+	weights: numpy.ndarray
+	edge_chains: numpy.ndarray
+	chain_indptr: numpy.ndarray
+	chain_nodes: numpy.ndarray
+	chain_offsets: numpy.ndarray
+	node_core: numpy.ndarray
+	node_chain_positions: numpy.ndarray
+
+	def __init__(
+			self,
+			graph: RoutingGraph,
+			core: numpy.ndarray,
+			indptr: numpy.ndarray,
+			indices: numpy.ndarray,
+			weights: numpy.ndarray,
+			edge_chains: numpy.ndarray,
+			chain_indptr: numpy.ndarray,
+			chain_nodes: numpy.ndarray,
+			chain_offsets: numpy.ndarray,
+			node_core: numpy.ndarray,
+			node_chain_positions: numpy.ndarray,
+			):
+		self.graph = graph
+		self.core = core
+		self.indptr = indptr
+		self.indices = indices
+		self.weights = weights
+		self.edge_chains = edge_chains
+		self.chain_indptr = chain_indptr
+		self.chain_nodes = chain_nodes
+		self.chain_offsets = chain_offsets
+		self.node_core = node_core
+		self.node_chain_positions = node_chain_positions
+		self._core_coordinates = graph.coordinates[core]
+
+	def __len__(self) -> int:
+		return len(self.core)
+
+	def __repr__(self) -> str:
+		return f"<{type(self).__name__}({len(self)} core nodes, {self.num_edges} edges, {self.graph!r})>"
+
+	@property
+	def num_edges(self) -> int:
+		"""
+		The number of (undirected) super-edges between core nodes.
+		"""
+
+		return len(self.indices) // 2
+
+	def _chain_of(self, position: int) -> int:
+		# Returns the chain containing the given position in ``chain_nodes``.
+		return int(numpy.searchsorted(self.chain_indptr, position, side="right")) - 1
+
+	def _chain_nodes(self, chain: int) -> tuple[list[int], list[float]]:
+		start, end = int(self.chain_indptr[chain]), int(self.chain_indptr[chain + 1])
+		return self.chain_nodes[start:end].tolist(), self.chain_offsets[start:end].tolist()
+
+	def _coordinates_of(self, point: Union[int, EdgePoint]) -> tuple[float, float]:
+		# Returns the latitude and longitude of a node or a point along an edge.
+
+		if isinstance(point, EdgePoint):
+			start, end = self.graph.coordinates[[point.start, point.end]]
+			return tuple((start + (end - start) * point.fraction).tolist())
+
+		return tuple(self.graph.coordinates[point].tolist())
+
+	def _describe(self, point: Union[int, EdgePoint]) -> str:
+		node_ids = self.graph.node_ids
+
+		if isinstance(point, EdgePoint):
+			return f"point between nodes {node_ids[point.start]} and {node_ids[point.end]}"
+
+		return f"node {node_ids[point]}"
+
+	def _locate(self, point: Union[int, EdgePoint]) -> Optional[tuple[int, int, int, float]]:
+		# Returns the chain a node or point along an edge lies within,
+		# the indices within the chain of the nodes either side of it (equal for nodes),
+		# and its distance along the chain.
+		# Returns :py:obj:`None` for core nodes.
+
+		if not isinstance(point, EdgePoint):
+			position = int(self.node_chain_positions[point])
+			if position == -1:
+				return None
+
+			chain = self._chain_of(position)
+			idx = position - int(self.chain_indptr[chain])
+			return chain, idx, idx, float(self.chain_offsets[position])
+
+		start_position = int(self.node_chain_positions[point.start])
+		end_position = int(self.node_chain_positions[point.end])
+
+		if start_position == -1 and end_position == -1:
+			# An edge directly between two core nodes, which forms a chain of its own.
+			start_core, end_core = int(self.node_core[point.start]), int(self.node_core[point.end])
+			row_start, row_end = int(self.indptr[start_core]), int(self.indptr[start_core + 1])
+			for neighbour, chain in zip(
+				self.indices[row_start:row_end].tolist(),
+				self.edge_chains[row_start:row_end].tolist(),
+				):
+				if neighbour == end_core and self.chain_indptr[chain + 1] - self.chain_indptr[chain] == 2:
+					break
+			else:
+				raise ValueError(f"No edge between {self._describe(point.start)} and {self._describe(point.end)}")
+
+			nodes, offsets = self._chain_nodes(chain)
+			before, after = sorted((nodes.index(point.start), nodes.index(point.end)))
+		else:
+			chain = self._chain_of(start_position if start_position != -1 else end_position)
+			nodes, offsets = self._chain_nodes(chain)
+			idx = (start_position if start_position != -1 else end_position) - int(self.chain_indptr[chain])
+
+			# Find which neighbour of the interior node is the other end of the edge.
+			other = point.end if start_position != -1 else point.start
+			if idx > 0 and nodes[idx - 1] == other:
+				before, after = idx - 1, idx
+			else:
+				before, after = idx, idx + 1
+
+		segment = offsets[after] - offsets[before]
+		if nodes[before] == point.start:
+			offset = offsets[before] + segment * point.fraction
+		else:
+			offset = offsets[before] + segment * (1 - point.fraction)
+
+		return chain, before, after, offset
 
+	def _attachments(self, point: Union[int, EdgePoint]) -> dict[int, tuple[float, list[int]]]:
+		# Returns the core nodes the given node or point along an edge is attached to,
+		# with the distance and the path from the point to each of them.
 
-def build_network(watercourses: FeatureCollection) -> "networkx.Graph[int]":
+		location = self._locate(point)
+		if location is None:
+			return {int(self.node_core[point]): (0.0, [point])}  # type: ignore[index,list-item]
+
+		chain, before, after, offset = location
+		nodes, offsets = self._chain_nodes(chain)
+
+		attachments = {int(self.node_core[nodes[0]]): (offset, nodes[before::-1])}
+
+		end_core = int(self.node_core[nodes[-1]])
+		to_end = (offsets[-1] - offset, nodes[after:])
+		if end_core not in attachments or to_end[0] < attachments[end_core][0]:
+			attachments[end_core] = to_end
+
+		return attachments
+
+	def _same_chain_path(
+			self,
+			source: Union[int, EdgePoint],
+			target: Union[int, EdgePoint],
+			) -> Optional[tuple[float, list[int]]]:
+		# Returns the distance and path directly along a chain, if both points lie within the same one.
+
+		source_location = self._locate(source)
+		target_location = self._locate(target)
+		if source_location is None or target_location is None:
+			return None
+
+		chain, source_before, source_after, source_offset = source_location
+		target_chain, target_before, target_after, target_offset = target_location
+		if chain != target_chain:
+			return None
+
+		start = int(self.chain_indptr[chain])
+		distance = abs(target_offset - source_offset)
+		if source_offset <= target_offset:
+			return distance, self.chain_nodes[start + source_after:start + target_before + 1].tolist()
+		else:
+			return distance, self.chain_nodes[start + target_after:start + source_before + 1][::-1].tolist()
+
+	def _expand_edge(self, chain: int, from_core: int) -> list[int]:
+		# Returns the nodes along the chain, starting after the given core node.
+
+		nodes, _ = self._chain_nodes(chain)
+		if nodes[0] == self.core[from_core]:
+			return nodes[1:]
+		else:
+			return nodes[-2::-1]
+
+	def shortest_path_indices(self, source: Union[int, EdgePoint], target: Union[int, EdgePoint]) -> list[int]:
+		"""
+		Find the shortest path between the given nodes or points along edges.
+
+		Uses A* search over the core nodes, with the great-circle distance to the target as the heuristic.
+		Nodes and points within chains are attached to the core nodes at either end of the chain.
+
+		:param source: The index of a node in the full graph, or a point along an edge.
+		:param target: The index of a node in the full graph, or a point along an edge.
+
+		:returns: The indices of every node along the path.
+			For nodes this includes ``source`` and ``target``; points along edges are not themselves included.
+
+		:raises ValueError: If there is no path between the two points.
+		"""
+
+		if source == target:
+			return [] if isinstance(source, EdgePoint) else [source]
+
+		indptr, indices, weights, edge_chains = self.indptr, self.indices, self.weights, self.edge_chains
+		core_coordinates = self._core_coordinates
+		heuristic = _distance_to(*self._coordinates_of(target))
+
+		sources = self._attachments(source)
+		targets = self._attachments(target)
+
+		best_distance = math.inf
+		best_core = -1
+		best_path: list[int] = []
+
+		direct = self._same_chain_path(source, target)
+		if direct is not None:
+			best_distance, best_path = direct
+
+		distances: dict[int, float] = {}
+		previous: dict[int, tuple[int, int]] = {}  # core node -> (previous core node, chain)
+		visited: set[int] = set()
+		queue: list[tuple[float, int]] = []
+
+		for core_number, (distance, _) in sources.items():
+			distances[core_number] = distance
+			heappush(queue, (distance + heuristic(*core_coordinates[core_number].tolist()), core_number))
+
+		while queue:
+			estimate, node = heappop(queue)
+			if estimate >= best_distance:
+				break
+			if node in visited:
+				continue
+			visited.add(node)
+			distance = distances[node]
+
+			if node in targets and distance + targets[node][0] < best_distance:
+				best_distance = distance + targets[node][0]
+				best_core = node
+
+			start, end = int(indptr[node]), int(indptr[node + 1])
+			neighbours = indices[start:end]
+			for neighbour, weight, chain, (lat, lng) in zip(
+				neighbours.tolist(),
+				weights[start:end].tolist(),
+				edge_chains[start:end].tolist(),
+				core_coordinates[neighbours].tolist(),
+				):
+				new_distance = distance + weight
+				if new_distance < distances.get(neighbour, math.inf):
+					distances[neighbour] = new_distance
+					previous[neighbour] = (node, chain)
+					heappush(queue, (new_distance + heuristic(lat, lng), neighbour))
+
+		if best_distance == math.inf:
+			raise ValueError(f"No path between {self._describe(source)} and {self._describe(target)}")
+
+		if best_core == -1:
+			return best_path
+
+		edges: list[tuple[int, int]] = []
+		node = best_core
+		while node in previous:
+			node, chain = previous[node]
+			edges.append((node, chain))
+
+		path = list(sources[node][1])
+		for from_core, chain in reversed(edges):
+			path.extend(self._expand_edge(chain, from_core))
+
+		path.extend(targets[best_core][1][-2::-1])
+
+		return path
+
+	def shortest_path(self, source: int, target: int) -> list[int]:
+		"""
+		Find the shortest path between the nodes with the given OpenStreetMap IDs.
+
+		:param source:
+		:param target:
+
+		:returns: The OpenStreetMap IDs of every node along the path, including ``source`` and ``target``.
+
+		:raises ValueError: If there is no path between the two nodes.
+		"""
+
+		graph = self.graph
+		path = self.shortest_path_indices(graph.index_of(source), graph.index_of(target))
+		return graph.node_ids[path].tolist()
+
+
+def contract_chains(graph: RoutingGraph) -> ContractedGraph:
+	"""
+	Collapse chains of degree-2 nodes in the graph into weighted super-edges.
+
+	:param graph:
+	"""
+
+	indptr: list[int] = graph.indptr.tolist()
+	indices: list[int] = graph.indices.tolist()
+	weights: list[float] = graph.weights.tolist()
+	is_core: list[bool] = (graph.degree() != 2).tolist()
+
+	node_chain_positions = [-1] * len(graph)
+	chain_nodes: list[int] = []
+	chain_offsets: list[float] = []
+	chain_indptr: list[int] = [0]
+	chain_ends: list[tuple[int, int]] = []
+	chain_lengths: list[float] = []
+
+	def walk(start: int, edge: int) -> None:
+		# Follow the chain leaving ``start`` along the given edge (position in ``indices``) until reaching a core node.
+
+		previous, node = start, indices[edge]
+		distance = weights[edge]
+		chain_nodes.append(start)
+		chain_offsets.append(0.0)
+
+		while not is_core[node]:
+			node_chain_positions[node] = len(chain_nodes)
+			chain_nodes.append(node)
+			chain_offsets.append(distance)
+
+			edge = indptr[node]
+			if indices[edge] == previous:
+				edge += 1
+
+			previous, node = node, indices[edge]
+			distance += weights[edge]
+
+		chain_nodes.append(node)
+		chain_offsets.append(distance)
+		chain_indptr.append(len(chain_nodes))
+		chain_ends.append((start, node))
+		chain_lengths.append(distance)
+
+	for node in range(len(graph)):
+		if not is_core[node]:
+			continue
+
+		for edge in range(indptr[node], indptr[node + 1]):
+			neighbour = indices[edge]
+			if is_core[neighbour]:
+				# Each direct edge between core nodes is seen from both ends.
+				if node < neighbour:
+					walk(node, edge)
+			elif node_chain_positions[neighbour] == -1:
+				walk(node, edge)
+
+	# Any remaining degree-2 nodes form closed loops with no core nodes; promote one node in each loop.
+	for node in range(len(graph)):
+		if not is_core[node] and node_chain_positions[node] == -1:
+			is_core[node] = True
+			walk(node, indptr[node])
+
+	core = numpy.flatnonzero(is_core)
+	node_core = numpy.full(len(graph), -1, dtype=numpy.int32)
+	node_core[core] = numpy.arange(len(core), dtype=numpy.int32)
+
+	ends = numpy.array(chain_ends, dtype=numpy.int64).reshape(-1, 2)
+	lengths = numpy.array(chain_lengths, dtype=numpy.float64)
+	chains = numpy.arange(len(lengths), dtype=numpy.int32)
+
+	# Chains which loop back to the same core node are never part of a shortest path between core nodes.
+	not_loop = ends[:, 0] != ends[:, 1]
+	ends, lengths, chains = node_core[ends[not_loop]], lengths[not_loop], chains[not_loop]
+
+	sources = numpy.concatenate([ends[:, 0], ends[:, 1]])
+	targets = numpy.concatenate([ends[:, 1], ends[:, 0]])
+	order = numpy.lexsort((targets, sources))
+
+	core_indptr = numpy.zeros(len(core) + 1, dtype=numpy.int64)
+	numpy.cumsum(numpy.bincount(sources, minlength=len(core)), out=core_indptr[1:])
+
+	return ContractedGraph(
+			graph,
+			core=core,
+			indptr=core_indptr,
+			indices=numpy.ascontiguousarray(targets[order], dtype=numpy.int32),
+			weights=numpy.ascontiguousarray(numpy.concatenate([lengths, lengths])[order]),
+			edge_chains=numpy.ascontiguousarray(numpy.concatenate([chains, chains])[order]),
+			chain_indptr=numpy.array(chain_indptr, dtype=numpy.int64),
+			chain_nodes=numpy.array(chain_nodes, dtype=numpy.int32),
+			chain_offsets=numpy.array(chain_offsets, dtype=numpy.float64),
+			node_core=node_core,
+			node_chain_positions=numpy.array(node_chain_positions, dtype=numpy.int64),
+			)
+
+
+def build_network(watercourses: Union[FeatureCollection, Iterable[dict[str, Any]]]) -> RoutingGraph:
 	"""
 	Construct a network of paths through the given watercourses.
 
-	:param watercourses:
+	:param watercourses: A feature collection, or an iterable of features
+		(which may be a generator, to avoid holding them all in memory at once).
+
+	:raises ValueError: If a node appears in more than one feature with different coordinates.
 	"""
 
-	graph: "networkx.Graph[int]" = networkx.Graph()
+	features = watercourses["features"] if isinstance(watercourses, Mapping) else watercourses
+
+	# Accumulate into flat typed arrays, so only one feature's Python objects are alive at a time.
+	node_buffer = array.array('q')
+	coordinate_buffer = array.array('d')
+	length_buffer = array.array('q')
+	is_polygon = array.array('b')
 
-	for wc in watercourses["features"]:
+	for wc in features:
 		# if wc["properties"]["type"] != "way":
 		# 	continue
 
 		nodes = wc["properties"]["nodes"]
 		coordinates = wc["geometry"]["coordinates"]
-		# graph.add_nodes_from(nodes)
 
 		if wc["geometry"]["type"] == "Polygon":  # vs LineString
-			previous_node = nodes[-1]
 			assert len(coordinates) == 1
 			coordinates = coordinates[0]
+			is_polygon.append(True)
 		else:
-			previous_node = None
+			is_polygon.append(False)
 
-		for node, coord in zip(nodes, coordinates):
-			assert len(coord) == 2
+		assert len(nodes) == len(coordinates)
+		node_buffer.extend(nodes)
+		coordinate_buffer.extend(itertools.chain.from_iterable(coordinates))
+		length_buffer.append(len(nodes))
 
-			if graph.has_node(node):
-				assert graph.nodes[node]["lat"] == coord[1]
-				assert graph.nodes[node]["lng"] == coord[0]
+	lengths = numpy.frombuffer(length_buffer, dtype=numpy.int64)
+	ends = numpy.cumsum(lengths)
+	starts = ends - lengths
+	num_nodes = int(ends[-1]) if len(ends) else 0
 
-			graph.add_node(node, lat=coord[1], lng=coord[0], id=node)
+	all_nodes = numpy.frombuffer(node_buffer, dtype=numpy.int64)
+	all_coordinates = numpy.frombuffer(coordinate_buffer, dtype=numpy.float64)
+	all_coordinates = all_coordinates.reshape(num_nodes, 2)[:, ::-1]  # lng/lat -> lat/lng
 
-		for node, coord in zip(nodes, coordinates):
-			coord = coord[::-1]
-			assert len(coord) == 2
+	node_ids, first_occurrence, inverse = numpy.unique(all_nodes, return_index=True, return_inverse=True)
+	coordinates = all_coordinates[first_occurrence]
 
-			# if node in node_coordinates:
-			# 	assert node_coordinates[node] == coord
-			# else:
-			# 	node_coordinates[node] = coord
+	inconsistent = numpy.flatnonzero((coordinates[inverse.reshape(-1)] != all_coordinates).any(axis=1))
+	if len(inconsistent):
+		raise ValueError(f"Nodes have inconsistent coordinates: {sorted(set(all_nodes[inconsistent].tolist()))}")
 
-			if previous_node is not None:
-				graph.add_edge(previous_node, node)
+	# Join consecutive nodes within each feature, and the last node of each polygon to its first.
+	within_feature = numpy.ones(max(num_nodes - 1, 0), dtype=bool)
+	within_feature[ends[(lengths > 0) & (ends < num_nodes)] - 1] = False
+	polygons = numpy.array(is_polygon, dtype=bool) & (lengths > 0)
 
-			previous_node = node
+	edges = numpy.concatenate([
+			numpy.column_stack([all_nodes[:-1][within_feature], all_nodes[1:][within_feature]]),
+			numpy.column_stack([all_nodes[ends[polygons] - 1], all_nodes[starts[polygons]]]),
+			])
 
-	return graph
+	return RoutingGraph.from_edges(node_ids, coordinates, edges)
 
 
-def get_node_coordinates(graph: networkx.Graph) -> dict[int, Coordinate]:
+def get_node_coordinates(graph: RoutingGraph) -> dict[int, Coordinate]:
 	"""
 	Returns a mapping of nodes in the graph and their coordinates on the map.
 
 	:param graph:
 	"""
 
-	node_coordinates = {}
+	return {
+			node_id: Coordinate(lat, lng)
+			for node_id, (lat, lng) in zip(graph.node_ids.tolist(), graph.coordinates.tolist())
+			}
 
-	for node_id, node_data in graph.nodes.items():
-		node_coordinates[node_id] = Coordinate(node_data["lat"], node_data["lng"])
 
-	return node_coordinates
-
-
-def build_kdtree(graph: networkx.Graph) -> KDTree:
+def build_kdtree(graph: RoutingGraph) -> KDTree:
 	"""
 	Construct a KDTree for finding the closest node to certain coordinates.
 
+	The indices returned by the tree are node indices in the graph.
+
 	:param graph:
 	"""
 
-	node_coordinates = get_node_coordinates(graph)
-	tree = KDTree(list(node_coordinates.values()))
-	return tree
+	return KDTree(graph.coordinates)
+
+
+def _write_arrays(directory: PathLike, arrays: dict[str, numpy.ndarray], source_hash: str) -> None:
+	# Write each array as a ``.npy`` file, alongside a metadata file giving the version and source hash.
+	# The directory is replaced atomically, so workers never see a partially written snapshot.
+
+	directory = PathPlus(directory)
+	tmp_directory = directory.with_name(f"{directory.name}.tmp-{os.getpid()}")
+	tmp_directory.maybe_make(parents=True)
+
+	for name, values in arrays.items():
+		numpy.save(tmp_directory / f"{name}.npy", values)
+
+	(tmp_directory / "meta.json").dump_json({"version": SNAPSHOT_VERSION, "source_hash": source_hash})
+
+	old_directory: Optional[PathPlus] = None
+	if directory.exists():
+		old_directory = directory.with_name(f"{directory.name}.old-{os.getpid()}")
+		directory.rename(old_directory)
+
+	tmp_directory.rename(directory)
+
+	if old_directory is not None:
+		shutil.rmtree(old_directory)
+
+
+def _read_arrays(
+		directory: PathLike,
+		names: Iterable[str],
+		source_hash: Optional[str] = None,
+		) -> Optional[dict[str, numpy.ndarray]]:
+	# Memory-map the arrays written by :func:`~._write_arrays`.
+	# Returns :py:obj:`None` if the snapshot is missing, stale, or from a different version.
+
+	directory = PathPlus(directory)
+
+	try:
+		meta = json.loads((directory / "meta.json").read_text())
+	except (FileNotFoundError, json.JSONDecodeError):
+		return None
+
+	if meta.get("version") != SNAPSHOT_VERSION:
+		return None
+	if source_hash is not None and meta.get("source_hash") != source_hash:
+		return None
+
+	arrays: dict[str, numpy.ndarray] = {}
+	for name in names:
+		try:
+			arrays[name] = numpy.load(directory / f"{name}.npy", mmap_mode='r').view(numpy.ndarray)
+		except FileNotFoundError:
+			return None
+
+	return arrays
+
+
+def save_snapshot(network: ContractedGraph, directory: PathLike, source_hash: str) -> None:
+	"""
+	Write a binary snapshot of the routing network to the given directory.
+
+	Each array of the full and contracted graphs is written as a ``.npy`` file,
+	so it can be memory-mapped by :func:`~.load_snapshot`.
+	The directory is replaced atomically, so workers never see a partially written snapshot.
+
+	:param network:
+	:param directory:
+	:param source_hash: Hash of the data the network was built from, used to detect stale snapshots.
+	"""
+
+	arrays = {f"graph.{name}": getattr(network.graph, name) for name in RoutingGraph._arrays}
+	arrays.update({f"contracted.{name}": getattr(network, name) for name in ContractedGraph._arrays})
+	_write_arrays(directory, arrays, source_hash)
+
+
+def load_snapshot(directory: PathLike, source_hash: Optional[str] = None) -> Optional[ContractedGraph]:
+	"""
+	Load a routing network from a snapshot written by :func:`~.save_snapshot`.
+
+	The arrays are memory-mapped (read only) rather than read into memory.
+
+	:param directory:
+	:param source_hash: If given, the snapshot is only loaded if it was built from data with this hash.
+
+	:returns: The contracted routing network, or :py:obj:`None` if the snapshot is missing, stale,
+		or from a different version.
+	"""
+
+	names = [f"graph.{name}" for name in RoutingGraph._arrays]
+	names.extend(f"contracted.{name}" for name in ContractedGraph._arrays)
+
+	arrays = _read_arrays(directory, names, source_hash)
+	if arrays is None:
+		return None
+
+	graph = RoutingGraph(**{name: arrays[f"graph.{name}"] for name in RoutingGraph._arrays})
+	return ContractedGraph(graph, **{name: arrays[f"contracted.{name}"] for name in ContractedGraph._arrays})
+
+
+def build_snapshot(directory: PathLike = "data.filtered.network") -> ContractedGraph:
+	"""
+	Build the routing network for the filtered watercourses data and write a snapshot of it.
+
+	:param directory: The directory to write the snapshot to.
+	"""
+
+	source_hash = _get_source_hash()
+	network = contract_chains(build_network(_iter_filtered_watercourses()))
+	save_snapshot(network, directory, source_hash)
+	return network
+
+
+def load_network(directory: PathLike = "data.filtered.network") -> ContractedGraph:
+	"""
+	Returns the routing network for the filtered watercourses data.
+
+	The network is loaded from the snapshot in the given directory if it is up to date,
+	otherwise it is rebuilt and a new snapshot written.
+
+	:param directory: The snapshot directory.
+	"""
+
+	network = load_snapshot(directory, _get_source_hash())
+	if network is None:
+		network = build_snapshot(directory)
+
+	return network
@@ -0,0 +1,380 @@
+#!/usr/bin/env python3
+#
+#  pyramid.py
+"""
+Simplified geometries of the watercourses for lower zoom levels.
+"""
+#
+#  Copyright © 2025 Dominic Davis-Foster <dominic@davis-foster.co.uk>
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to deal
+#  in the Software without restriction, including without limitation the rights
+#  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#  copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in all
+#  copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+#  EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+#  MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+#  IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM,
+#  DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR
+#  OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE
+#  OR OTHER DEALINGS IN THE SOFTWARE.
+#
+
+# stdlib
+import gzip
+import hashlib
+import json
+import math
+import os
+import shutil
+from collections.abc import Iterable, Iterator
+from functools import lru_cache
+from typing import Any, NamedTuple, Optional
+
+# 3rd party
+import brotli  # type: ignore[import-untyped]
+import numpy
+import shapely
+from domdf_python_tools.paths import PathPlus
+from domdf_python_tools.typing import PathLike
+
+# this package
+from towpath_walk_tracker.topology import DEFAULT_PRECISION, encode_topology
+from towpath_walk_tracker.util import (
+		WEB_MERCATOR_RADIUS,
+		_geojson_to_web_mercator,
+		_get_filtered_watercourses,
+		_get_source_hash,
+		_iter_filtered_watercourses,
+		_web_mercator_to_geojson
+		)
+from towpath_walk_tracker.watercourses import (
+		FeatureCollection,
+		iter_features,
+		slim_features,
+		write_feature_collection
+		)
+
+__all__ = [
+		"PRECOMPRESSED_ENCODINGS",
+		"PYRAMID_MAX_ZOOM",
+		"PYRAMID_VERSION",
+		"PyramidFile",
+		"StalePyramidError",
+		"ZOOM_BANDS",
+		"ZoomBand",
+		"build_pyramid",
+		"get_pyramid_file",
+		"get_pyramid_fingerprint",
+		"get_pyramid_level",
+		"simplify_features",
+		"zoom_band",
+		]
+
+#: Incremented whenever :func:`~.simplify_features` changes its output, so existing pyramids are treated as out of date.
+PYRAMID_VERSION: int = 3
+
+#: The highest zoom level of the last band of the pyramid.
+#: This is independent of the base map's zoom levels; higher zoom levels also use the last band.
+PYRAMID_MAX_ZOOM: int = 19
+
+#: The content encodings each file of the pyramid is precompressed with, in order of preference,
+#: mapped to the extension added to the compressed file's name.
+PRECOMPRESSED_ENCODINGS: dict[str, str] = {"br": ".br", "gzip": ".gz"}
+
+#: Decimal places kept in simplified coordinates (roughly 10cm).
+_PRECISION = 6
+
+
+def _pixel_size(zoom: int) -> float:
+	# The width of a 256px tile's pixel at the given zoom level, in Web Mercator metres.
+
+	return 2 * math.pi * WEB_MERCATOR_RADIUS / (256 << zoom)
+
+
+#: The length of a degree of longitude in Web Mercator metres.
+#: Degrees of latitude are always longer, so this gives a conservative conversion from metres to degrees.
+_METRES_PER_DEGREE = math.pi * WEB_MERCATOR_RADIUS / 180
+
+
+class ZoomBand(NamedTuple):
+	"""
+	A range of zoom levels which share a level of the geometry pyramid.
+	"""
+
+	#: The lowest zoom level in the band.
+	min_zoom: int
+
+	#: The highest zoom level in the band.
+	max_zoom: int
+
+	#: The simplification tolerance, in Web Mercator metres, or :py:obj:`None` for the full resolution geometry.
+	tolerance: Optional[float]
+
+	@property
+	def name(self) -> str:
+		"""
+		The name of the level's file within the pyramid directory.
+		"""
+
+		return f"z{self.min_zoom}-{self.max_zoom}"
+
+	@property
+	def precision(self) -> float:
+		"""
+		The spacing of the quantization grid for the level's TopoJSON, in degrees.
+
+		This is half the simplification tolerance, or :data:`~.DEFAULT_PRECISION` for the full resolution geometry.
+		"""
+
+		if self.tolerance is None:
+			return DEFAULT_PRECISION
+
+		return self.tolerance / 2 / _METRES_PER_DEGREE
+
+
+#: The levels of the pyramid, each simplified to half a pixel at its highest zoom level.
+#: Only the last level has the full resolution geometry, and the node IDs used for routing.
+ZOOM_BANDS: tuple[ZoomBand, ...] = (
+		ZoomBand(0, 7, _pixel_size(7) / 2),
+		ZoomBand(8, 10, _pixel_size(10) / 2),
+		ZoomBand(11, 13, _pixel_size(13) / 2),
+		ZoomBand(14, PYRAMID_MAX_ZOOM, None),
+		)
+
+
+def zoom_band(zoom: int) -> ZoomBand:
+	"""
+	Returns the band of :data:`~.ZOOM_BANDS` containing the given zoom level.
+
+	Zoom levels beyond either end are treated as the lowest or highest band.
+
+	:param zoom:
+	"""
+
+	for band in ZOOM_BANDS:
+		if zoom <= band.max_zoom:
+			return band
+
+	return ZOOM_BANDS[-1]
+
+
+def simplify_features(features: Iterable[dict[str, Any]], tolerance: float) -> Iterator[dict[str, Any]]:
+	"""
+	Simplify the geometry of the given GeoJSON features, one feature at a time.
+
+	Uses the topology-preserving Douglas–Peucker simplification in Web Mercator,
+	so lines never cross themselves and polygons remain valid.
+	The ``nodes`` property is removed, as the remaining coordinates no longer match the nodes.
+
+	:param features:
+	:param tolerance: The maximum distance the simplified geometry may deviate from the original, in Web Mercator metres.
+	"""
+
+	for feature in features:
+		geometry = shapely.transform(shapely.geometry.shape(feature["geometry"]), _geojson_to_web_mercator)
+		geometry = shapely.simplify(geometry, tolerance, preserve_topology=True)
+		geometry = shapely.transform(
+				geometry,
+				lambda coordinates: numpy.round(_web_mercator_to_geojson(coordinates), _PRECISION),
+				)
+
+		properties = dict(feature["properties"])
+		properties.pop("nodes", None)
+
+		yield {**feature, "geometry": shapely.geometry.mapping(geometry), "properties": properties}
+
+
+def _precompress(filename: PathPlus) -> str:
+	# Write gzip and brotli compressed copies of the file alongside it, and return the hash of its content.
+
+	content = filename.read_bytes()
+
+	compressed = {
+			"br": brotli.compress(content, quality=11),
+			"gzip": gzip.compress(content, compresslevel=9, mtime=0),
+			}
+	for encoding, extension in PRECOMPRESSED_ENCODINGS.items():
+		filename.with_name(filename.name + extension).write_bytes(compressed[encoding])
+
+	return hashlib.sha256(content).hexdigest()
+
+
+def build_pyramid(directory: PathLike = "data.filtered.pyramid") -> None:
+	"""
+	Write the levels of the pyramid for the filtered watercourses data.
+
+	Each level is written as a GeoJSON file named after the band, a slim GeoJSON file with only the ID of each feature,
+	and a quantized TopoJSON file, along with gzip and brotli compressed copies of each.
+	The hashes of the files' content are recorded in ``meta.json``.
+	The directory is replaced atomically, so the server never sees a partially written pyramid.
+
+	:param directory:
+	"""
+
+	source_hash = _get_source_hash()
+
+	directory = PathPlus(directory)
+	tmp_directory = directory.with_name(f"{directory.name}.tmp-{os.getpid()}")
+	tmp_directory.maybe_make(parents=True)
+
+	for band in ZOOM_BANDS:
+		features = _iter_filtered_watercourses()
+		if band.tolerance is not None:
+			features = simplify_features(features, band.tolerance)
+
+		filename = tmp_directory / f"{band.name}.geojson"
+		write_feature_collection(features, filename)
+		write_feature_collection(slim_features(iter_features(filename)), tmp_directory / f"{band.name}.slim.geojson")
+
+		topology = encode_topology(iter_features(filename), precision=band.precision)
+		(tmp_directory / f"{band.name}.topojson").write_text(json.dumps(topology, separators=(',', ':')))
+
+	content_hashes = {filename.name: _precompress(filename) for filename in sorted(tmp_directory.iterdir())}
+	fingerprint = hashlib.sha256(json.dumps(content_hashes, sort_keys=True).encode("UTF-8")).hexdigest()
+
+	(tmp_directory / "meta.json").dump_json({
+			"version": PYRAMID_VERSION,
+			"source_hash": source_hash,
+			"fingerprint": fingerprint,
+			"content_hashes": content_hashes,
+			})
+
+	old_directory: Optional[PathPlus] = None
+	if directory.exists():
+		old_directory = directory.with_name(f"{directory.name}.old-{os.getpid()}")
+		directory.rename(old_directory)
+
+	tmp_directory.rename(directory)
+
+	if old_directory is not None:
+		shutil.rmtree(old_directory)
+
+
+class StalePyramidError(RuntimeError):
+	"""
+	Raised when the pyramid is missing, or was built by another version or from other data.
+
+	The pyramid is not rebuilt automatically, as that is slow.
+	Rebuild it with ``python -m towpath_walk_tracker build-pyramid``.
+	"""
+
+
+def _pyramid_is_current(directory: PathLike = "data.filtered.pyramid") -> bool:
+	# Returns whether the pyramid in the directory was built by this version from the current data.
+
+	try:
+		_load_meta(directory)
+	except StalePyramidError:
+		return False
+
+	return True
+
+
+@lru_cache(maxsize=4)
+def _read_meta(filename: str, mtime_ns: int) -> dict[str, Any]:
+	# Keyed on the modification time, so the metadata is read again once the pyramid is rebuilt.
+
+	return PathPlus(filename).load_json()
+
+
+def _load_meta(directory: PathLike) -> dict[str, Any]:
+	# Returns the metadata of the pyramid in the directory, checking it is current.
+
+	filename = PathPlus(directory) / "meta.json"
+
+	try:
+		meta = _read_meta(str(filename), filename.stat().st_mtime_ns)
+	except (FileNotFoundError, json.JSONDecodeError):
+		raise StalePyramidError(f"No pyramid has been built in {directory}") from None
+
+	if meta.get("version") != PYRAMID_VERSION or meta.get("source_hash") != _get_source_hash():
+		raise StalePyramidError(f"The pyramid in {directory} is out of date")
+
+	return meta
+
+
+@lru_cache(maxsize=len(ZOOM_BANDS))
+def _read_level(filename: str, mtime_ns: int) -> FeatureCollection:
+	# Keyed on the modification time, so the level is read again once the pyramid is rebuilt.
+
+	return {"type": "FeatureCollection", "features": list(iter_features(filename))}
+
+
+def get_pyramid_level(zoom: int, directory: PathLike = "data.filtered.pyramid") -> FeatureCollection:
+	"""
+	Returns the filtered watercourses data, simplified for display at the given zoom level.
+
+	At the highest zoom levels this is the full resolution data, including node IDs.
+
+	:param zoom:
+	:param directory: The directory containing the pyramid.
+
+	:raises StalePyramidError: If the pyramid is missing or out of date.
+	"""
+
+	band = zoom_band(zoom)
+	if band.tolerance is None:
+		return _get_filtered_watercourses()
+
+	_load_meta(directory)
+	filename = PathPlus(directory) / f"{band.name}.geojson"
+	return _read_level(str(filename), filename.stat().st_mtime_ns)
+
+
+class PyramidFile(NamedTuple):
+	"""
+	A file within the pyramid.
+	"""
+
+	#: The path to the uncompressed file.
+	path: PathPlus
+
+	#: The SHA-256 hash of the uncompressed file's content.
+	content_hash: str
+
+	def compressed(self, encoding: str) -> PathPlus:
+		"""
+		Returns the path to the copy of the file compressed with the given content encoding.
+
+		:param encoding: One of the keys of :data:`~.PRECOMPRESSED_ENCODINGS`.
+		"""
+
+		return self.path.with_name(self.path.name + PRECOMPRESSED_ENCODINGS[encoding])
+
+
+def get_pyramid_file(
+		zoom: int,
+		extension: str = ".geojson",
+		directory: PathLike = "data.filtered.pyramid",
+		) -> PyramidFile:
+	"""
+	Returns the file of the pyramid for display at the given zoom level.
+
+	:param zoom:
+	:param extension: The type of file: ``.geojson``, ``.slim.geojson`` (only the ID of each watercourse), or ``.topojson``.
+	:param directory: The directory containing the pyramid.
+
+	:raises StalePyramidError: If the pyramid is missing or out of date.
+	"""
+
+	name = f"{zoom_band(zoom).name}{extension}"
+	return PyramidFile(PathPlus(directory) / name, _load_meta(directory)["content_hashes"][name])
+
+
+def get_pyramid_fingerprint(directory: PathLike = "data.filtered.pyramid") -> str:
+	"""
+	Returns a hash identifying the content of every file in the pyramid.
+
+	:param directory: The directory containing the pyramid.
+
+	:raises StalePyramidError: If the pyramid is missing or out of date.
+	"""
+
+	return _load_meta(directory)["fingerprint"]
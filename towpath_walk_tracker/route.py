@@ -27,52 +27,432 @@ Functions for finding a route through two or more points.
 #
 
 # stdlib
+import sys
+import threading
+from collections import OrderedDict
+from concurrent.futures import Executor, ProcessPoolExecutor
 from dataclasses import dataclass
 from functools import lru_cache
-from typing import TYPE_CHECKING, Literal, Union, cast
+from typing import TYPE_CHECKING, Literal, NamedTuple, Optional, Union, cast
 
 # 3rd party
 import contextily  # type: ignore[import-untyped]
 import geopandas  # type: ignore[import-untyped]
 import matplotlib
-import networkx
+import numpy
+import shapely
 from geopandas.plotting import GeoplotAccessor  # type: ignore[import-untyped]
 from matplotlib.axes import Axes
 from matplotlib.figure import Figure
-from networkx import all_shortest_paths
-from scipy.spatial import KDTree
+from numpy.typing import ArrayLike
 from shapely.geometry import LineString
 
 # this package
-from towpath_walk_tracker.network import build_kdtree, build_network, get_node_coordinates
-from towpath_walk_tracker.util import Coordinate, _get_filtered_watercourses
+from towpath_walk_tracker.hierarchy import ContractionHierarchy, load_hierarchy
+from towpath_walk_tracker.network import ContractedGraph, EdgePoint, load_network
+from towpath_walk_tracker.snapping import SegmentIndex
+from towpath_walk_tracker.util import Coordinate, _get_source_hash, encode_polyline, haversine
 
 if TYPE_CHECKING:
 	# this package
 	from towpath_walk_tracker.models import Node
 
-__all__ = ["Route"]
+__all__ = [
+		"DisconnectedPointsError",
+		"LegCache",
+		"LegCacheInfo",
+		"Route",
+		"RoutingIndex",
+		"get_leg_pool",
+		"get_routing_index",
+		"leg_cache",
+		]
+
+
+class DisconnectedPointsError(ValueError):
+	"""
+	Raised when consecutive points of a route lie on parts of the network which are not connected.
+
+	:param legs: The indices of the start and end points of each leg which cannot be routed.
+	"""
+
+	def __init__(self, legs: list[tuple[int, int]]):
+		self.legs: list[tuple[int, int]] = legs
+		super().__init__("No route between points " + ", ".join(f"{start} and {end}" for start, end in legs))
+
+
+# Network version, source and target.
+_LegKey = tuple[str, Union[int, EdgePoint], Union[int, EdgePoint]]
+
+
+class LegCacheInfo(NamedTuple):
+	"""
+	Statistics about a :class:`~.LegCache`.
+	"""
+
+	#: The number of lookups which found a cached leg.
+	hits: int
+
+	#: The number of lookups which did not find a cached leg.
+	misses: int
+
+	#: The number of legs in the cache.
+	entries: int
+
+	#: The approximate size of the cached legs, in bytes.
+	size: int
+
+	#: The maximum size of the cached legs, in bytes.
+	max_size: int
+
+
+class LegCache:
+	"""
+	Least-recently-used cache of shortest paths between pairs of snapped points.
+
+	Entries are keyed by the source, target and network version,
+	so editing one point of a walk only requires the legs either side of it to be recalculated.
+
+	:param max_size: The maximum size of the cached legs, in bytes.
+		The least recently used legs are evicted once this is exceeded.
+	"""
+
+	def __init__(self, max_size: int = 64 * 1024 * 1024):
+		self.max_size: int = max_size
+		self.hits: int = 0
+		self.misses: int = 0
+		self._size: int = 0
+		self._legs: OrderedDict[_LegKey, numpy.ndarray] = OrderedDict()
+		self._lock = threading.Lock()
+
+	def __len__(self) -> int:
+		return len(self._legs)
+
+	def __repr__(self) -> str:
+		return f"<{type(self).__name__}({self.info()})>"
+
+	def get(
+			self,
+			version: str,
+			source: Union[int, EdgePoint],
+			target: Union[int, EdgePoint],
+			) -> Optional[numpy.ndarray]:
+		"""
+		Returns the cached path between the given points, or :py:obj:`None` if it isn't cached.
+
+		:param version: The version of the network the path was found in.
+		:param source:
+		:param target:
+		"""
+
+		key = (version, source, target)
+
+		with self._lock:
+			path = self._legs.get(key)
+			if path is None:
+				self.misses += 1
+			else:
+				self.hits += 1
+				self._legs.move_to_end(key)
+
+		return path
+
+	def put(
+			self,
+			version: str,
+			source: Union[int, EdgePoint],
+			target: Union[int, EdgePoint],
+			path: numpy.ndarray,
+			) -> None:
+		"""
+		Add the path between the given points to the cache.
+
+		:param version: The version of the network the path was found in.
+		:param source:
+		:param target:
+		:param path: The indices of the nodes along the path.
+		"""
+
+		key = (version, source, target)
+		size = sys.getsizeof(path)
+		if size > self.max_size:
+			return
+
+		with self._lock:
+			if key in self._legs:
+				self._size -= sys.getsizeof(self._legs.pop(key))
+
+			self._legs[key] = path
+			self._size += size
+
+			while self._size > self.max_size:
+				self._size -= sys.getsizeof(self._legs.popitem(last=False)[1])
+
+	def info(self) -> LegCacheInfo:
+		"""
+		Returns the hit and miss counts and the current size of the cache.
+		"""
+
+		with self._lock:
+			return LegCacheInfo(self.hits, self.misses, len(self._legs), self._size, self.max_size)
+
+	def clear(self) -> None:
+		"""
+		Remove all legs from the cache and reset the statistics.
+		"""
+
+		with self._lock:
+			self._legs.clear()
+			self._size = self.hits = self.misses = 0
+
+
+# The fewest uncached legs worth solving in parallel.
+_MIN_PARALLEL_LEGS = 4
+
+#: The cache of legs used by :meth:`RoutingIndex.shortest_path_indices`.
+leg_cache = LegCache()
+
+
+def _read_only(array: numpy.ndarray) -> numpy.ndarray:
+	# Make the array read-only, copying it first if it is a view of another array.
+
+	if array.base is not None:
+		array = array.copy()
+
+	array.flags.writeable = False
+	return array
+
+
+def _node_of(point: Union[int, EdgePoint]) -> int:
+	# Returns the node, or the node at the start of the edge for points along edges.
+
+	return point.start if isinstance(point, EdgePoint) else point
+
+
+@dataclass(frozen=True)
+class RoutingIndex:
+	"""
+	The routing network, and the arrays and spatial index used to snap points to it.
+
+	The arrays are shared with the (memory-mapped) network and aligned with each other,
+	so a node index from a shortest path can be used directly with any of them.
+	"""
+
+	#: The shortest path engine; the contraction hierarchy if one is available.
+	router: Union[ContractedGraph, ContractionHierarchy]
+
+	#: OpenStreetMap IDs of the nodes.
+	node_ids: numpy.ndarray
+
+	#: ``(N, 2)`` array of latitude/longitude pairs of the nodes.
+	coordinates: numpy.ndarray
+
+	#: The connected component of each node.
+	components: numpy.ndarray
+
+	#: Spatial index over the segments of the network, for finding the segment closest to a point.
+	segments: SegmentIndex
+
+	#: Identifies the data the network was built from, so cached legs from other versions aren't reused.
+	version: str
+
+	@classmethod
+	def from_network(cls, network: ContractedGraph, version: Optional[str] = None) -> "RoutingIndex":
+		"""
+		Construct a :class:`~.RoutingIndex` for the given network.
+
+		The contraction hierarchy is used for queries if one has been built for this data.
+
+		:param network:
+		:param version: Hash of the data the network was built from. Defaults to that of the filtered watercourses data.
+		"""
+
+		if version is None:
+			version = _get_source_hash()
+
+		graph = network.graph
+		router: Union[ContractedGraph, ContractionHierarchy] = load_hierarchy(network, source_hash=version) or network
+
+		return cls(
+				router=router,
+				node_ids=graph.node_ids,
+				coordinates=graph.coordinates,
+				components=graph.components,
+				segments=SegmentIndex.from_network(network),
+				version=version,
+				)
+
+	def shortest_path_indices(self, source: Union[int, EdgePoint], target: Union[int, EdgePoint]) -> numpy.ndarray:
+		"""
+		Find the shortest path between the given nodes or points along edges, using the :data:`~.leg_cache`.
+
+		:param source: The index of a node, or a point along an edge.
+		:param target: The index of a node, or a point along an edge.
+
+		:returns: The indices of every node along the path, as a read-only array.
+
+		:raises ValueError: If there is no path between the two points.
+		"""
+
+		path = leg_cache.get(self.version, source, target)
+		if path is None:
+			path = numpy.array(self.router.shortest_path_indices(source, target), dtype=numpy.int32)
+			path.flags.writeable = False
+			leg_cache.put(self.version, source, target, path)
+
+		return path
+
+	def solve_legs(
+			self,
+			points: list[Union[int, EdgePoint]],
+			executor: Optional[Executor] = None,
+			) -> list[numpy.ndarray]:
+		"""
+		Find the shortest path between each pair of consecutive points, using the :data:`~.leg_cache`.
+
+		:param points: The indices of nodes, or points along edges.
+		:param executor: If given, legs which aren't cached are solved in parallel using this executor
+			(unless there are only a few, when the overhead isn't worthwhile).
+			Process pool workers load the routing index themselves, sharing the memory-mapped network.
+
+		:returns: The path for each leg, as read-only arrays.
+
+		:raises ValueError: If there is no path between a pair of points.
+		"""
+
+		legs = list(zip(points[:-1], points[1:]))
+		paths = [leg_cache.get(self.version, source, target) for source, target in legs]
+		missing = [idx for idx, path in enumerate(paths) if path is None]
+
+		if executor is None or len(missing) < _MIN_PARALLEL_LEGS:
+			solved = [self.router.shortest_path_indices(*legs[idx]) for idx in missing]
+		else:
+			solved = list(executor.map(_solve_leg, *zip(*(legs[idx] for idx in missing))))
+
+		for idx, leg_path in zip(missing, solved):
+			path = numpy.array(leg_path, dtype=numpy.int32)
+			path.flags.writeable = False
+			leg_cache.put(self.version, *legs[idx], path)
+			paths[idx] = path
+
+		return cast(list[numpy.ndarray], paths)
+
+	def snap(
+			self,
+			points: list[tuple[float, float]],
+			snap_to_component: bool = False,
+			) -> list[Union[int, EdgePoint]]:
+		"""
+		Returns the point along the nearest segment of the network to each of the given points.
+
+		Points which coincide with a node are given as the index of the node.
+
+		:param points:
+		:param snap_to_component: If a point is nearest to a part of the network not connected to the previous point,
+			snap it to the nearest segment which is connected instead.
+
+		:raises DisconnectedPointsError: If consecutive points are nearest to parts of the network
+			which are not connected (and ``snap_to_component`` is :py:obj:`False`).
+		"""
+
+		point_array = numpy.asarray(points, dtype=numpy.float64).reshape(-1, 2)
+		snapped = self.segments.snap(point_array)
+
+		components = self.components[[_node_of(point) for point in snapped]]
+		disconnected = numpy.flatnonzero(components[:-1] != components[1:])
+		if len(disconnected):
+			if not snap_to_component:
+				raise DisconnectedPointsError([(idx, idx + 1) for idx in disconnected.tolist()])
+
+			for idx in range(1, len(snapped)):
+				component = self.components[_node_of(snapped[idx - 1])]
+				if self.components[_node_of(snapped[idx])] != component:
+					snapped[idx] = self.segments.snap_within_component(point_array[idx], component)
+
+		return snapped
 
 
 @lru_cache
-def _get_network_and_tree() -> tuple["networkx.Graph[int]", KDTree]:
-	watercourses = _get_filtered_watercourses()
-	G = build_network(watercourses)
-	tree = build_kdtree(G)
-	return G, tree
+def get_routing_index() -> RoutingIndex:
+	"""
+	Returns the :class:`~.RoutingIndex` for the filtered watercourses data.
+	"""
+
+	return RoutingIndex.from_network(load_network())
+
+
+@lru_cache
+def get_leg_pool() -> ProcessPoolExecutor:
+	"""
+	Returns a process pool for solving the legs of long routes in parallel.
+
+	The pool has one worker per CPU, each with its own (memory-mapped) :class:`~.RoutingIndex`.
+	"""
+
+	return ProcessPoolExecutor(initializer=get_routing_index)
+
+
+def _solve_leg(source: Union[int, EdgePoint], target: Union[int, EdgePoint]) -> list[int]:
+	# Solve a single leg in a worker.
+
+	return get_routing_index().router.shortest_path_indices(source, target)
 
 
-@dataclass
 class Route:
 	"""
 	Represents a route constructed through two or more points.
+
+	:param ids: OpenStreetMap IDs of every node along the route.
+	:param latitudes: Latitude of every node along the route.
+	:param longitudes: Longitude of every node along the route.
 	"""
 
-	# IDs of every node along the route.
-	nodes: list[int]
+	__slots__ = ("ids", "latitudes", "longitudes", "_linestring", "_length")
+
+	#: OpenStreetMap IDs of every node along the route.
+	ids: numpy.ndarray
+
+	#: Latitude of every node along the route.
+	latitudes: numpy.ndarray
+
+	#: Longitude of every node along the route.
+	longitudes: numpy.ndarray
+
+	_linestring: Optional[LineString]
+	_length: Optional[float]
+
+	def __init__(self, ids: ArrayLike, latitudes: ArrayLike, longitudes: ArrayLike):
+		self.ids = _read_only(numpy.asarray(ids, dtype=numpy.int64))
+		self.latitudes = _read_only(numpy.asarray(latitudes, dtype=numpy.float64))
+		self.longitudes = _read_only(numpy.asarray(longitudes, dtype=numpy.float64))
+		self._linestring = None
+		self._length = None
 
-	# Mapping of IDs to lat/lng coordinates.
-	node_coordinates: dict[int, Coordinate]
+		if not (len(self.ids) == len(self.latitudes) == len(self.longitudes)):
+			raise ValueError("'ids', 'latitudes' and 'longitudes' must be the same length")
+
+	def __len__(self) -> int:
+		return len(self.ids)
+
+	def __repr__(self) -> str:
+		return f"<{type(self).__name__}({len(self)} nodes)>"
+
+	def __eq__(self, other: object) -> bool:
+		if not isinstance(other, Route):
+			return NotImplemented
+
+		return (
+				numpy.array_equal(self.ids, other.ids) and numpy.array_equal(self.latitudes, other.latitudes)
+				and numpy.array_equal(self.longitudes, other.longitudes)
+				)
+
+	@property
+	def nodes(self) -> list[int]:
+		"""
+		Returns the IDs of the nodes, in order.
+		"""
+
+		return self.ids.tolist()
 
 	@property
 	def coordinates(self) -> list[Coordinate]:
@@ -80,11 +460,29 @@ class Route:
 		Returns the coordinates of the nodes, in order.
 		"""
 
-		coords: list[Coordinate] = []
-		for path_node in self.nodes:
-			coords.append(self.node_coordinates[path_node])
+		return list(map(Coordinate._make, zip(self.latitudes.tolist(), self.longitudes.tolist())))
+
+	@property
+	def bounds(self) -> tuple[float, float, float, float]:
+		"""
+		Returns the bounding box of the route, as ``(min_longitude, min_latitude, max_longitude, max_latitude)``.
+
+		The order matches shapely's :attr:`~shapely.geometry.base.BaseGeometry.bounds`.
+		"""
 
-		return coords
+		return self.to_linestring().bounds
+
+	@property
+	def length(self) -> float:
+		"""
+		Returns the length of the route in metres, following the great circle between consecutive nodes.
+		"""
+
+		if self._length is None:
+			lats, lngs = self.latitudes, self.longitudes
+			self._length = float(haversine(lats[:-1], lngs[:-1], lats[1:], lngs[1:]).sum())
+
+		return self._length
 
 	@classmethod
 	def from_db(cls, nodes: list["Node"]) -> "Route":
@@ -94,13 +492,11 @@ class Route:
 		:param nodes:
 		"""
 
-		node_coordinates = {}
-		node_ids = []
-		for node in nodes:
-			node_ids.append(node.id)
-			node_coordinates[node.id] = Coordinate(cast(float, node.latitude), cast(float, node.longitude))
-
-		return cls(node_ids, node_coordinates)
+		return cls(
+				numpy.fromiter((node.id for node in nodes), dtype=numpy.int64, count=len(nodes)),
+				numpy.fromiter((node.latitude for node in nodes), dtype=numpy.float64, count=len(nodes)),
+				numpy.fromiter((node.longitude for node in nodes), dtype=numpy.float64, count=len(nodes)),
+				)
 
 	@classmethod
 	def from_json_dict(cls, data: list[dict[str, float]]) -> "Route":
@@ -110,52 +506,114 @@ class Route:
 		:param data:
 		"""
 
-		node_coordinates = {}
-		node_ids: list[int] = []
-		for node in data:
-			node_id = cast(int, node["id"])
-			node_ids.append(node_id)
-			coord = Coordinate(cast(float, node["latitude"]), cast(float, node["longitude"]))
-			node_coordinates[node_id] = coord
+		return cls(
+				numpy.fromiter((node["id"] for node in data), dtype=numpy.int64, count=len(data)),
+				numpy.fromiter((node["latitude"] for node in data), dtype=numpy.float64, count=len(data)),
+				numpy.fromiter((node["longitude"] for node in data), dtype=numpy.float64, count=len(data)),
+				)
 
-		return cls(node_ids, node_coordinates)
+	def to_json_dict(self) -> list[dict[str, float]]:
+		"""
+		Returns a JSON representation of the route, in the form read by :meth:`~.Route.from_json_dict`.
+		"""
+
+		return [{"latitude": lat, "longitude": lng, "id": node_id} for node_id, lat, lng in zip(
+				self.ids.tolist(),
+				self.latitudes.tolist(),
+				self.longitudes.tolist(),
+				)]
+
+	@classmethod
+	def from_linestring(cls, linestring: LineString, ids: ArrayLike) -> "Route":
+		"""
+		Construct a :class:`~.Route` from a shapely :class:`~shapely.geometry.LineString` in longitude/latitude order.
+
+		:param linestring:
+		:param ids: OpenStreetMap IDs of the nodes at each vertex of the linestring.
+		"""
+
+		coordinates = shapely.get_coordinates(linestring)
+		route = cls(ids, coordinates[:, 1], coordinates[:, 0])
+		route._linestring = linestring
+		return route
+
+	def to_polyline(self, precision: int = 5) -> str:
+		"""
+		Returns the route's coordinates in Google's encoded polyline format.
+
+		:param precision: The number of decimal places to retain.
+		"""
+
+		return encode_polyline(self.latitudes, self.longitudes, precision)
 
 	def to_linestring(self) -> LineString:
 		"""
 		Create a shapely :class:`~shapely.geometry.LineString` for the route.
+
+		The linestring is created the first time this is called, and reused subsequently.
 		"""
 
-		route: list[tuple[float, float]] = [(r.longitude, r.latitude) for r in self.coordinates]
-		return LineString(route)
+		if self._linestring is None:
+			self._linestring = LineString(numpy.column_stack([self.longitudes, self.latitudes]))
+
+		return self._linestring
 
 	@classmethod
-	def from_points(cls, points: list[tuple[float, float]]) -> "Route":
+	def from_points(
+			cls,
+			points: list[tuple[float, float]],
+			snap_to_component: bool = False,
+			executor: Optional[Executor] = None,
+			) -> "Route":
 		"""
 		Construct a route from a list of coordinates the route must pass through.
 
-		:param points:
-		"""
-
-		G, tree = _get_network_and_tree()
+		Each point is snapped to the nearest point along a segment of the network,
+		and consecutive points joined by the shortest path along the network.
+		The route runs between the nodes either side of the first and last points.
 
-		node_coordinates = get_node_coordinates(G)
-		nckl = list(node_coordinates.keys())
+		:param points:
+		:param snap_to_component: If a point is nearest to a part of the network not connected to the previous point,
+			snap it to the nearest segment which is connected instead.
+		:param executor: If given, the legs between points are solved in parallel using this executor
+			(for example :func:`~.get_leg_pool`).
 
-		point_data: list[tuple[tuple[float, float], float, int, int]] = []
-		node_dist: float
-		node_idx: int
-		for coord in points:
-			coord = cast(tuple[float, float], coord)
-			node_dist, node_idx = cast(tuple[float, int], tree.query(coord))
-			node = nckl[node_idx]
-			point_data.append((coord, node_dist, node_idx, node))
+		:raises DisconnectedPointsError: If consecutive points are nearest to parts of the network
+			which are not connected (and ``snap_to_component`` is :py:obj:`False`).
+		"""
 
-		# solve path from 1st node to 2nd node to... nth node
-		path: list[int] = []
-		for orig, dest in zip(point_data[:-1], point_data[1:]):
-			path = path[:-1] + next(all_shortest_paths(G, orig[3], dest[3]))
+		index = get_routing_index()
+		snapped = index.snap(points, snap_to_component)
+
+		# solve path from 1st point to 2nd point to... nth point
+		parts: list[numpy.ndarray] = []
+		last_node = -1
+		for leg in index.solve_legs(snapped, executor):
+			if not len(leg):
+				continue
+
+			# Consecutive legs share a node unless the point between them lies part way along a segment.
+			parts.append(leg[1:] if leg[0] == last_node else leg)
+			last_node = leg[-1]
+
+		if parts:
+			# Extend the route to the nodes beyond the first and last points, where they lie part way along a segment.
+			first, last = snapped[0], snapped[-1]
+			if isinstance(first, EdgePoint):
+				parts.insert(0, numpy.array([first.end if parts[0][0] == first.start else first.start]))
+			if isinstance(last, EdgePoint):
+				parts.append(numpy.array([last.end if parts[-1][-1] == last.start else last.start]))
+
+			path = numpy.concatenate(parts)
+		elif len(snapped) > 1:
+			# Every point lies along the same segment.
+			first = cast(EdgePoint, snapped[0])
+			path = numpy.array([first.start, first.end])
+		else:
+			path = numpy.array([], dtype=numpy.int32)
 
-		return cls(path, node_coordinates)
+		coordinates = index.coordinates[path]
+		return cls(index.node_ids[path], coordinates[:, 0], coordinates[:, 1])
 
 	def plot_thumbnail(
 			self,
@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+#
+#  snapping.py
+"""
+Snapping of points to the nearest segment of the routing network.
+"""
+#
+#  Copyright © 2025 Dominic Davis-Foster <dominic@davis-foster.co.uk>
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to deal
+#  in the Software without restriction, including without limitation the rights
+#  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#  copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in all
+#  copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+#  EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+#  MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+#  IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM,
+#  DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR
+#  OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE
+#  OR OTHER DEALINGS IN THE SOFTWARE.
+#
+
+# stdlib
+from typing import Union
+
+# 3rd party
+import numpy
+import shapely
+from shapely import STRtree
+
+# this package
+from towpath_walk_tracker.network import ContractedGraph, EdgePoint
+from towpath_walk_tracker.util import to_web_mercator
+
+__all__ = ["SegmentIndex"]
+
+#: Points projecting within this distance (in projected metres) of a node are snapped to the node itself.
+NODE_TOLERANCE: float = 0.01
+
+
+class SegmentIndex:
+	"""
+	Spatial index over the segments of the routing network, for snapping points to the nearest segment.
+
+	Each chain of the contracted network is indexed as a single linestring in Web Mercator,
+	so the nearest segment is found by (locally) metric distance rather than distance in degrees.
+
+	:param network:
+	:param lines: Linestring for each chain, in Web Mercator.
+	:param cumulative_lengths: Cumulative projected length of the segments of all chains, aligned with ``network.chain_nodes``.
+		The distance of a node along its chain is found by subtracting the value for the first node of the chain.
+	"""
+
+	__slots__ = ("network", "lines", "cumulative_lengths", "tree", "_chain_components")
+
+	network: ContractedGraph
+	lines: numpy.ndarray
+	cumulative_lengths: numpy.ndarray
+	tree: STRtree
+
+	def __init__(self, network: ContractedGraph, lines: numpy.ndarray, cumulative_lengths: numpy.ndarray):
+		self.network = network
+		self.lines = lines
+		self.cumulative_lengths = cumulative_lengths
+		self.tree = STRtree(lines)
+		self._chain_components = network.graph.components[network.chain_nodes[network.chain_indptr[:-1]]]
+
+	def __len__(self) -> int:
+		return len(self.lines)
+
+	def __repr__(self) -> str:
+		return f"<{type(self).__name__}({len(self)} chains)>"
+
+	@classmethod
+	def from_network(cls, network: ContractedGraph) -> "SegmentIndex":
+		"""
+		Construct a :class:`~.SegmentIndex` over the chains of the given network.
+
+		:param network:
+		"""
+
+		x, y = to_web_mercator(network.graph.coordinates[:, 0], network.graph.coordinates[:, 1])
+		chain_x, chain_y = x[network.chain_nodes], y[network.chain_nodes]
+
+		chain_lengths = numpy.diff(network.chain_indptr)
+		chain_numbers = numpy.repeat(numpy.arange(len(chain_lengths)), chain_lengths)
+		lines = shapely.linestrings(chain_x, chain_y, indices=chain_numbers)
+
+		# The gap from the end of one chain to the start of the next is excluded, so the lengths stay monotonic
+		# and each chain's span can be searched independently.
+		segment_lengths = numpy.hypot(numpy.diff(chain_x), numpy.diff(chain_y))
+		segment_lengths[network.chain_indptr[1:-1] - 1] = 0
+		cumulative_lengths = numpy.concatenate([[0.0], numpy.cumsum(segment_lengths)])
+
+		return cls(network, lines, cumulative_lengths)
+
+	def snap(self, points: numpy.ndarray) -> list[Union[int, EdgePoint]]:
+		"""
+		Returns the point along the nearest segment of the network for each of the given points.
+
+		Where that point coincides with a node the index of the node is returned instead.
+
+		:param points: ``(N, 2)`` array of latitude/longitude pairs.
+		"""
+
+		points = numpy.asarray(points, dtype=numpy.float64).reshape(-1, 2)
+		geometries = numpy.asarray(shapely.points(*to_web_mercator(points[:, 0], points[:, 1])))
+		chains = self.tree.query_nearest(geometries, all_matches=False)[1]
+
+		return self._locate(geometries, chains)
+
+	def snap_within_component(self, point: numpy.ndarray, component: int) -> Union[int, EdgePoint]:
+		"""
+		Returns the point along the nearest segment of the network within the given connected component.
+
+		:param point: Latitude and longitude of the point.
+		:param component:
+		"""
+
+		geometry = shapely.points(*to_web_mercator(point[0], point[1]))
+		candidates = numpy.flatnonzero(self._chain_components == component)
+		chain = candidates[numpy.argmin(shapely.distance(geometry, self.lines[candidates]))]
+
+		return self._locate(numpy.atleast_1d(geometry), numpy.atleast_1d(chain))[0]
+
+	def _locate(self, geometries: numpy.ndarray, chains: numpy.ndarray) -> list[Union[int, EdgePoint]]:
+		# Returns the projection of each point onto the segment of the given chain it is closest to.
+
+		network = self.network
+		distances = shapely.line_locate_point(self.lines[chains], geometries)
+
+		chain_starts = network.chain_indptr[chains]
+		chain_ends = network.chain_indptr[chains + 1]
+		targets = self.cumulative_lengths[chain_starts] + distances
+
+		# Find the segment containing each projection, clamped to the segments of its own chain.
+		positions = numpy.searchsorted(self.cumulative_lengths, targets, side="right") - 1
+		positions = numpy.clip(positions, chain_starts, chain_ends - 2)
+
+		segment_lengths = self.cumulative_lengths[positions + 1] - self.cumulative_lengths[positions]
+		along = targets - self.cumulative_lengths[positions]
+		fractions = numpy.clip(
+				numpy.divide(along, segment_lengths, out=numpy.zeros_like(along), where=segment_lengths > 0),
+				0,
+				1,
+				)
+
+		starts = network.chain_nodes[positions].tolist()
+		ends = network.chain_nodes[positions + 1].tolist()
+		at_start = (along <= NODE_TOLERANCE).tolist()
+		at_end = (segment_lengths - along <= NODE_TOLERANCE).tolist()
+
+		snapped: list[Union[int, EdgePoint]] = []
+		for start, end, fraction, is_start, is_end in zip(starts, ends, fractions.tolist(), at_start, at_end):
+			if is_start:
+				snapped.append(start)
+			elif is_end:
+				snapped.append(end)
+			else:
+				snapped.append(EdgePoint(start, end, fraction))
+
+		return snapped
@@ -18760,7 +18760,8 @@ function setupNavbarTitleScroll() {
 "use strict";
 __webpack_require__.r(__webpack_exports__);
 /* harmony export */ __webpack_require__.d(__webpack_exports__, {
-/* harmony export */   checkForLatLngMistakes: () => (/* binding */ checkForLatLngMistakes)
+/* harmony export */   checkForLatLngMistakes: () => (/* binding */ checkForLatLngMistakes),
+/* harmony export */   decodePolyline: () => (/* binding */ decodePolyline)
 /* harmony export */ });
 function checkForLatLngMistakes(value) {
     // Check haven't tried to treat L.latLng as array or array as L.latLng
@@ -18769,6 +18770,30 @@ function checkForLatLngMistakes(value) {
     }
     return value;
 }
+// Decode a route in Google's encoded polyline format into latitude/longitude pairs.
+// https://developers.google.com/maps/documentation/utilities/polylinealgorithm
+function decodePolyline(encoded, precision = 5) {
+    const factor = Math.pow(10, precision);
+    const coords = [];
+    const values = [0, 0];
+    let index = 0;
+    while (index < encoded.length) {
+        for (let i = 0; i < 2; i++) {
+            let shift = 0;
+            let result = 0;
+            let byte;
+            do {
+                byte = encoded.charCodeAt(index++) - 63;
+                // Multiply rather than shift, as values can exceed 32 bits.
+                result += (byte & 0x1f) * Math.pow(2, shift);
+                shift += 5;
+            } while (byte >= 0x20);
+            values[i] += (result % 2 === 1) ? -(result + 1) / 2 : result / 2;
+        }
+        coords.push([values[0] / factor, values[1] / factor]);
+    }
+    return coords;
+}
 
 
 /***/ }),
@@ -18789,6 +18814,15 @@ __webpack_require__.r(__webpack_exports__);
 /* harmony import */ var leaflet__WEBPACK_IMPORTED_MODULE_0__ = __webpack_require__(/*! leaflet */ "./node_modules/leaflet/dist/leaflet-src.js");
 /* harmony import */ var leaflet__WEBPACK_IMPORTED_MODULE_0___default = /*#__PURE__*/__webpack_require__.n(leaflet__WEBPACK_IMPORTED_MODULE_0__);
 /* harmony import */ var _util__WEBPACK_IMPORTED_MODULE_1__ = __webpack_require__(/*! ./util */ "./src/core/util.ts");
+var __awaiter = (undefined && undefined.__awaiter) || function (thisArg, _arguments, P, generator) {
+    function adopt(value) { return value instanceof P ? value : new P(function (resolve) { resolve(value); }); }
+    return new (P || (P = Promise))(function (resolve, reject) {
+        function fulfilled(value) { try { step(generator.next(value)); } catch (e) { reject(e); } }
+        function rejected(value) { try { step(generator["throw"](value)); } catch (e) { reject(e); } }
+        function step(result) { result.done ? resolve(result.value) : adopt(result.value).then(fulfilled, rejected); }
+        step((generator = generator.apply(thisArg, _arguments || [])).next());
+    });
+};
 var __classPrivateFieldGet = (undefined && undefined.__classPrivateFieldGet) || function (receiver, state, kind, f) {
     if (kind === "a" && !f) throw new TypeError("Private accessor was defined without a getter");
     if (typeof state === "function" ? receiver !== state || !f : !state.has(receiver)) throw new TypeError("Cannot read private member from an object whose class did not declare it");
@@ -18827,10 +18861,17 @@ class LeafletWalkPreview {
             fetch('/get-route/', {
                 signal: this.abortController.signal,
                 method: 'POST',
-                headers: { 'Content-Type': 'application/json' },
+                headers: { 'Content-Type': 'application/json', Accept: 'application/vnd.google.polyline' },
                 body: JSON.stringify(placedMarkerLatLng)
             })
-                .then(res => res.json())
+                .then((res) => __awaiter(this, void 0, void 0, function* () {
+                if (!res.ok) {
+                    // e.g. 422 when points are on parts of the network which aren't connected
+                    const error = yield res.json();
+                    throw new Error(error.message);
+                }
+                return (0,_util__WEBPACK_IMPORTED_MODULE_1__.decodePolyline)(yield res.text()).map(([lat, lng]) => leaflet__WEBPACK_IMPORTED_MODULE_0__.latLng(lat, lng));
+            }))
                 .then((coords) => {
                 currentWalkLayer.clearLayers();
                 this.polyLineWalk = drawWalk(coords, currentWalkLayer, '#ff0000', false);
@@ -18887,6 +18928,10 @@ class LeafletWalkPreview {
         // @ts-expect-error  // Doesn't think `feature` exists, but it does for layers of GeoJSON
         // See https://github.com/DefinitelyTyped/DefinitelyTyped/issues/44293
         const coordinatesArray = watercourses.getLayers().map(l => l.feature.geometry.coordinates);
+        if (coordinatesArray.length === 0) {
+            // The watercourses are drawn from vector tiles; the server snaps the point when routing instead.
+            return leaflet__WEBPACK_IMPORTED_MODULE_0__.latLng(lat, lng);
+        }
         const closestLatLng = leaflet__WEBPACK_IMPORTED_MODULE_0__.GeometryUtil.closest(map_canal_towpath_walking, coordinatesArray, [lng, lat]);
         return leaflet__WEBPACK_IMPORTED_MODULE_0__.latLng(closestLatLng.lng, closestLatLng.lat);
     }
@@ -19273,6 +19318,7 @@ function setupWalkFormValidation(formsToValidate, walkForm) {
 __webpack_require__.r(__webpack_exports__);
 /* harmony export */ __webpack_require__.d(__webpack_exports__, {
 /* harmony export */   addWatercoursesGeoJson: () => (/* binding */ addWatercoursesGeoJson),
+/* harmony export */   topologyToGeoJSON: () => (/* binding */ topologyToGeoJSON),
 /* harmony export */   watercoursesZoomOnClick: () => (/* binding */ watercoursesZoomOnClick)
 /* harmony export */ });
 function watercoursesZoomOnClick(feature, layer) {
@@ -19291,7 +19337,76 @@ function watercoursesZoomOnClick(feature, layer) {
         }
     });
 }
+// Convert a quantized TopoJSON topology into a GeoJSON FeatureCollection of the geometries in each of its objects.
+function topologyToGeoJSON(topology) {
+    const [scaleX, scaleY] = topology.transform.scale;
+    const [translateX, translateY] = topology.transform.translate;
+    const transformPosition = (position) => [
+        position[0] * scaleX + translateX,
+        position[1] * scaleY + translateY
+    ];
+    // Undo the delta encoding of each arc, then the quantization.
+    const arcs = topology.arcs.map((arc) => {
+        let x = 0;
+        let y = 0;
+        return arc.map((delta) => {
+            x += delta[0];
+            y += delta[1];
+            return transformPosition([x, y]);
+        });
+    });
+    // Join arcs into a line, dropping the position each arc shares with the previous one.
+    // Negative indices (the one's complement) refer to an arc in reverse.
+    const stitch = (indices) => {
+        const line = [];
+        indices.forEach((index, i) => {
+            const arc = index < 0 ? arcs[~index].slice().reverse() : arcs[index];
+            line.push(...(i === 0 ? arc : arc.slice(1)));
+        });
+        return line;
+    };
+    const toGeometry = (geometry) => {
+        switch (geometry.type) {
+            case 'Point':
+                return { type: 'Point', coordinates: transformPosition(geometry.coordinates) };
+            case 'MultiPoint':
+                return { type: 'MultiPoint', coordinates: geometry.coordinates.map(transformPosition) };
+            case 'LineString':
+                return { type: 'LineString', coordinates: stitch(geometry.arcs) };
+            case 'MultiLineString':
+                return { type: 'MultiLineString', coordinates: geometry.arcs.map(stitch) };
+            case 'Polygon':
+                return { type: 'Polygon', coordinates: geometry.arcs.map(stitch) };
+            case 'MultiPolygon':
+                return { type: 'MultiPolygon', coordinates: geometry.arcs.map((polygon) => polygon.map(stitch)) };
+            default:
+                return null;
+        }
+    };
+    const features = [];
+    const addFeatures = (geometry) => {
+        var _a, _b;
+        if (geometry.type === 'GeometryCollection') {
+            ((_a = geometry.geometries) !== null && _a !== void 0 ? _a : []).forEach(addFeatures);
+            return;
+        }
+        const feature = {
+            type: 'Feature',
+            geometry: toGeometry(geometry),
+            properties: (_b = geometry.properties) !== null && _b !== void 0 ? _b : {}
+        };
+        if (geometry.id !== undefined) {
+            feature.id = geometry.id;
+        }
+        features.push(feature);
+    };
+    Object.values(topology.objects).forEach(addFeatures);
+    return { type: 'FeatureCollection', features };
+}
 function addWatercoursesGeoJson(data) {
+    if (data.type === 'Topology') {
+        data = topologyToGeoJSON(data);
+    }
     map_canal_towpath_walking.removeLayer(geo_json_watercourses); // eslint-disable-line camelcase
     geo_json_watercourses.addData(data); // eslint-disable-line camelcase
     map_canal_towpath_walking.addLayer(geo_json_watercourses); // eslint-disable-line camelcase
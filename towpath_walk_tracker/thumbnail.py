@@ -0,0 +1,586 @@
+#!/usr/bin/env python3
+#
+#  thumbnail.py
+"""
+Fast rendering of walk thumbnails over OpenStreetMap tiles.
+"""
+#
+#  Copyright © 2025 Dominic Davis-Foster <dominic@davis-foster.co.uk>
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to deal
+#  in the Software without restriction, including without limitation the rights
+#  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#  copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in all
+#  copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+#  EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+#  MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+#  IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM,
+#  DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR
+#  OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE
+#  OR OTHER DEALINGS IN THE SOFTWARE.
+#
+
+# stdlib
+import hashlib
+import logging
+import math
+import os
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from functools import lru_cache
+from io import BytesIO
+from typing import Literal, Mapping, Optional, Sequence, Union
+
+# 3rd party
+import numpy
+from domdf_python_tools.paths import PathPlus
+from domdf_python_tools.typing import PathLike
+from PIL import Image, ImageColor, ImageDraw
+
+# this package
+from towpath_walk_tracker.route import Route
+from towpath_walk_tracker.tiles import MAX_ZOOM, get_tile_store
+from towpath_walk_tracker.util import WEB_MERCATOR_RADIUS, from_web_mercator, to_web_mercator
+
+__all__ = [
+		"ThumbnailQueue",
+		"ThumbnailStore",
+		"get_tile",
+		"placeholder_thumbnail",
+		"render_thumbnail",
+		"render_thumbnails",
+		"sprite_key",
+		"sprite_offsets",
+		"sprite_sheet",
+		"thumbnail_key",
+		]
+
+_log = logging.getLogger(__name__)
+
+#: Incremented whenever :func:`~.render_thumbnail` changes its output, so stored thumbnails are re-rendered.
+RENDERER_VERSION = 1
+
+TILE_SIZE = 256
+
+# Half the width of the Web Mercator plane, in metres.
+_HALF_WORLD = WEB_MERCATOR_RADIUS * math.pi
+
+# Lines are drawn at this multiple of the output size, then downsampled, to antialias them.
+_SUPERSAMPLE = 4
+
+
+@lru_cache(maxsize=256)
+def get_tile(z: int, x: int, y: int, tile_store: str = "cache/tiles.mbtiles") -> Image.Image:
+	"""
+	Returns the base map tile at the given position from the tile store.
+
+	Decoded tiles are also kept in memory, and must not be modified.
+	A blank tile is returned if the tile isn't in the store and can't be downloaded.
+
+	:param z: Zoom level.
+	:param x: Tile column.
+	:param y: Tile row.
+	:param tile_store: The MBTiles file to read tiles from.
+	"""
+
+	data = get_tile_store(tile_store).get(z, x, y)
+	if data is None:
+		return Image.new("RGB", (TILE_SIZE, TILE_SIZE), (233, 236, 239))
+
+	with Image.open(BytesIO(data)) as tile:
+		return tile.convert("RGB")
+
+
+def _calculate_zoom(west: float, south: float, east: float, north: float) -> int:
+	# Zoom level for the given bounds in degrees, matching :func:`contextily.tile._calculate_zoom`.
+
+	zoom_lng = math.ceil(math.log2(360 * 2.0 / (east - west)))
+	zoom_lat = math.ceil(math.log2(360 * 2.0 / (north - south)))
+	return min(zoom_lng, zoom_lat)
+
+
+def _stitch_basemap(
+		extent: tuple[float, float, float, float],
+		zoom: int,
+		size: int,
+		tile_store: str,
+		) -> Image.Image:
+	# Returns the base map covering the Web Mercator extent ``(min_x, min_y, max_x, max_y)``, resized to ``size``.
+
+	min_x, min_y, max_x, max_y = extent
+	scale = TILE_SIZE * 2**zoom / (2 * _HALF_WORLD)  # pixels per metre
+
+	# Pixel positions of the extent in the whole map at this zoom level.
+	left, right = (min_x + _HALF_WORLD) * scale, (max_x + _HALF_WORLD) * scale
+	top, bottom = (_HALF_WORLD - max_y) * scale, (_HALF_WORLD - min_y) * scale
+
+	num_tiles = 2**zoom
+	first_x, last_x = int(left // TILE_SIZE), int(right // TILE_SIZE)
+	first_y, last_y = max(int(top // TILE_SIZE), 0), min(int(bottom // TILE_SIZE), num_tiles - 1)
+
+	canvas = Image.new("RGB", ((last_x - first_x + 1) * TILE_SIZE, (last_y - first_y + 1) * TILE_SIZE))
+	for tile_x in range(first_x, last_x + 1):
+		for tile_y in range(first_y, last_y + 1):
+			tile = get_tile(zoom, tile_x % num_tiles, tile_y, tile_store)
+			canvas.paste(tile, ((tile_x - first_x) * TILE_SIZE, (tile_y - first_y) * TILE_SIZE))
+
+	box = (
+			left - first_x * TILE_SIZE,
+			top - first_y * TILE_SIZE,
+			right - first_x * TILE_SIZE,
+			bottom - first_y * TILE_SIZE,
+			)
+	return canvas.resize((size, size), Image.Resampling.BILINEAR, box=box)
+
+
+def render_thumbnail(
+		route: Route,
+		size: int = 150,
+		zoom: Union[Literal["auto"], int] = "auto",
+		zoom_adjust: int = -2,
+		colour: str = "#139c25",
+		linewidth: float = 7,
+		margin: float = 0.2,
+		tile_store: PathLike = "cache/tiles.mbtiles",
+		) -> bytes:
+	"""
+	Render the route against the OpenStreetMap base map as a small square PNG thumbnail.
+
+	Equivalent to :meth:`Route.plot_thumbnail() <towpath_walk_tracker.route.Route.plot_thumbnail>`,
+	but draws directly onto an image with Pillow rather than creating a matplotlib figure.
+
+	Must include the following attribution for the base map: :data:`~.TILE_ATTRIBUTION`.
+
+	:param route:
+	:param size: The width and height of the image, in pixels.
+	:param zoom: Base map zoom level.
+	:param zoom_adjust: Adjust the automatic zoom level by this amount.
+	:param colour: The walk line colour.
+	:param linewidth: The walk line width, in pixels.
+	:param margin: The space around the route, as a fraction of its width or height (whichever is larger).
+	:param tile_store: The MBTiles file to read base map tiles from.
+
+	:returns: The PNG image data.
+	"""
+
+	if not len(route):
+		raise ValueError("Cannot render a thumbnail for an empty route")
+
+	x, y = to_web_mercator(route.latitudes, route.longitudes)
+
+	# Square extent around the centre of the route, with the margin either side.
+	centre_x, centre_y = (x.min() + x.max()) / 2, (y.min() + y.max()) / 2
+	half_side = max(x.max() - x.min(), y.max() - y.min(), 1.0) * (1 + 2 * margin) / 2
+	extent = (centre_x - half_side, centre_y - half_side, centre_x + half_side, centre_y + half_side)
+
+	if isinstance(zoom, int):
+		zoom_level = zoom
+	else:
+		south, west = from_web_mercator(extent[0], extent[1])
+		north, east = from_web_mercator(extent[2], extent[3])
+		zoom_level = _calculate_zoom(west, south, east, north) + zoom_adjust
+	zoom_level = min(max(zoom_level, 0), MAX_ZOOM)
+
+	# The path is normalised to a string as it is part of the key of the tile cache.
+	image = _stitch_basemap(extent, zoom_level, size, os.fspath(tile_store))
+
+	# Draw the line at full opacity onto a supersampled mask, then blend it with the base map at half opacity.
+	scale = size * _SUPERSAMPLE / (2 * half_side)
+	pixels = numpy.column_stack([(x - extent[0]) * scale, (extent[3] - y) * scale])
+
+	# Snap to whole output pixels and drop consecutive duplicates; many nodes fall within the same pixel.
+	pixels = numpy.round(pixels / _SUPERSAMPLE) * _SUPERSAMPLE
+	keep = numpy.ones(len(pixels), dtype=bool)
+	keep[1:] = numpy.any(pixels[1:] != pixels[:-1], axis=1)
+	pixels = pixels[keep]
+
+	mask = Image.new('L', (size * _SUPERSAMPLE, size * _SUPERSAMPLE), 0)
+	draw = ImageDraw.Draw(mask)
+	line_width = max(round(linewidth * _SUPERSAMPLE), 1)
+	if len(pixels) > 1:
+		draw.line(pixels.ravel().tolist(), fill=255, width=line_width)
+
+	# Round the joins and ends (much faster than the line's ``joint="curve"`` option).
+	radius = line_width / 2
+	for box in numpy.column_stack([pixels - radius, pixels + radius]).tolist():
+		draw.ellipse(box, fill=255)
+
+	mask = mask.reduce(_SUPERSAMPLE).point(lambda value: value // 2)
+	image.paste(Image.new("RGB", image.size, ImageColor.getrgb(colour)), mask=mask)
+
+	buffer = BytesIO()
+	image.save(buffer, format="PNG")
+	return buffer.getvalue()
+
+
+def render_thumbnails(jobs: Sequence[tuple[Route, str]], size: int = 150) -> list[Optional[bytes]]:
+	"""
+	Render thumbnails for several routes in one pass, sharing base map tiles between them.
+
+	:param jobs: Pairs of routes and their line colours.
+	:param size: The width and height of each image, in pixels.
+
+	:returns: The PNG image data for each route, or :py:obj:`None` for routes which could not be rendered.
+	"""
+
+	images: list[Optional[bytes]] = []
+
+	for route, colour in jobs:
+		if not len(route):
+			images.append(None)
+			continue
+
+		try:
+			images.append(render_thumbnail(route, size=size, colour=colour))
+		except Exception:
+			_log.exception("Failed to render thumbnail for %r", route)
+			images.append(None)
+
+	return images
+
+
+@lru_cache
+def placeholder_thumbnail(size: int = 150) -> bytes:
+	"""
+	Returns a plain PNG image to show in place of a thumbnail which hasn't been rendered yet.
+
+	:param size: The width and height of the image, in pixels.
+	"""
+
+	buffer = BytesIO()
+	Image.new("RGB", (size, size), (233, 236, 239)).save(buffer, format="PNG")
+	return buffer.getvalue()
+
+
+def thumbnail_key(route: Route, colour: str, size: int = 150) -> str:
+	"""
+	Returns a hash identifying the thumbnail for the given route, colour and size.
+
+	:param route:
+	:param colour: The walk line colour.
+	:param size: The width and height of the image, in pixels.
+	"""
+
+	sha256 = hashlib.sha256()
+	sha256.update(f"{RENDERER_VERSION}:{colour.lower()}:{size}:".encode("UTF-8"))
+	sha256.update(route.latitudes.tobytes())
+	sha256.update(route.longitudes.tobytes())
+	return sha256.hexdigest()
+
+
+def sprite_offsets(count: int, size: int = 150, columns: int = 10) -> list[tuple[int, int]]:
+	"""
+	Returns the pixel offsets of each cell in a sprite sheet from :func:`~.sprite_sheet`.
+
+	:param count: The number of thumbnails in the sprite sheet.
+	:param size: The width and height of each thumbnail, in pixels.
+	:param columns: The maximum number of thumbnails in each row.
+
+	:returns: A list of ``(x, y)`` offsets of the top left corner of each cell.
+	"""
+
+	columns = max(min(columns, count), 1)
+	return [((idx % columns) * size, (idx // columns) * size) for idx in range(count)]
+
+
+def sprite_sheet(images: Sequence[Optional[bytes]], size: int = 150, columns: int = 10) -> bytes:
+	"""
+	Combine several thumbnails into a single PNG sprite sheet, laid out in rows.
+
+	:param images: The PNG image data for each thumbnail, or :py:obj:`None` to use a placeholder.
+	:param size: The width and height of each thumbnail, in pixels.
+	:param columns: The maximum number of thumbnails in each row.
+	"""
+
+	offsets = sprite_offsets(len(images), size, columns)
+	width = max((x for x, y in offsets), default=0) + size
+	height = max((y for x, y in offsets), default=0) + size
+
+	sheet = Image.new("RGB", (width, height), (233, 236, 239))
+	for image_png, offset in zip(images, offsets):
+		if image_png is not None:
+			sheet.paste(Image.open(BytesIO(image_png)).convert("RGB").resize((size, size)), offset)
+
+	buffer = BytesIO()
+	sheet.save(buffer, format="PNG")
+	return buffer.getvalue()
+
+
+def sprite_key(keys: Sequence[str], size: int = 150, columns: int = 10) -> str:
+	"""
+	Returns a hash identifying the sprite sheet for the given thumbnails.
+
+	:param keys: The :func:`~.thumbnail_key` of each thumbnail, in order.
+	:param size: The width and height of each thumbnail, in pixels.
+	:param columns: The maximum number of thumbnails in each row.
+	"""
+
+	sha256 = hashlib.sha256()
+	sha256.update(f"sprite:{size}:{columns}:".encode("UTF-8"))
+	sha256.update(','.join(keys).encode("UTF-8"))
+	return sha256.hexdigest()
+
+
+class ThumbnailStore:
+	"""
+	Disk-backed store of rendered thumbnails, keyed by :func:`~.thumbnail_key`.
+
+	Once the total size of the thumbnails exceeds ``max_size`` the least recently used are deleted.
+	The store may be shared between processes.
+
+	:param directory:
+	:param max_size: The maximum total size of the thumbnails, in bytes.
+	"""
+
+	def __init__(self, directory: PathLike = "cache/thumbnails", max_size: int = 256 * 1024 * 1024):
+		self.directory = PathPlus(directory)
+		self.max_size: int = max_size
+		self._size: Optional[int] = None
+		self._lock = threading.Lock()
+
+	def __repr__(self) -> str:
+		return f"<{type(self).__name__}({self.directory.as_posix()!r})>"
+
+	def _path_for(self, key: str) -> PathPlus:
+		return self.directory / key[:2] / f"{key}.png"
+
+	def get(self, key: str) -> Optional[bytes]:
+		"""
+		Returns the thumbnail with the given key, or :py:obj:`None` if it isn't in the store.
+
+		:param key:
+		"""
+
+		filename = self._path_for(key)
+
+		try:
+			data = filename.read_bytes()
+			os.utime(filename)  # Mark as recently used
+		except FileNotFoundError:
+			return None
+
+		return data
+
+	def __contains__(self, key: str) -> bool:
+		return self._path_for(key).is_file()
+
+	def put(self, key: str, data: bytes) -> None:
+		"""
+		Add a thumbnail to the store, evicting the least recently used thumbnails if the store is full.
+
+		:param key:
+		:param data: The PNG image data.
+		"""
+
+		filename = self._path_for(key)
+		filename.parent.maybe_make(parents=True)
+
+		try:
+			replaced_size = filename.stat().st_size
+		except FileNotFoundError:
+			replaced_size = 0
+
+		tmp_filename = filename.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+		tmp_filename.write_bytes(data)
+		os.replace(tmp_filename, filename)
+
+		with self._lock:
+			if self._size is None:
+				self._size = self._scan()[1]
+			else:
+				self._size += len(data) - replaced_size
+
+			if self._size > self.max_size:
+				self._evict()
+
+	def _scan(self) -> tuple[list[tuple[float, int, str]], int]:
+		# Returns the last used time, size and path of each thumbnail, and their total size.
+
+		files = []
+		total = 0
+		for entry in self.directory.glob("*/*.png"):
+			try:
+				stat = entry.stat()
+			except FileNotFoundError:
+				continue  # Evicted by another process
+			files.append((stat.st_mtime, stat.st_size, str(entry)))
+			total += stat.st_size
+
+		return files, total
+
+	def _evict(self) -> None:
+		# Delete the least recently used thumbnails until the store is at most 90% full.
+
+		files, total = self._scan()
+		files.sort()
+
+		for _, size, filename in files:
+			if total <= self.max_size * 0.9:
+				break
+
+			try:
+				os.unlink(filename)
+			except FileNotFoundError:
+				pass
+			total -= size
+
+		self._size = total
+
+
+class ThumbnailQueue:
+	"""
+	Renders thumbnails with :func:`~.render_thumbnail` in a background process pool.
+
+	Finished thumbnails are added to the given store under their :func:`~.thumbnail_key`.
+	Thumbnails which fail to render are logged, and not queued again for the life of the queue.
+
+	:param store:
+	:param max_workers: The number of worker processes. Defaults to the number of CPUs.
+	"""
+
+	def __init__(self, store: ThumbnailStore, max_workers: Optional[int] = None):
+		self.store: ThumbnailStore = store
+		self.max_workers: Optional[int] = max_workers
+		self._executor: Optional[ProcessPoolExecutor] = None
+		self._pending: dict[str, Future] = {}
+		self._failed: set[str] = set()
+		self._lock = threading.Lock()
+
+	def __repr__(self) -> str:
+		return f"<{type(self).__name__}({self.store!r}, {len(self._pending)} pending)>"
+
+	def submit(self, route: Route, colour: str, size: int = 150, key: Optional[str] = None) -> str:
+		"""
+		Queue a thumbnail to be rendered, unless it is already in the store or queued, or has failed to render.
+
+		:param route:
+		:param colour: The walk line colour.
+		:param size: The width and height of the image, in pixels.
+		:param key: The key to store the thumbnail under. Defaults to the :func:`~.thumbnail_key` for the route.
+
+		:returns: The key the thumbnail will be stored under.
+		"""
+
+		if key is None:
+			key = thumbnail_key(route, colour, size)
+
+		with self._lock:
+			if key in self._pending or key in self._failed or key in self.store:
+				return key
+
+			if self._executor is None:
+				self._executor = ProcessPoolExecutor(self.max_workers)
+
+			future = self._executor.submit(render_thumbnail, route, size=size, colour=colour)
+			self._pending[key] = future
+
+		future.add_done_callback(lambda f: self._finished(key, f))
+		return key
+
+	def _finished(self, key: str, future: Future) -> None:
+		# Add the rendered image to the store, or record that the render failed.
+
+		if future.cancelled():
+			exception = None
+		else:
+			exception = future.exception()
+			if exception is None:
+				self.store.put(key, future.result())
+			else:
+				_log.error("Failed to render thumbnail %s", key, exc_info=exception)
+
+		with self._lock:
+			del self._pending[key]
+			if exception is not None:
+				self._failed.add(key)
+
+	def submit_batch(
+			self,
+			jobs: Mapping[str, tuple[Route, str]],
+			size: int = 150,
+			) -> dict[str, Optional[bytes]]:
+		"""
+		Queue those thumbnails which aren't already in the store or queued to be rendered in a single background task.
+
+		This does not wait for the thumbnails to be rendered.
+
+		:param jobs: Mapping of thumbnail keys to routes and their line colours.
+		:param size: The width and height of each image, in pixels.
+
+		:returns: Mapping of thumbnail keys to PNG image data, or :py:obj:`None` if a thumbnail
+			hasn't been rendered yet or could not be rendered.
+		"""
+
+		images: dict[str, Optional[bytes]] = {}
+		missing: dict[str, tuple[Route, str]] = {}
+		batch: Optional[Future] = None
+
+		with self._lock:
+			for key, job in jobs.items():
+				if key in self._pending or key in self._failed:
+					images[key] = None
+				else:
+					images[key] = self.store.get(key)
+					if images[key] is None:
+						missing[key] = job
+
+			if missing:
+				if self._executor is None:
+					self._executor = ProcessPoolExecutor(self.max_workers)
+
+				batch = self._executor.submit(render_thumbnails, list(missing.values()), size=size)
+				self._pending.update(dict.fromkeys(missing, batch))
+
+		if batch is not None:
+			keys = list(missing)
+			batch.add_done_callback(lambda f: self._batch_finished(keys, f))
+
+		return images
+
+	def _batch_finished(self, keys: list[str], future: Future) -> None:
+		# Add the rendered images to the store, and record those which failed to render.
+
+		failed: list[str] = []
+
+		if not future.cancelled():
+			exception = future.exception()
+			if exception is None:
+				for key, image_png in zip(keys, future.result()):
+					if image_png is None:
+						failed.append(key)
+					else:
+						self.store.put(key, image_png)
+			else:
+				_log.error("Failed to render thumbnails %s", ", ".join(keys), exc_info=exception)
+				failed = keys
+
+		with self._lock:
+			for key in keys:
+				del self._pending[key]
+			self._failed.update(failed)
+
+	def is_pending(self, key: str) -> bool:
+		"""
+		Returns whether the thumbnail with the given key is queued or being rendered.
+
+		:param key:
+		"""
+
+		with self._lock:
+			return key in self._pending
+
+	def shutdown(self) -> None:
+		"""
+		Stop the worker processes, cancelling any queued renders.
+		"""
+
+		with self._lock:
+			if self._executor is not None:
+				self._executor.shutdown(wait=False, cancel_futures=True)
+				self._executor = None
@@ -0,0 +1,343 @@
+#!/usr/bin/env python3
+#
+#  tiles.py
+"""
+Local store of OpenStreetMap base map tiles, in the MBTiles format.
+"""
+#
+#  Copyright © 2025 Dominic Davis-Foster <dominic@davis-foster.co.uk>
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to deal
+#  in the Software without restriction, including without limitation the rights
+#  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#  copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in all
+#  copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+#  EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+#  MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+#  IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM,
+#  DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR
+#  OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE
+#  OR OTHER DEALINGS IN THE SOFTWARE.
+#
+
+# stdlib
+import math
+import sqlite3
+import threading
+import time
+from collections.abc import Iterable, Iterator
+from functools import lru_cache
+from typing import Mapping, Optional
+
+# 3rd party
+import requests
+from domdf_python_tools.paths import PathPlus
+from domdf_python_tools.typing import PathLike
+
+__all__ = [
+		"MAX_ZOOM",
+		"PREFETCH_INTERVAL",
+		"PREFETCH_MAX_TILES",
+		"TILE_ATTRIBUTION",
+		"TILE_URL",
+		"TileStore",
+		"fetch_tile",
+		"get_tile_store",
+		"prefetch_tiles",
+		"tiles_in_bounds",
+		]
+
+#: URL template for the base map tiles (the Humanitarian OpenStreetMap Team style, as used by contextily).
+TILE_URL = "https://a.tile.openstreetmap.fr/hot/{z}/{x}/{y}.png"
+
+#: Attribution which must be shown alongside the base map.
+TILE_ATTRIBUTION = (
+		"© OpenStreetMap contributors, "
+		"Tiles style by Humanitarian OpenStreetMap Team hosted by OpenStreetMap France"
+		)
+
+#: The highest zoom level the tile server provides.
+MAX_ZOOM = 19
+
+#: The minimum time between tile downloads when prefetching, in seconds.
+PREFETCH_INTERVAL = 1.0
+
+#: The maximum number of tiles to download when prefetching, unless a higher limit is given.
+PREFETCH_MAX_TILES = 500
+
+_USER_AGENT = "towpath-walk-tracker"
+
+_BASEMAP_METADATA = {
+		"name": "Humanitarian OpenStreetMap",
+		"format": "png",
+		"type": "baselayer",
+		"attribution": TILE_ATTRIBUTION,
+		}
+
+
+class TileStore:
+	"""
+	Base map tiles stored in an `MBTiles`_ (SQLite) file.
+
+	Tiles missing from the store are downloaded from the tile server and added to it,
+	unless the store is opened with ``download=False``.
+
+	.. _MBTiles: https://github.com/mapbox/mbtiles-spec
+
+	:param filename:
+	:param download: Whether to download tiles which are missing from the store.
+	:param metadata: Metadata to record in a new file. Defaults to that for the base map tiles.
+	:param url: URL template for the tile server, with ``{z}``, ``{x}`` and ``{y}`` placeholders.
+	"""
+
+	def __init__(
+			self,
+			filename: PathLike = "cache/tiles.mbtiles",
+			download: bool = True,
+			metadata: Optional[Mapping[str, str]] = None,
+			url: str = TILE_URL,
+			):
+		self.filename = PathPlus(filename)
+		self.download: bool = download
+		self.url: str = url
+		self._local = threading.local()
+
+		self.filename.parent.maybe_make(parents=True)
+		with self._connection() as connection:
+			connection.execute("CREATE TABLE IF NOT EXISTS metadata (name TEXT, value TEXT)")
+			connection.execute(
+					"CREATE TABLE IF NOT EXISTS tiles "
+					"(zoom_level INTEGER, tile_column INTEGER, tile_row INTEGER, tile_data BLOB)"
+					)
+			connection.execute(
+					"CREATE UNIQUE INDEX IF NOT EXISTS tile_index ON tiles (zoom_level, tile_column, tile_row)"
+					)
+			if connection.execute("SELECT COUNT(*) FROM metadata").fetchone()[0] == 0:
+				connection.executemany(
+						"INSERT INTO metadata (name, value) VALUES (?, ?)",
+						(metadata or _BASEMAP_METADATA).items(),
+						)
+
+	def __repr__(self) -> str:
+		return f"<{type(self).__name__}({self.filename.as_posix()!r})>"
+
+	def _connection(self) -> sqlite3.Connection:
+		# SQLite connections can't be shared between threads, so each thread has its own.
+
+		connection = getattr(self._local, "connection", None)
+		if connection is None:
+			connection = sqlite3.connect(self.filename, timeout=30)
+			self._local.connection = connection
+
+		return connection
+
+	def __contains__(self, tile: tuple[int, int, int]) -> bool:
+		z, x, y = tile
+		cursor = self._connection().execute(
+				"SELECT 1 FROM tiles WHERE zoom_level = ? AND tile_column = ? AND tile_row = ?",
+				(z, x, _flip_y(z, y)),
+				)
+		return cursor.fetchone() is not None
+
+	def __len__(self) -> int:
+		return self._connection().execute("SELECT COUNT(*) FROM tiles").fetchone()[0]
+
+	def get_metadata(self) -> dict[str, str]:
+		"""
+		Returns the metadata recorded in the file.
+		"""
+
+		return dict(self._connection().execute("SELECT name, value FROM metadata").fetchall())
+
+	def set_metadata(self, name: str, value: str) -> None:
+		"""
+		Record a metadata value in the file, replacing any existing value with that name.
+
+		:param name:
+		:param value:
+		"""
+
+		with self._connection() as connection:
+			connection.execute("DELETE FROM metadata WHERE name = ?", (name, ))
+			connection.execute("INSERT INTO metadata (name, value) VALUES (?, ?)", (name, value))
+
+	def clear(self) -> None:
+		"""
+		Remove all tiles from the store.
+		"""
+
+		with self._connection() as connection:
+			connection.execute("DELETE FROM tiles")
+
+	def get(self, z: int, x: int, y: int) -> Optional[bytes]:
+		"""
+		Returns the data for the tile at the given position.
+
+		:param z: Zoom level.
+		:param x: Tile column.
+		:param y: Tile row (counting from the north, as in the tile URL).
+
+		:returns: The tile, or :py:obj:`None` if it isn't in the store and can't be downloaded.
+		"""
+
+		row = self._connection().execute(
+				"SELECT tile_data FROM tiles WHERE zoom_level = ? AND tile_column = ? AND tile_row = ?",
+				(z, x, _flip_y(z, y)),
+				).fetchone()
+		if row is not None:
+			return row[0]
+
+		if not self.download:
+			return None
+
+		try:
+			data = fetch_tile(z, x, y, url=self.url)
+		except requests.RequestException:
+			return None
+
+		self.put(z, x, y, data)
+		return data
+
+	def put(self, z: int, x: int, y: int, data: bytes) -> None:
+		"""
+		Add a tile to the store, replacing any existing tile at that position.
+
+		:param z: Zoom level.
+		:param x: Tile column.
+		:param y: Tile row (counting from the north, as in the tile URL).
+		:param data: The tile data, such as a PNG image.
+		"""
+
+		with self._connection() as connection:
+			connection.execute(
+					"INSERT OR REPLACE INTO tiles (zoom_level, tile_column, tile_row, tile_data) VALUES (?, ?, ?, ?)",
+					(z, x, _flip_y(z, y), data),
+					)
+
+
+def _flip_y(z: int, y: int) -> int:
+	# MBTiles numbers rows from the south (TMS), whereas tile URLs number them from the north (XYZ).
+
+	return (1 << z) - 1 - y
+
+
+def fetch_tile(
+		z: int,
+		x: int,
+		y: int,
+		session: Optional[requests.Session] = None,
+		url: str = TILE_URL,
+		) -> bytes:
+	"""
+	Download the tile at the given position.
+
+	:param z: Zoom level.
+	:param x: Tile column.
+	:param y: Tile row.
+	:param session: Optional session to reuse the connection when downloading many tiles.
+	:param url: URL template for the tile server, with ``{z}``, ``{x}`` and ``{y}`` placeholders.
+	"""
+
+	response = (session or requests).get(
+			url.format(z=z, x=x, y=y),
+			headers={"User-Agent": _USER_AGENT},
+			timeout=30,
+			)
+	response.raise_for_status()
+	return response.content
+
+
+def tiles_in_bounds(
+		west: float,
+		south: float,
+		east: float,
+		north: float,
+		zoom: int,
+		) -> Iterator[tuple[int, int, int]]:
+	"""
+	Returns the ``(z, x, y)`` positions of the tiles covering the given bounds at the given zoom level.
+
+	:param west: Minimum longitude, in degrees.
+	:param south: Minimum latitude, in degrees.
+	:param east: Maximum longitude, in degrees.
+	:param north: Maximum latitude, in degrees.
+	:param zoom:
+	"""
+
+	num_tiles = 1 << zoom
+
+	def column(lng: float) -> int:
+		return min(max(int((lng + 180) / 360 * num_tiles), 0), num_tiles - 1)
+
+	def row(lat: float) -> int:
+		lat_rad = math.radians(lat)
+		y = (1 - math.asinh(math.tan(lat_rad)) / math.pi) / 2 * num_tiles
+		return min(max(int(y), 0), num_tiles - 1)
+
+	for x in range(column(west), column(east) + 1):
+		for y in range(row(north), row(south) + 1):
+			yield zoom, x, y
+
+
+def prefetch_tiles(
+		store: TileStore,
+		bounds: tuple[float, float, float, float],
+		zooms: Iterable[int],
+		url: str = TILE_URL,
+		interval: float = PREFETCH_INTERVAL,
+		max_tiles: int = PREFETCH_MAX_TILES,
+		) -> Iterator[tuple[int, int, int]]:
+	"""
+	Download the tiles covering the given bounds at each zoom level which aren't already in the store.
+
+	Tiles are downloaded one at a time, at most one every ``interval`` seconds,
+	in keeping with the usage policies of the public OpenStreetMap tile servers.
+	Nothing is downloaded if more than ``max_tiles`` tiles are missing from the store.
+
+	Yields the position of each tile as it is downloaded, so progress can be reported.
+
+	:param store:
+	:param bounds: ``(west, south, east, north)`` in degrees.
+	:param zooms:
+	:param url: URL template for the tile server, with ``{z}``, ``{x}`` and ``{y}`` placeholders.
+	:param interval: The minimum time between downloads, in seconds.
+	:param max_tiles: The maximum number of tiles to download.
+
+	:raises ValueError: If more than ``max_tiles`` tiles would be downloaded.
+	"""
+
+	missing = [tile for zoom in zooms for tile in tiles_in_bounds(*bounds, zoom) if tile not in store]
+	if len(missing) > max_tiles:
+		raise ValueError(f"{len(missing)} tiles are missing from the store, more than the limit of {max_tiles}")
+
+	next_request = time.monotonic()
+	with requests.Session() as session:
+		for tile in missing:
+			time.sleep(max(next_request - time.monotonic(), 0))
+			next_request = time.monotonic() + interval
+
+			store.put(*tile, fetch_tile(*tile, session=session, url=url))
+			yield tile
+
+
+@lru_cache
+def get_tile_store(
+		filename: str = "cache/tiles.mbtiles",
+		download: bool = True,
+		url: str = TILE_URL,
+		) -> TileStore:
+	"""
+	Returns the :class:`~.TileStore` for the given file, opening it the first time.
+
+	:param filename:
+	:param download: Whether to download tiles which are missing from the store.
+	:param url: URL template for the tile server, with ``{z}``, ``{x}`` and ``{y}`` placeholders.
+	"""
+
+	return TileStore(filename, download=download, url=url)
@@ -0,0 +1,276 @@
+#!/usr/bin/env python3
+#
+#  topology.py
+"""
+TopoJSON encoding of the watercourses, with shared boundaries and quantized coordinates.
+"""
+#
+#  Copyright © 2025 Dominic Davis-Foster <dominic@davis-foster.co.uk>
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to deal
+#  in the Software without restriction, including without limitation the rights
+#  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#  copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in all
+#  copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+#  EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+#  MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+#  IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM,
+#  DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR
+#  OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE
+#  OR OTHER DEALINGS IN THE SOFTWARE.
+#
+
+# stdlib
+from collections.abc import Iterable
+from typing import Any, Optional
+
+# 3rd party
+import numpy
+
+__all__ = ["DEFAULT_PRECISION", "encode_topology"]
+
+#: The default spacing of the quantization grid, in degrees (roughly 10cm).
+DEFAULT_PRECISION: float = 1e-6
+
+
+class _Topology:
+	# Splits the lines and rings of the quantized geometries into shared arcs.
+	# Geometries are quantized onto a grid anchored at (0, 0) as they are added, so they can be read from a stream.
+	# Once all have been added, the grid is translated to the south-west corner of the data.
+
+	def __init__(self, precision: float):
+		self.scale = numpy.array([precision, precision])
+		self.geometries: list[Optional[dict[str, Any]]] = []
+
+		# The corners of the data on the grid.
+		self._lower = numpy.full(2, numpy.iinfo(numpy.int64).max)
+		self._upper = numpy.full(2, numpy.iinfo(numpy.int64).min)
+
+		self.arcs: list[list[list[int]]] = []
+		self._arc_index: dict[bytes, int] = {}
+
+	def add(self, geometry: Optional[dict[str, Any]]) -> None:
+		self.geometries.append(self._quantize(geometry))
+
+	def finish(self) -> None:
+		# Translate the grid, and find the junctions across all the features, ready for cutting.
+
+		if (self._lower > self._upper).any():
+			# No positions.
+			self._lower = self._upper = numpy.zeros(2, dtype=numpy.int64)
+
+		self.origin = self._lower
+		self.translate = self.origin * self.scale
+
+		# The number of grid steps along the longer axis, used to combine both axes into a single key.
+		self._steps = int((self._upper - self._lower).max()) + 2
+
+		self.junctions = self._find_junctions()
+
+	def _quantize_line(self, line: list[list[float]]) -> numpy.ndarray:
+		# Returns the quantized positions, without consecutive duplicates.
+
+		positions = numpy.round(numpy.array(line)[:, :2] / self.scale).astype(numpy.int64)
+		self._lower = numpy.minimum(self._lower, positions.min(axis=0))
+		self._upper = numpy.maximum(self._upper, positions.max(axis=0))
+
+		keep = numpy.ones(len(positions), dtype=bool)
+		keep[1:] = (positions[1:] != positions[:-1]).any(axis=1)
+		positions = positions[keep]
+
+		if len(positions) == 1:
+			# Lines need at least two positions, even if they coincide.
+			positions = numpy.repeat(positions, 2, axis=0)
+
+		return positions
+
+	def _quantize(self, geometry: Optional[dict[str, Any]]) -> Optional[dict[str, Any]]:
+		if not geometry:
+			return None
+
+		geometry_type = geometry["type"]
+		coordinates = geometry["coordinates"]
+
+		if geometry_type == "Point":
+			coordinates = self._quantize_line([coordinates])[0]
+		elif geometry_type in {"MultiPoint", "LineString"}:
+			coordinates = self._quantize_line(coordinates)
+		elif geometry_type in {"MultiLineString", "Polygon"}:
+			coordinates = [self._quantize_line(line) for line in coordinates]
+		elif geometry_type == "MultiPolygon":
+			coordinates = [[self._quantize_line(ring) for ring in polygon] for polygon in coordinates]
+		else:
+			raise NotImplementedError(f"Unsupported geometry type {geometry_type!r}")
+
+		return {"type": geometry_type, "coordinates": coordinates}
+
+	def _key(self, positions: numpy.ndarray) -> numpy.ndarray:
+		# Returns a single integer identifying each quantized position.
+
+		positions = positions - self.origin
+		return positions[:, 0] * self._steps + positions[:, 1]
+
+	def _iter_lines(self) -> Iterable[tuple[numpy.ndarray, bool]]:
+		# Yields each line or ring, and whether it is a ring.
+
+		for geometry in self.geometries:
+			if geometry is None:
+				continue
+
+			geometry_type = geometry["type"]
+			if geometry_type == "LineString":
+				yield geometry["coordinates"], False
+			elif geometry_type == "MultiLineString":
+				for line in geometry["coordinates"]:
+					yield line, False
+			elif geometry_type == "Polygon":
+				for ring in geometry["coordinates"]:
+					yield ring, True
+			elif geometry_type == "MultiPolygon":
+				for polygon in geometry["coordinates"]:
+					for ring in polygon:
+						yield ring, True
+
+	def _find_junctions(self) -> numpy.ndarray:
+		# Returns the sorted keys of the positions where arcs must be cut.
+		# These are the ends of lines, and positions whose neighbours differ between the lines passing through them.
+
+		keys, lower, upper = [], [], []
+
+		for line, is_ring in self._iter_lines():
+			key = self._key(line)
+			if is_ring:
+				key = key[:-1]
+				previous, following = numpy.roll(key, 1), numpy.roll(key, -1)
+			else:
+				previous = numpy.concatenate([[-1], key[:-1]])
+				following = numpy.concatenate([key[1:], [-1]])
+
+			keys.append(key)
+			lower.append(numpy.minimum(previous, following))
+			upper.append(numpy.maximum(previous, following))
+
+		if not keys:
+			return numpy.empty(0, dtype=numpy.int64)
+
+		key, low, high = numpy.concatenate(keys), numpy.concatenate(lower), numpy.concatenate(upper)
+		order = numpy.lexsort((high, low, key))
+		key, low, high = key[order], low[order], high[order]
+
+		differs = (key[1:] == key[:-1]) & ((low[1:] != low[:-1]) | (high[1:] != high[:-1]))
+		return numpy.union1d(key[1:][differs], key[low == -1])
+
+	def _add_arc(self, positions: numpy.ndarray) -> int:
+		# Returns the index of the arc, or its one's complement if the arc already exists in reverse.
+
+		key = self._key(positions)
+		forward, backward = key.tobytes(), key[::-1].tobytes()
+
+		if forward in self._arc_index:
+			return self._arc_index[forward]
+		if backward in self._arc_index:
+			return ~self._arc_index[backward]
+
+		index = len(self.arcs)
+		self._arc_index[forward] = index
+
+		deltas = numpy.diff(positions, axis=0, prepend=[self.origin])
+		self.arcs.append(deltas.tolist())
+		return index
+
+	def _cut_line(self, line: numpy.ndarray) -> list[int]:
+		cuts = numpy.flatnonzero(numpy.isin(self._key(line), self.junctions))
+		return [self._add_arc(line[begin:end + 1]) for begin, end in zip(cuts[:-1], cuts[1:])]
+
+	def _cut_ring(self, ring: numpy.ndarray) -> list[int]:
+		ring = ring[:-1]
+		if not len(ring):
+			return []
+
+		cuts = numpy.flatnonzero(numpy.isin(self._key(ring), self.junctions))
+		if len(cuts):
+			start = cuts[0]
+			cuts = numpy.append(cuts - start, len(ring))
+		else:
+			# Start from the lowest position, so identical rings produce identical arcs.
+			start = numpy.argmin(self._key(ring))
+			cuts = numpy.array([0, len(ring)])
+
+		ring = numpy.roll(ring, -start, axis=0)
+		ring = numpy.concatenate([ring, ring[:1]])
+		return [self._add_arc(ring[begin:end + 1]) for begin, end in zip(cuts[:-1], cuts[1:])]
+
+	def encode(self, geometry: Optional[dict[str, Any]]) -> dict[str, Any]:
+		# Returns the TopoJSON geometry object for the quantized geometry.
+
+		if geometry is None:
+			return {"type": None}
+
+		geometry_type = geometry["type"]
+		coordinates = geometry["coordinates"]
+
+		# The arcs are nested to the same depth as the coordinates of the equivalent GeoJSON geometry, less one.
+		arcs: list[Any]
+
+		if geometry_type in {"Point", "MultiPoint"}:
+			return {"type": geometry_type, "coordinates": (coordinates - self.origin).tolist()}
+		elif geometry_type == "LineString":
+			arcs = self._cut_line(coordinates)
+		elif geometry_type == "MultiLineString":
+			arcs = [self._cut_line(line) for line in coordinates]
+		elif geometry_type == "Polygon":
+			arcs = [self._cut_ring(ring) for ring in coordinates]
+		else:
+			arcs = [[self._cut_ring(ring) for ring in polygon] for polygon in coordinates]
+
+		return {"type": geometry_type, "arcs": arcs}
+
+
+def encode_topology(
+		features: Iterable[dict[str, Any]],
+		object_name: str = "watercourses",
+		precision: float = DEFAULT_PRECISION,
+		) -> dict[str, Any]:
+	"""
+	Encode the given GeoJSON features as a quantized `TopoJSON <https://github.com/topojson/topojson-specification>`_ topology.
+
+	Coordinates are snapped to a grid and delta-encoded,
+	and sections of line shared between features (such as the junctions of canals) are stored only once.
+	Only the ``id`` property of each feature is kept.
+
+	The features are read once, and only their IDs and quantized geometries are held in memory,
+	so they may be streamed from disk.
+
+	:param features:
+	:param object_name: The name of the geometry collection within the topology's objects.
+	:param precision: The spacing of the quantization grid, in degrees.
+	"""
+
+	topology = _Topology(precision)
+	feature_ids = []
+	for feature in features:
+		feature_ids.append(feature["properties"]["id"])
+		topology.add(feature["geometry"])
+
+	topology.finish()
+
+	geometries = []
+	for feature_id, geometry in zip(feature_ids, topology.geometries):
+		geometries.append({
+				**topology.encode(geometry),
+				"id": feature_id,
+				"properties": {"id": feature_id},
+				})
+
+	return {
+			"type": "Topology",
+			"transform": {"scale": topology.scale.tolist(), "translate": topology.translate.tolist()},
+			"objects": {object_name: {"type": "GeometryCollection", "geometries": geometries}},
+			"arcs": topology.arcs,
+			}
@@ -27,21 +27,43 @@ Utility functions.
 #
 
 # stdlib
+import hashlib
+import os
+from collections.abc import Iterator
 from functools import lru_cache
-from typing import NamedTuple
+from typing import Any, NamedTuple, TypeVar
 
 # 3rd party
-from domdf_python_tools.paths import PathPlus
+import numpy
 
 # this package
-from towpath_walk_tracker.watercourses import FeatureCollection, exclude_tags, filter_watercourses
+from towpath_walk_tracker.watercourses import (
+		FeatureCollection,
+		exclude_tags,
+		iter_features,
+		iter_filtered_watercourses
+		)
 
 __all__ = (
+		"EARTH_RADIUS",
+		"WEB_MERCATOR_RADIUS",
 		"ids_to_exclude",
 		"overpass_query",
 		"Coordinate",
+		"encode_polyline",
+		"from_web_mercator",
+		"haversine",
+		"to_web_mercator",
 		)
 
+#: Mean radius of the Earth, in metres.
+EARTH_RADIUS: float = 6_371_008.8
+
+#: Radius of the sphere used by the Web Mercator projection, in metres.
+WEB_MERCATOR_RADIUS: float = 6_378_137.0
+
+_F = TypeVar("_F", float, numpy.ndarray)
+
 overpass_query = """
 [out:json][timeout:200];
 area(id:3600062149)->.searchArea;
@@ -71,11 +93,60 @@ ids_to_exclude = {
 		}
 
 
+def _get_source_hash() -> str:
+	"""
+	Returns a hash of the filtered watercourses data and the IDs excluded from it.
+
+	Used to detect when precompiled data derived from it (such as the network snapshot) is stale.
+	The file is only hashed once per process, unless its modification time or size changes.
+	"""
+
+	stat = os.stat("data.filtered.geojson")
+	return _hash_source(stat.st_mtime_ns, stat.st_size)
+
+
+@lru_cache(maxsize=1)
+def _hash_source(mtime_ns: int, size: int) -> str:
+	# Keyed on the file's modification time and size, so the hash is recalculated when the file changes.
+
+	sha256 = hashlib.sha256()
+
+	with open("data.filtered.geojson", "rb") as fp:
+		for chunk in iter(lambda: fp.read(1024 * 1024), b''):
+			sha256.update(chunk)
+
+	sha256.update(repr(sorted(ids_to_exclude)).encode("UTF-8"))
+
+	return sha256.hexdigest()
+
+
+def _iter_filtered_watercourses() -> Iterator[dict[str, Any]]:
+	# Stream the filtered watercourses from disk one feature at a time, without loading the whole file.
+
+	return iter_filtered_watercourses(
+			iter_features("data.filtered.geojson"),
+			tags_to_exclude=exclude_tags,
+			ids_to_exclude=ids_to_exclude,
+			)
+
+
 @lru_cache
 def _get_filtered_watercourses() -> FeatureCollection:
-	raw_data = PathPlus("data.filtered.geojson").load_json()
-	watercourses = filter_watercourses(raw_data, tags_to_exclude=exclude_tags, ids_to_exclude=ids_to_exclude)
-	return watercourses
+	return {"type": "FeatureCollection", "features": list(_iter_filtered_watercourses())}
+
+
+@lru_cache
+def _get_feature_index() -> dict[int, dict[str, Any]]:
+	# Map the ID of each filtered watercourse to its properties (without the node IDs), for tooltips.
+
+	index: dict[int, dict[str, Any]] = {}
+
+	for feature in _iter_filtered_watercourses():
+		properties = dict(feature["properties"])
+		del properties["nodes"]
+		index.setdefault(properties["id"], properties)
+
+	return index
 
 
 class Coordinate(NamedTuple):
@@ -85,3 +156,97 @@ class Coordinate(NamedTuple):
 
 	latitude: float
 	longitude: float
+
+
+def haversine(lat1: _F, lng1: _F, lat2: _F, lng2: _F) -> _F:
+	"""
+	Calculate the great-circle distance between two points, in metres.
+
+	Accepts scalars or NumPy arrays (which are broadcast against each other).
+
+	:param lat1: Latitude of the first point(s), in degrees.
+	:param lng1: Longitude of the first point(s), in degrees.
+	:param lat2: Latitude of the second point(s), in degrees.
+	:param lng2: Longitude of the second point(s), in degrees.
+	"""
+
+	lat1_rad, lat2_rad = numpy.radians(lat1), numpy.radians(lat2)
+	delta_lat = lat2_rad - lat1_rad
+	delta_lng = numpy.radians(lng2) - numpy.radians(lng1)
+
+	a = numpy.sin(delta_lat / 2)**2 + numpy.cos(lat1_rad) * numpy.cos(lat2_rad) * numpy.sin(delta_lng / 2)**2
+
+	return 2 * EARTH_RADIUS * numpy.arcsin(numpy.sqrt(numpy.minimum(a, 1.0)))
+
+
+def to_web_mercator(lat: _F, lng: _F) -> tuple[_F, _F]:
+	"""
+	Project coordinates to Web Mercator (EPSG:3857), returning ``(x, y)`` in metres.
+
+	Accepts scalars or NumPy arrays.
+	The projection is conformal, so distances are locally proportional to those on the ground
+	(scaled by the secant of the latitude).
+
+	:param lat: Latitude(s), in degrees.
+	:param lng: Longitude(s), in degrees.
+	"""
+
+	x = WEB_MERCATOR_RADIUS * numpy.radians(lng)
+	y = WEB_MERCATOR_RADIUS * numpy.log(numpy.tan(numpy.pi / 4 + numpy.radians(lat) / 2))
+	return x, y
+
+
+def from_web_mercator(x: _F, y: _F) -> tuple[_F, _F]:
+	"""
+	Inverse of :func:`~.to_web_mercator`, returning ``(lat, lng)`` in degrees.
+
+	:param x: Easting(s), in metres.
+	:param y: Northing(s), in metres.
+	"""
+
+	lat = numpy.degrees(2 * numpy.arctan(numpy.exp(y / WEB_MERCATOR_RADIUS)) - numpy.pi / 2)
+	lng = numpy.degrees(x / WEB_MERCATOR_RADIUS)
+	return lat, lng
+
+
+def _geojson_to_web_mercator(coordinates: numpy.ndarray) -> numpy.ndarray:
+	# Project ``(N, 2)`` GeoJSON longitude/latitude pairs to Web Mercator, for use with shapely.transform.
+
+	return numpy.column_stack(to_web_mercator(coordinates[:, 1], coordinates[:, 0]))
+
+
+def _web_mercator_to_geojson(coordinates: numpy.ndarray) -> numpy.ndarray:
+	# Inverse of _geojson_to_web_mercator.
+
+	lat, lng = from_web_mercator(coordinates[:, 0], coordinates[:, 1])
+	return numpy.column_stack([lng, lat])
+
+
+def encode_polyline(latitudes: numpy.ndarray, longitudes: numpy.ndarray, precision: int = 5) -> str:
+	"""
+	Encode coordinates in Google's `encoded polyline format`_.
+
+	.. _encoded polyline format: https://developers.google.com/maps/documentation/utilities/polylinealgorithm
+
+	:param latitudes: Latitudes, in degrees.
+	:param longitudes: Longitudes, in degrees.
+	:param precision: The number of decimal places to retain.
+	"""
+
+	# Interleave the rounded coordinates, and take the difference from the previous point.
+	values = numpy.empty(len(latitudes) * 2, dtype=numpy.int64)
+	values[0::2] = numpy.round(numpy.asarray(latitudes) * 10**precision)
+	values[1::2] = numpy.round(numpy.asarray(longitudes) * 10**precision)
+	values[2:] -= values[:-2].copy()
+
+	# Zig-zag encode signs into the lowest bit, then split into 5-bit chunks (least significant first).
+	values = (values << 1) ^ (values >> 63)
+	shifts = numpy.arange(7) * 5
+	chunks = (values[:, None] >> shifts) & 0x1f
+	num_chunks = 1 + numpy.count_nonzero((values[:, None] >> shifts[1:]) > 0, axis=1)
+
+	# Every chunk except the last of each value has the continuation bit set.
+	chunks[numpy.arange(7) < (num_chunks - 1)[:, None]] |= 0x20
+	used = numpy.arange(7) < num_chunks[:, None]
+
+	return (chunks[used] + 63).astype(numpy.uint8).tobytes().decode("ascii")
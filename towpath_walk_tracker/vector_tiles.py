@@ -0,0 +1,235 @@
+#!/usr/bin/env python3
+#
+#  vector_tiles.py
+"""
+`Mapbox Vector Tiles`_ of the watercourses, for drawing the network a tile at a time.
+
+.. _Mapbox Vector Tiles: https://github.com/mapbox/vector-tile-spec
+"""
+#
+#  Copyright © 2025 Dominic Davis-Foster <dominic@davis-foster.co.uk>
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to deal
+#  in the Software without restriction, including without limitation the rights
+#  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#  copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in all
+#  copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+#  EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+#  MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+#  IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM,
+#  DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR
+#  OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE
+#  OR OTHER DEALINGS IN THE SOFTWARE.
+#
+
+# stdlib
+import math
+from collections.abc import Iterable
+from functools import lru_cache
+from typing import Any
+
+# 3rd party
+import mapbox_vector_tile  # type: ignore[import-untyped]
+import numpy
+import shapely
+from domdf_python_tools.typing import PathLike
+from shapely import STRtree
+
+# this package
+from towpath_walk_tracker.pyramid import ZOOM_BANDS
+from towpath_walk_tracker.tiles import TileStore
+from towpath_walk_tracker.util import (
+		WEB_MERCATOR_RADIUS,
+		_geojson_to_web_mercator,
+		_get_source_hash,
+		_iter_filtered_watercourses
+		)
+
+__all__ = [
+		"EXTENT",
+		"LAYER_NAME",
+		"MAX_TILE_ZOOM",
+		"MVT_MIMETYPE",
+		"WatercourseTileIndex",
+		"get_watercourse_tile_index",
+		"get_watercourse_tile_store",
+		"tile_bounds",
+		]
+
+#: Media type for Mapbox Vector Tiles.
+MVT_MIMETYPE = "application/vnd.mapbox-vector-tile"
+
+#: The name of the layer containing the watercourses in each tile.
+LAYER_NAME = "watercourses"
+
+#: The width and height of each tile in the units of its encoded geometry.
+EXTENT = 4096
+
+#: Features are clipped this far (in tile units) beyond the edge of the tile, so lines join up across tiles.
+BUFFER = 64
+
+#: The highest zoom level tiles are rendered at, the start of the pyramid's full resolution band.
+#: Clients scale up the tiles from this level when zoomed in further.
+MAX_TILE_ZOOM: int = ZOOM_BANDS[-1].min_zoom
+
+#: Incremented whenever :meth:`WatercourseTileIndex.render` changes its output, so cached tiles are discarded.
+TILE_VERSION = 1
+
+
+def tile_bounds(z: int, x: int, y: int) -> tuple[float, float, float, float]:
+	"""
+	Returns the bounds of the given tile in Web Mercator, as ``(min_x, min_y, max_x, max_y)``.
+
+	:param z: Zoom level.
+	:param x: Tile column.
+	:param y: Tile row (counting from the north, as in the tile URL).
+	"""
+
+	half_world = math.pi * WEB_MERCATOR_RADIUS
+	size = 2 * half_world / (1 << z)
+	min_x = -half_world + x * size
+	max_y = half_world - y * size
+	return min_x, max_y - size, min_x + size, max_y
+
+
+class WatercourseTileIndex:
+	"""
+	Spatial index over the watercourses, for clipping them to tiles.
+
+	:param geometries: The geometry of each watercourse, in Web Mercator.
+	:param ids: The OpenStreetMap ID of each watercourse, aligned with ``geometries``.
+	"""
+
+	__slots__ = ("geometries", "ids", "tree", "bounds")
+
+	geometries: numpy.ndarray
+	ids: numpy.ndarray
+	tree: STRtree
+
+	#: The bounds of all the watercourses in Web Mercator, as ``(min_x, min_y, max_x, max_y)``.
+	bounds: tuple[float, float, float, float]
+
+	def __init__(self, geometries: numpy.ndarray, ids: numpy.ndarray):
+		self.geometries = geometries
+		self.ids = ids
+		self.tree = STRtree(geometries)
+		self.bounds = tuple(shapely.total_bounds(geometries).tolist())
+
+	def __len__(self) -> int:
+		return len(self.geometries)
+
+	def __repr__(self) -> str:
+		return f"<{type(self).__name__}({len(self)} watercourses)>"
+
+	@classmethod
+	def from_features(cls, features: Iterable[dict[str, Any]]) -> "WatercourseTileIndex":
+		"""
+		Construct a :class:`~.WatercourseTileIndex` from GeoJSON features.
+
+		:param features: May be a generator, as only the geometry and ID of each feature are kept.
+		"""
+
+		geometries, ids = [], []
+		for feature in features:
+			geometries.append(shapely.geometry.shape(feature["geometry"]))
+			ids.append(feature["properties"]["id"])
+
+		projected = shapely.transform(numpy.array(geometries, dtype=object), _geojson_to_web_mercator)
+		return cls(projected, numpy.array(ids, dtype=numpy.int64))
+
+	def covers(self, z: int, x: int, y: int) -> bool:
+		"""
+		Returns whether the given tile is within the zoom levels tiles are rendered at, and overlaps the watercourses.
+
+		:param z: Zoom level.
+		:param x: Tile column.
+		:param y: Tile row (counting from the north, as in the tile URL).
+		"""
+
+		if not (0 <= z <= MAX_TILE_ZOOM and 0 <= x < 2**z and 0 <= y < 2**z):
+			return False
+
+		min_x, min_y, max_x, max_y = tile_bounds(z, x, y)
+		buffer = BUFFER * (max_x - min_x) / EXTENT
+		data_min_x, data_min_y, data_max_x, data_max_y = self.bounds
+
+		return (
+				min_x - buffer <= data_max_x and data_min_x <= max_x + buffer and min_y - buffer <= data_max_y
+				and data_min_y <= max_y + buffer
+				)
+
+	def render(self, z: int, x: int, y: int) -> bytes:
+		"""
+		Returns the encoded vector tile at the given position.
+
+		Each watercourse in the tile is included with its ID, and its geometry simplified to the tile's resolution.
+
+		:param z: Zoom level.
+		:param x: Tile column.
+		:param y: Tile row (counting from the north, as in the tile URL).
+		"""
+
+		bounds = tile_bounds(z, x, y)
+		resolution = (bounds[2] - bounds[0]) / EXTENT
+		buffer = BUFFER * resolution
+		clip_bounds = (bounds[0] - buffer, bounds[1] - buffer, bounds[2] + buffer, bounds[3] + buffer)
+
+		candidates = self.tree.query(shapely.box(*clip_bounds))
+		candidates.sort()
+		clipped = shapely.clip_by_rect(self.geometries[candidates], *clip_bounds)
+		clipped = shapely.simplify(clipped, resolution)
+		keep = ~shapely.is_empty(clipped)
+
+		features = [{
+				"geometry": geometry,
+				"properties": {"id": int(feature_id)},
+				} for geometry, feature_id in zip(clipped[keep], self.ids[candidates[keep]])]
+
+		# Tiles without any watercourses are left empty, rather than containing an empty layer.
+		return mapbox_vector_tile.encode(
+				[{"name": LAYER_NAME, "features": features}] if features else [],
+				default_options={
+						"quantize_bounds": bounds,
+						"extents": EXTENT,
+						"on_invalid_geometry": mapbox_vector_tile.encoder.on_invalid_geometry_make_valid,
+						},
+				)
+
+
+@lru_cache
+def get_watercourse_tile_index() -> WatercourseTileIndex:
+	"""
+	Returns the :class:`~.WatercourseTileIndex` for the filtered watercourses data.
+	"""
+
+	return WatercourseTileIndex.from_features(_iter_filtered_watercourses())
+
+
+@lru_cache
+def get_watercourse_tile_store(filename: PathLike = "cache/watercourses.mbtiles") -> TileStore:
+	"""
+	Returns the :class:`~.TileStore` caching rendered watercourse tiles.
+
+	Any tiles rendered from a previous version of the filtered watercourses data are discarded.
+
+	:param filename:
+	"""
+
+	version = f"{TILE_VERSION}:{_get_source_hash()}"
+	store = TileStore(
+			filename,
+			download=False,
+			metadata={"name": "Watercourses", "format": "pbf", "type": "overlay", "version": version},
+			)
+
+	if store.get_metadata().get("version") != version:
+		store.clear()
+		store.set_metadata("version", version)
+
+	return store
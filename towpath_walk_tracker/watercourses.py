@@ -27,14 +27,25 @@ Data about watercourses.
 #
 
 # stdlib
-from collections.abc import Collection
+import json
+from collections.abc import Collection, Iterable, Iterator
 from typing import Any, Literal, TypedDict
 
 # 3rd party
+import ijson  # type: ignore[import-untyped]
 import osm2geojson  # type: ignore[import-untyped]
 import requests
+from domdf_python_tools.typing import PathLike
 
-__all__ = ["FeatureCollection", "filter_watercourses", "query_overpass"]
+__all__ = [
+		"FeatureCollection",
+		"filter_watercourses",
+		"iter_features",
+		"iter_filtered_watercourses",
+		"query_overpass",
+		"slim_features",
+		"write_feature_collection",
+		]
 
 # yapf: disable
 # Tags to exclude from tooltip display
@@ -361,23 +372,55 @@ class FeatureCollection(TypedDict):
 	features: list[Any]  # TODO: type
 
 
-def filter_watercourses(
-		data: dict[str, Any],
+def iter_features(filename: PathLike) -> Iterator[dict[str, Any]]:
+	"""
+	Incrementally parse the features of the GeoJSON feature collection in the given file.
+
+	Only one feature is held in memory at a time, regardless of the size of the file.
+
+	:param filename:
+	"""
+
+	with open(filename, "rb") as fp:
+		yield from ijson.items(fp, "features.item", use_float=True)
+
+
+def write_feature_collection(features: Iterable[dict[str, Any]], filename: PathLike) -> None:
+	"""
+	Write the given features to a file as a GeoJSON feature collection, one feature per line.
+
+	The features may be a generator, such as from :func:`~.iter_features`, and are written as they are produced.
+
+	:param features:
+	:param filename:
+	"""
+
+	with open(filename, 'w', encoding="UTF-8") as fp:
+		fp.write('{"type": "FeatureCollection", "features": [\n')
+
+		for idx, feature in enumerate(features):
+			if idx:
+				fp.write(",\n")
+			json.dump(feature, fp)
+
+		fp.write("\n]}\n")
+
+
+def iter_filtered_watercourses(
+		features: Iterable[dict[str, Any]],
 		*,
 		tags_to_exclude: Collection[str] = (),
 		ids_to_exclude: Collection[int] = (),
-		) -> FeatureCollection:
+		) -> Iterator[dict[str, Any]]:
 	"""
-	Filter watercourses in the given GeoJSON data for map display.
+	Filter watercourses in the given GeoJSON features for map display, one feature at a time.
 
-	:param data:
+	:param features:
 	:param tags_to_exclude: Don't include these tags in the tooltip when hovering over a watercourse.
 	:param ids_to_exclude: Don't include these ids in the tooltip when hovering over a watercourse.
 	"""
 
-	filtered_data: FeatureCollection = {"type": "FeatureCollection", "features": []}
-
-	for feature in data["features"]:
+	for feature in features:
 		if feature["geometry"]["type"] == "Point":
 			continue
 
@@ -399,6 +442,46 @@ def filter_watercourses(
 			feature["properties"]["tags"] = tags
 			# feature["properties"] = {"id": feature["properties"]["id"], "tags": tags, "type": feature["properties"]["type"], "nodes": feature["properties"]["nodes"]}
 
-		filtered_data["features"].append(feature)
+		yield feature
+
+
+def slim_features(features: Iterable[dict[str, Any]]) -> Iterator[dict[str, Any]]:
+	"""
+	Strip the given GeoJSON features down to their geometry and ID, one feature at a time.
+
+	The remaining properties can be looked up by ID when needed, such as for tooltips.
+
+	:param features:
+	"""
+
+	for feature in features:
+		feature_id = feature["properties"]["id"]
+		yield {
+				"type": "Feature",
+				"id": feature_id,
+				"geometry": feature["geometry"],
+				"properties": {"id": feature_id},
+				}
+
+
+def filter_watercourses(
+		data: dict[str, Any],
+		*,
+		tags_to_exclude: Collection[str] = (),
+		ids_to_exclude: Collection[int] = (),
+		) -> FeatureCollection:
+	"""
+	Filter watercourses in the given GeoJSON data for map display.
+
+	:param data:
+	:param tags_to_exclude: Don't include these tags in the tooltip when hovering over a watercourse.
+	:param ids_to_exclude: Don't include these ids in the tooltip when hovering over a watercourse.
+	"""
+
+	features = iter_filtered_watercourses(
+			data["features"],
+			tags_to_exclude=tags_to_exclude,
+			ids_to_exclude=ids_to_exclude,
+			)
 
-	return filtered_data
+	return {"type": "FeatureCollection", "features": list(features)}